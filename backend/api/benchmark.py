@@ -0,0 +1,347 @@
+import itertools
+import json
+import platform
+import statistics
+import time
+import tracemalloc
+from collections import namedtuple
+from contextlib import contextmanager
+
+from django.core.cache import cache
+from django.core.signals import request_finished, request_started
+from django.db import close_old_connections, connection
+from django.test import Client, RequestFactory
+from django.test.utils import CaptureQueriesContext, override_settings
+from recipes import catalog
+from recipes.models import Ingredient, Recipe, ShopList, Tag
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from user.models import User
+
+from . import renderers
+from .serializers import (IngredientSerializer, RecipeReadSerializer,
+                          ShortRecipeSerializer, TagSerializer)
+
+Scenario = namedtuple('Scenario', ('name', 'url', 'authenticated'))
+
+RECIPE_FILTERS = ('tags', 'author', 'is_favorited', 'is_in_shopping_cart')
+
+# Допустимый рост метрики относительно базовой линии
+METRICS = {
+    'p50_ms': 'latency',
+    'p95_ms': 'latency',
+    'queries': 'queries',
+    'allocated_kb': 'allocations',
+}
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    index = min(len(values) - 1, round(percent / 100 * (len(values) - 1)))
+    return values[index]
+
+
+def get_bench_user():
+    """Пользователь набора с непустыми избранным, покупками и подписками"""
+    return (
+        User.objects.filter(username__startswith='bench_',
+                            shop_list__isnull=False,
+                            follower__isnull=False)
+        .order_by('id').first()
+        or User.objects.filter(shop_list__isnull=False).order_by('id').first()
+        or User.objects.order_by('id').first()
+    )
+
+
+def recipe_filter_urls(tag, author):
+    """Лента рецептов со всеми сочетаниями фильтров"""
+    values = {
+        'tags': f'tags={tag.slug}',
+        'author': f'author={author}',
+        'is_favorited': 'is_favorited=1',
+        'is_in_shopping_cart': 'is_in_shopping_cart=1',
+    }
+    for size in range(1, len(RECIPE_FILTERS) + 1):
+        for names in itertools.combinations(RECIPE_FILTERS, size):
+            yield (
+                'recipes?' + '&'.join(names),
+                '/api/recipes/?' + '&'.join(values[name] for name in names)
+            )
+
+
+def get_scenarios():
+    """Сценарии для всех маршрутов api/urls.py на текущих данных"""
+    user = get_bench_user()
+    recipe = Recipe.objects.order_by('-id').first()
+    tag = Tag.objects.order_by('id').first()
+    ingredient = Ingredient.objects.order_by('id').first()
+    if None in (user, recipe, tag, ingredient):
+        return []
+    author = recipe.author_id
+    carted = ShopList.objects.filter(user=user).first()
+    scenarios = [
+        Scenario('recipes', '/api/recipes/', False),
+        Scenario('recipes auth', '/api/recipes/', True),
+        Scenario('recipes card', '/api/recipes/?profile=card', True),
+        Scenario('recipes cursor', '/api/recipes/?pagination=cursor', True),
+        Scenario('recipes search',
+                 f'/api/recipes/?search={recipe.name.split()[0]}', True),
+        *(Scenario(name, url, True)
+          for name, url in recipe_filter_urls(tag, author)),
+        Scenario('recipes recommended', '/api/recipes/recommended/', True),
+        Scenario('recipes feed', '/api/recipes/feed/', True),
+        Scenario('recipe detail', f'/api/recipes/{recipe.pk}/', False),
+        Scenario('recipe detail auth', f'/api/recipes/{recipe.pk}/', True),
+        Scenario('shopping cart summary', '/api/recipes/shopping_cart/',
+                 True),
+        *(Scenario(f'download_shopping_cart {format}',
+                   f'/api/recipes/download_shopping_cart/?format={format}',
+                   True)
+          for format in ('txt', 'csv', 'json')),
+        Scenario('users', '/api/users/', True),
+        Scenario('user detail', f'/api/users/{author}/', True),
+        Scenario('users me', '/api/users/me/', True),
+        Scenario('subscriptions', '/api/users/subscriptions/', True),
+        Scenario('subscriptions recipes_limit',
+                 '/api/users/subscriptions/?recipes_limit=3', True),
+        Scenario('tags', '/api/tags/', False),
+        Scenario('tag detail', f'/api/tags/{tag.pk}/', False),
+        Scenario('ingredients', '/api/ingredients/', False),
+        Scenario('ingredient search',
+                 f'/api/ingredients/?name={ingredient.name[:2]}', False),
+        Scenario('ingredient detail', f'/api/ingredients/{ingredient.pk}/',
+                 False),
+        Scenario('ingredient bundle', '/api/ingredients/bundle/'
+                 f'{catalog.get_bundle().version}/', False),
+    ]
+    if carted is None:
+        scenarios = [
+            scenario for scenario in scenarios
+            if 'shopping' not in scenario.name
+        ]
+    return scenarios
+
+
+def get_clients():
+    user = get_bench_user()
+    token, _ = Token.objects.get_or_create(user=user)
+    return {
+        False: Client(),
+        True: Client(HTTP_AUTHORIZATION=f'Token {token.key}'),
+    }
+
+
+def request(client, url, cold):
+    if cold:
+        cache.clear()
+    response = client.get(url)
+    if getattr(response, 'streaming', False):
+        b''.join(response.streaming_content)
+    else:
+        response.content
+    return response
+
+
+def measure(client, scenario, iterations, warmup, cold=False):
+    """
+    Задержки, количество запросов к БД и объём выделенной памяти
+    для сценария. Память измеряется отдельным проходом, чтобы
+    tracemalloc не искажал время
+    """
+    for _ in range(warmup):
+        request(client, scenario.url, cold)
+    timings = []
+    queries = []
+    status = None
+    for _ in range(iterations):
+        with CaptureQueriesContext(connection) as context:
+            start = time.perf_counter()
+            status = request(client, scenario.url, cold).status_code
+            timings.append((time.perf_counter() - start) * 1000)
+        queries.append(len(context.captured_queries))
+    tracemalloc.start()
+    request(client, scenario.url, cold)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        'status': status,
+        'p50_ms': round(percentile(timings, 50), 3),
+        'p95_ms': round(percentile(timings, 95), 3),
+        'p99_ms': round(percentile(timings, 99), 3),
+        'mean_ms': round(statistics.mean(timings), 3),
+        'queries': max(queries),
+        'allocated_kb': round(peak / 1024, 1),
+    }
+
+
+def get_serialization_cases(size):
+    """Объекты для сериализаторов горячих эндпоинтов, уже из БД"""
+    recipes = list(
+        Recipe.objects.with_related().defer('search_vector')
+        .order_by('-id')[:size]
+    )
+    return [
+        ('RecipeReadSerializer', RecipeReadSerializer, recipes),
+        ('ShortRecipeSerializer', ShortRecipeSerializer, recipes),
+        ('TagSerializer', TagSerializer, list(Tag.objects.all())),
+        ('IngredientSerializer', IngredientSerializer,
+         list(Ingredient.objects.order_by('id')[:size * 10])),
+    ]
+
+
+def serialize(serializer_class, objects, renderer, context):
+    return renderer.render(
+        serializer_class(objects, many=True, context=context).data
+    )
+
+
+def measure_serialization(size, iterations):
+    """
+    Время сериализации и рендеринга списков объектов стандартным
+    путём DRF (to_representation полей и JSONRenderer) и быстрым
+    (собранные функции и FastJSONRenderer) и совпадение их байтов
+    """
+    request = RequestFactory().get('/api/recipes/')
+    request.user = get_bench_user()
+    context = {'request': request}
+    fast = renderers.FastJSONRenderer()
+    results = {}
+    for name, serializer_class, objects in get_serialization_cases(size):
+        # Состояние пользователя загружается до замеров
+        serialize(serializer_class, objects, fast, context)
+        timings = {}
+        content = {}
+        for mode, compiled, renderer in (
+            ('standard', False, JSONRenderer()),
+            ('fast', True, fast),
+        ):
+            with override_settings(COMPILED_SERIALIZERS=compiled):
+                start = time.perf_counter()
+                for _ in range(iterations):
+                    content[mode] = serialize(serializer_class, objects,
+                                              renderer, context)
+                timings[mode] = (
+                    (time.perf_counter() - start) * 1000 / iterations
+                )
+        results[name] = {
+            'objects': len(objects),
+            'standard_ms': round(timings['standard'], 3),
+            'fast_ms': round(timings['fast'], 3),
+            'speedup': round(timings['standard'] / timings['fast'], 2),
+            'identical': content['standard'] == content['fast'],
+        }
+    return results
+
+
+# Настройки соединения с БД для сравнения задержек: новое
+# соединение на каждый запрос, постоянное в потоке и из пула
+CONNECTION_MODES = {
+    'new': {'CONN_MAX_AGE': 0, 'POOL': None},
+    'persistent': {'CONN_MAX_AGE': 60, 'POOL': None},
+    'pool': {
+        'CONN_MAX_AGE': 0,
+        'POOL': {'MAX_SIZE': 4, 'TIMEOUT': 10, 'MAX_LIFETIME': 3600},
+    },
+}
+
+
+def get_connection_modes():
+    """Режимы, которые поддерживает бэкенд БД (пул — только свой)"""
+    if hasattr(connection, 'get_pool'):
+        return CONNECTION_MODES
+    return {
+        name: options for name, options in CONNECTION_MODES.items()
+        if options['POOL'] is None
+    }
+
+
+def close_connections(**kwargs):
+    # Тестовый клиент отключает close_old_connections на время
+    # запроса, а WSGI-сервер вызывает его в начале и в конце
+    close_old_connections()
+
+
+@contextmanager
+def connection_mode(options):
+    """
+    Настройки соединения default на время замеров; соединения
+    закрываются и возвращаются в пул так же, как под сервером
+    """
+    settings_dict = connection.settings_dict
+    saved = {name: settings_dict.get(name) for name in options}
+    connection.close()
+    settings_dict.update(options)
+    request_started.connect(close_connections)
+    request_finished.connect(close_connections)
+    try:
+        yield
+    finally:
+        request_started.disconnect(close_connections)
+        request_finished.disconnect(close_connections)
+        connection.close()
+        settings_dict.update(saved)
+
+
+EXPLAIN = {
+    'sqlite': 'EXPLAIN QUERY PLAN ',
+    'postgresql': 'EXPLAIN ',
+}
+
+
+def explain(client, scenario):
+    """План самого долгого SQL-запроса сценария при пустом кэше"""
+    prefix = EXPLAIN.get(connection.vendor)
+    with CaptureQueriesContext(connection) as context:
+        request(client, scenario.url, cold=True)
+    if prefix is None or not context.captured_queries:
+        return []
+    sql = max(context.captured_queries,
+              key=lambda query: float(query['time']))['sql']
+    with connection.cursor() as cursor:
+        cursor.execute(prefix + sql)
+        return [
+            ' '.join(str(column) for column in row)
+            for row in cursor.fetchall()
+        ]
+
+
+def get_environment():
+    return {
+        'vendor': connection.vendor,
+        'python': platform.python_version(),
+        'recipes': Recipe.objects.count(),
+        'users': User.objects.count(),
+    }
+
+
+def find_regressions(results, baseline, thresholds):
+    """
+    Метрики, выросшие относительно базовой линии больше порога.
+    Количество запросов сравнивается без допуска
+    """
+    regressions = []
+    for name, result in results.items():
+        previous = baseline.get('results', {}).get(name)
+        if previous is None:
+            continue
+        for metric, kind in METRICS.items():
+            old, new = previous.get(metric), result.get(metric)
+            if old is None or new is None:
+                continue
+            limit = old if kind == 'queries' else old * (
+                1 + thresholds[kind]
+            )
+            if new > limit:
+                regressions.append(f'{name}: {metric} {old} -> {new}')
+    return regressions
+
+
+def save(path, results):
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump({'environment': get_environment(), 'results': results},
+                  file, ensure_ascii=False, indent=2, sort_keys=True)
+
+
+def load(path):
+    with open(path, encoding='utf-8') as file:
+        return json.load(file)
@@ -0,0 +1,146 @@
+from operator import attrgetter
+
+from django.db import models
+from rest_framework import fields, serializers
+from rest_framework.relations import PKOnlyObject
+
+SKIP = object()
+
+# Преобразования, которые to_representation поля делает со значением
+CONVERTERS = {
+    fields.ReadOnlyField.to_representation: None,
+    fields.IntegerField.to_representation: int,
+    fields.CharField.to_representation: str,
+}
+
+
+def get_columns(serializer):
+    """Имена атрибутов конкретных полей модели сериализатора"""
+    model = getattr(getattr(serializer, 'Meta', None), 'model', None)
+    if model is None:
+        return set()
+    return {
+        name for field in model._meta.concrete_fields
+        for name in (field.name, field.attname)
+        if not field.is_relation or name == field.attname
+    }
+
+
+def get_representation(serializer):
+    """
+    Функция представления вложенного сериализатора: собранная, если
+    он не переопределяет to_representation, иначе его собственная
+    """
+    represent = getattr(serializer, 'represent', None)
+    if represent is not None:
+        return represent
+    if type(serializer).to_representation is not (
+        serializers.Serializer.to_representation
+    ):
+        return serializer.to_representation
+    return compile_representation(serializer)
+
+
+def get_default_accessor(field):
+    """Значение поля так же, как его получает Serializer"""
+    def accessor(instance):
+        try:
+            attribute = field.get_attribute(instance)
+        except fields.SkipField:
+            return SKIP
+        check_for_none = (
+            attribute.pk if isinstance(attribute, PKOnlyObject)
+            else attribute
+        )
+        if check_for_none is None:
+            return None
+        return field.to_representation(attribute)
+    return accessor
+
+
+def get_list_accessor(field):
+    represent = get_representation(field.child)
+    get_attribute = field.get_attribute
+
+    def accessor(instance):
+        try:
+            items = get_attribute(instance)
+        except fields.SkipField:
+            return SKIP
+        if items is None:
+            return None
+        if isinstance(items, models.Manager):
+            items = items.all()
+        return [represent(item) for item in items]
+    return accessor
+
+
+def get_nested_accessor(field):
+    represent = get_representation(field)
+    get_attribute = field.get_attribute
+
+    def accessor(instance):
+        try:
+            value = get_attribute(instance)
+        except fields.SkipField:
+            return SKIP
+        return None if value is None else represent(value)
+    return accessor
+
+
+def get_column_accessor(field, convert):
+    getter = attrgetter(field.source)
+    default = get_default_accessor(field)
+
+    def accessor(instance):
+        try:
+            value = getter(instance)
+        except AttributeError:
+            # Например, словарь вместо объекта модели
+            return default(instance)
+        if value is None or convert is None:
+            return value
+        return convert(value)
+    return accessor
+
+
+def get_accessor(serializer, field, columns):
+    method = type(field).to_representation
+    if method is serializers.SerializerMethodField.to_representation:
+        return getattr(serializer, field.method_name)
+    if method is serializers.ListSerializer.to_representation:
+        return get_list_accessor(field)
+    if isinstance(field, serializers.Serializer):
+        return get_nested_accessor(field)
+    if (
+        len(field.source_attrs) == 1 and field.source in columns
+        and method in CONVERTERS
+    ):
+        return get_column_accessor(field, CONVERTERS[method])
+    return get_default_accessor(field)
+
+
+def compile_representation(serializer):
+    """
+    Функция instance -> dict с тем же результатом, что
+    Serializer.to_representation. Способ получения каждого поля
+    выбирается один раз: колонки модели читаются attrgetter'ом
+    с преобразованием типа, методы сериализатора вызываются
+    напрямую, вложенные сериализаторы собираются так же, а
+    остальные поля проходят обычные get_attribute и
+    to_representation
+    """
+    columns = get_columns(serializer)
+    accessors = tuple(
+        (field.field_name, get_accessor(serializer, field, columns))
+        for field in serializer._readable_fields
+    )
+
+    def represent(instance):
+        ret = {}
+        for name, accessor in accessors:
+            value = accessor(instance)
+            if value is not SKIP:
+                ret[name] = value
+        return ret
+    return represent
@@ -0,0 +1,148 @@
+import csv
+import io
+import json
+import os
+from abc import ABC, abstractmethod
+
+from django.conf import settings
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+
+TITLE = 'Список покупок: '
+PDF_FONT_NAME = 'ShoppingCartFont'
+PDF_FONT_SIZE = 12
+PDF_MARGIN = 50
+PDF_LINE_HEIGHT = 18
+
+
+class BaseExporter(ABC):
+    """
+    Базовый класс выгрузки списка покупок. Принимает итератор
+    строк (название, количество, единица измерения) и построчно
+    отдаёт содержимое файла, не собирая его целиком в памяти
+    """
+
+    format = None
+    content_type = None
+    extension = None
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    @abstractmethod
+    def __iter__(self):
+        """Части содержимого файла"""
+
+    @property
+    def filename(self):
+        return f'shopping_list.{self.extension}'
+
+
+class TextExporter(BaseExporter):
+    """Выгрузка в текстовый файл"""
+
+    format = 'txt'
+    content_type = 'text/plain; charset=utf-8'
+    extension = 'txt'
+
+    def __iter__(self):
+        yield TITLE + '\n\n'
+        separator = ''
+        for row in self.rows:
+            yield separator + '{} - {} {}.'.format(*row)
+            separator = '\n'
+
+
+class Echo:
+    """Псевдобуфер для csv.writer, возвращающий записанную строку"""
+
+    def write(self, value):
+        return value
+
+
+class CsvExporter(BaseExporter):
+    """Выгрузка в csv"""
+
+    format = 'csv'
+    content_type = 'text/csv; charset=utf-8'
+    extension = 'csv'
+
+    def __iter__(self):
+        writer = csv.writer(Echo())
+        yield writer.writerow(
+            ('Ингредиент', 'Количество', 'Единица измерения')
+        )
+        for row in self.rows:
+            yield writer.writerow(row)
+
+
+class JsonExporter(BaseExporter):
+    """Выгрузка в json"""
+
+    format = 'json'
+    content_type = 'application/json'
+    extension = 'json'
+
+    def __iter__(self):
+        yield '['
+        separator = ''
+        for name, amount, measurement_unit in self.rows:
+            yield separator + json.dumps(
+                {
+                    'name': name,
+                    'amount': amount,
+                    'measurement_unit': measurement_unit
+                },
+                ensure_ascii=False
+            )
+            separator = ','
+        yield ']'
+
+
+class PdfExporter(BaseExporter):
+    """
+    Выгрузка в pdf. Документ формируется постранично, но reportlab
+    записывает его только целиком, поэтому файл отдаётся одним блоком
+    """
+
+    format = 'pdf'
+    content_type = 'application/pdf'
+    extension = 'pdf'
+
+    @staticmethod
+    def get_font():
+        if PDF_FONT_NAME in pdfmetrics.getRegisteredFontNames():
+            return PDF_FONT_NAME
+        if not os.path.exists(settings.SHOPPING_CART_PDF_FONT):
+            return 'Helvetica'
+        pdfmetrics.registerFont(
+            TTFont(PDF_FONT_NAME, settings.SHOPPING_CART_PDF_FONT)
+        )
+        return PDF_FONT_NAME
+
+    def __iter__(self):
+        buffer = io.BytesIO()
+        font = self.get_font()
+        pdf = canvas.Canvas(buffer, pagesize=A4)
+        width, height = A4
+        pdf.setFont(font, PDF_FONT_SIZE)
+        position = height - PDF_MARGIN
+        pdf.drawString(PDF_MARGIN, position, TITLE)
+        position -= PDF_LINE_HEIGHT * 2
+        for row in self.rows:
+            if position < PDF_MARGIN:
+                pdf.showPage()
+                pdf.setFont(font, PDF_FONT_SIZE)
+                position = height - PDF_MARGIN
+            pdf.drawString(PDF_MARGIN, position, '{} - {} {}.'.format(*row))
+            position -= PDF_LINE_HEIGHT
+        pdf.save()
+        yield buffer.getvalue()
+
+
+EXPORTERS = {
+    exporter.format: exporter
+    for exporter in (TextExporter, CsvExporter, JsonExporter, PdfExporter)
+}
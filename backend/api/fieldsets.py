@@ -0,0 +1,92 @@
+from collections import namedtuple
+
+from rest_framework import serializers
+
+
+class Fieldset(namedtuple('Fieldset', ('fields', 'expand'))):
+    """
+    Выбранные поля ответа: fields — дерево имён полей или None
+    для всех полей, expand — связи, выводимые целиком, или None,
+    если целиком выводятся все связи
+    """
+
+    __slots__ = ()
+
+    def includes(self, name):
+        return self.fields is None or name in self.fields
+
+    def expands(self, name):
+        return (
+            self.expand is None or name in self.expand
+            or bool(self.fields and self.fields.get(name))
+        )
+
+    def nested(self, name):
+        """Выбор полей вложенного сериализатора"""
+        return Fieldset(self.fields.get(name) or None, None)
+
+
+FULL = Fieldset(None, None)
+
+
+def parse(value):
+    """
+    Дерево полей из списка через запятую с вложенностью через
+    точку: 'id,author.username' -> {'id': {}, 'author': {'username': {}}}
+    """
+    tree = {}
+    for path in value.split(','):
+        node = tree
+        for name in path.strip().split('.'):
+            if name:
+                node = node.setdefault(name, {})
+    return tree
+
+
+def check(tree, fields, param):
+    unknown = set(tree) - set(fields)
+    if unknown:
+        raise serializers.ValidationError(
+            {param: 'Неизвестные поля: ' + ', '.join(sorted(unknown))}
+        )
+    for name, subtree in tree.items():
+        if not subtree:
+            continue
+        if not isinstance(fields[name], serializers.Serializer):
+            raise serializers.ValidationError(
+                {param: f'У поля {name} нет вложенных полей'}
+            )
+        check(subtree, fields[name].fields, param)
+
+
+def get_fieldset(request, serializer_class):
+    """
+    Выбор полей из параметров fields, expand и profile. Профиль
+    задаёт значения fields и expand по умолчанию; без параметров
+    выводятся все поля
+    """
+    params = request.query_params
+    fields, expand = params.get('fields'), params.get('expand')
+    profile = params.get('profile')
+    if profile is not None:
+        profiles = serializer_class.profiles
+        if profile not in profiles:
+            raise serializers.ValidationError(
+                {'profile': 'Доступные профили: ' + ', '.join(profiles)}
+            )
+        fields = fields or profiles[profile][0]
+        expand = expand or profiles[profile][1]
+    if fields is None and expand is None:
+        return FULL
+    tree = parse(fields) if fields else None
+    if tree is not None:
+        check(tree, serializer_class(context={'request': request}).fields,
+              'fields')
+    expanded = set(parse(expand)) if expand else set()
+    unknown = expanded - set(serializer_class.expandable)
+    if unknown:
+        raise serializers.ValidationError(
+            {'expand': 'Раскрываются только поля: '
+             + ', '.join(serializer_class.expandable)}
+        )
+    return Fieldset(tree, expanded)
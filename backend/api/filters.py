@@ -1,5 +1,7 @@
 from django_filters.rest_framework import FilterSet, filters
-from recipes.models import Ingredient, Recipe, Tag
+from recipes import reference, search
+from recipes.models import Favourites, Ingredient, Recipe, ShopList
+from rest_framework.filters import SearchFilter
 
 
 class IngredientFilter(FilterSet):
@@ -16,13 +18,19 @@ class IngredientFilter(FilterSet):
         fields = ('name',)
 
 
+def get_tag_choices():
+    return [(slug, name) for _, name, _, slug in reference.tags().rows]
+
+
 class RecipesFilter(FilterSet):
-    """Фильтрация по: тегам, в избранном, в списке покупок"""
+    """Фильтрация по: тегам, в избранном, в списке покупок.
+    Каждый фильтр добавляет подзапрос IN по индексу со стороны
+    тега или пользователя, поэтому рецепты не дублируются
+    и DISTINCT не нужен"""
 
-    tags = filters.ModelMultipleChoiceFilter(
-        field_name='tags__slug',
-        to_field_name='slug',
-        queryset=Tag.objects.all()
+    tags = filters.MultipleChoiceFilter(
+        choices=get_tag_choices,
+        method='filter_tags'
     )
     is_favorited = filters.BooleanFilter(
         method='filter_is_favorited'
@@ -38,14 +46,37 @@ class RecipesFilter(FilterSet):
             'author'
         )
 
-    def filter_is_favorited(self, queryset, name, value):
+    def filter_tags(self, queryset, name, value):
+        if not value:
+            return queryset
+        return queryset.filter(pk__in=Recipe.tags.through.objects.filter(
+            tag_id__in=reference.tags().ids('slug', value)
+        ).values('recipe_id'))
+
+    def filter_user_relation(self, queryset, model, value):
         user = self.request.user
         if value and not user.is_anonymous:
-            return queryset.filter(favourites__user=user)
+            return queryset.filter(pk__in=model.objects.filter(
+                user=user
+            ).values('recipe_id'))
         return queryset
 
+    def filter_is_favorited(self, queryset, name, value):
+        return self.filter_user_relation(queryset, Favourites, value)
+
     def filter_is_in_shopping_cart(self, queryset, name, value):
-        user = self.request.user
-        if value and not user.is_anonymous:
-            return queryset.filter(shop_list__user=user)
-        return queryset
+        return self.filter_user_relation(queryset, ShopList, value)
+
+
+class RecipeSearchFilter(SearchFilter):
+    """
+    Полнотекстовый поиск по названию, описанию, ингредиентам и тегам
+    с сортировкой по релевантности. Если для БД нет поискового
+    бэкенда, используется обычный поиск по search_fields
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        found = search.search(queryset, self.get_search_terms(request))
+        if found is None:
+            return super().filter_queryset(request, queryset, view)
+        return found
@@ -0,0 +1,155 @@
+import os
+
+from api import benchmark
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from recipes.models import Recipe
+
+DEFAULT_BASELINE = os.path.join(settings.BASE_DIR, 'benchmarks',
+                                'baseline.json')
+
+
+class Command(BaseCommand):
+    help = ('Замер задержек, запросов к БД и памяти для эндпоинтов API '
+            'и сравнение с базовой линией')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--warmup', type=int, default=2)
+        parser.add_argument('--only', action='append', default=[],
+                            help='Только сценарии, содержащие подстроку')
+        parser.add_argument('--cold', action='store_true',
+                            help='Очищать кэш перед каждым запросом')
+        parser.add_argument('--explain', action='store_true',
+                            help='Вывести план самого долгого запроса')
+        parser.add_argument('--serialization', type=int, metavar='SIZE',
+                            help='Сравнить стандартную и быструю '
+                                 'сериализацию списков из SIZE рецептов')
+        parser.add_argument('--connections', action='store_true',
+                            help='Сравнить задержки с новым, постоянным '
+                                 'соединением с БД и пулом')
+        parser.add_argument('--save', nargs='?', const=DEFAULT_BASELINE,
+                            help='Сохранить результаты как базовую линию')
+        parser.add_argument('--compare', nargs='?', const=DEFAULT_BASELINE,
+                            help='Сравнить с базовой линией')
+        parser.add_argument('--latency-threshold', type=float, default=0.25,
+                            help='Допустимый рост задержки, доля')
+        parser.add_argument('--allocations-threshold', type=float,
+                            default=0.25,
+                            help='Допустимый рост памяти, доля')
+
+    def handle(self, *args, **options):
+        if options['serialization']:
+            self.serialization(options['serialization'],
+                               options['iterations'])
+            return
+        scenarios = [
+            scenario for scenario in benchmark.get_scenarios()
+            if not options['only']
+            or any(part in scenario.name for part in options['only'])
+        ]
+        if not scenarios:
+            raise CommandError(
+                'Нет данных для замеров: запустите generate_dataset'
+            )
+        if options['connections']:
+            self.connections(scenarios, options)
+            return
+        results = {}
+        with override_settings(
+            ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']
+        ):
+            clients = benchmark.get_clients()
+            width = max(len(scenario.name) for scenario in scenarios)
+            self.stdout.write(
+                f'{"сценарий":{width}} {"код":>4} {"p50":>8} {"p95":>8} '
+                f'{"p99":>8} {"запр.":>6} {"КБ":>8}'
+            )
+            for scenario in scenarios:
+                result = benchmark.measure(
+                    clients[scenario.authenticated], scenario,
+                    options['iterations'], options['warmup'],
+                    options['cold']
+                )
+                results[scenario.name] = result
+                self.stdout.write(
+                    f'{scenario.name:{width}} {result["status"]:>4} '
+                    f'{result["p50_ms"]:>8.2f} {result["p95_ms"]:>8.2f} '
+                    f'{result["p99_ms"]:>8.2f} {result["queries"]:>6} '
+                    f'{result["allocated_kb"]:>8.1f}'
+                )
+                if options['explain']:
+                    for line in benchmark.explain(
+                        clients[scenario.authenticated], scenario
+                    ):
+                        self.stdout.write(f'    {line}')
+        if options['save']:
+            os.makedirs(os.path.dirname(options['save']) or '.',
+                        exist_ok=True)
+            benchmark.save(options['save'], results)
+            self.stdout.write(f'Базовая линия сохранена в {options["save"]}')
+        if options['compare']:
+            regressions = benchmark.find_regressions(
+                results, benchmark.load(options['compare']),
+                {'latency': options['latency_threshold'],
+                 'allocations': options['allocations_threshold']}
+            )
+            if regressions:
+                raise CommandError(
+                    'Регрессии относительно базовой линии:\n'
+                    + '\n'.join(regressions)
+                )
+            self.stdout.write('Регрессий нет')
+
+    def connections(self, scenarios, options):
+        modes = benchmark.get_connection_modes()
+        width = max(len(scenario.name) for scenario in scenarios)
+        self.stdout.write(f'{"сценарий":{width}} ' + ' '.join(
+            f'{name + " p50":>15}' for name in modes
+        ))
+        with override_settings(
+            ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']
+        ):
+            clients = benchmark.get_clients()
+            for scenario in scenarios:
+                timings = []
+                for mode in modes.values():
+                    with benchmark.connection_mode(mode):
+                        result = benchmark.measure(
+                            clients[scenario.authenticated], scenario,
+                            options['iterations'], options['warmup'],
+                            options['cold']
+                        )
+                    timings.append(result['p50_ms'])
+                self.stdout.write(f'{scenario.name:{width}} ' + ' '.join(
+                    f'{timing:>15.2f}' for timing in timings
+                ))
+
+    def serialization(self, size, iterations):
+        if not Recipe.objects.exists():
+            raise CommandError(
+                'Нет данных для замеров: запустите generate_dataset'
+            )
+        with override_settings(
+            ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']
+        ):
+            results = benchmark.measure_serialization(size, iterations)
+        self.stdout.write(
+            f'{"сериализатор":24} {"объектов":>8} {"DRF, мс":>9} '
+            f'{"быстрый, мс":>12} {"ускорение":>10}'
+        )
+        for name, result in results.items():
+            self.stdout.write(
+                f'{name:24} {result["objects"]:>8} '
+                f'{result["standard_ms"]:>9.3f} {result["fast_ms"]:>12.3f} '
+                f'{result["speedup"]:>9.2f}x'
+            )
+        different = [
+            name for name, result in results.items()
+            if not result['identical']
+        ]
+        if different:
+            raise CommandError(
+                'Быстрый путь дал другой JSON: ' + ', '.join(different)
+            )
@@ -0,0 +1,328 @@
+import heapq
+import itertools
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+from rest_framework.response import Response
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+HISTOGRAMS = {
+    'request_duration_seconds': (
+        DURATION_BUCKETS, 'Полное время обработки запроса'
+    ),
+    'db_queries': (QUERY_BUCKETS, 'Количество запросов к БД'),
+    'db_duration_seconds': (DURATION_BUCKETS, 'Время запросов к БД'),
+    'serializer_duration_seconds': (
+        DURATION_BUCKETS, 'Время сериализации ответа'
+    ),
+    'response_size_bytes': (SIZE_BUCKETS, 'Размер ответа'),
+}
+
+
+class Histogram:
+    """Гистограмма с фиксированными границами корзин"""
+
+    __slots__ = ('buckets', 'counts', 'sum')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+def merge(totals, shard):
+    """Прибавляет гистограммы shard к totals"""
+    for key, histogram in list(shard.items()):
+        total = totals.get(key)
+        if total is None:
+            total = totals[key] = Histogram(histogram.buckets)
+        for index, count in enumerate(histogram.counts):
+            total.counts[index] += count
+        total.sum += histogram.sum
+
+
+class Registry:
+    """
+    Метрики процесса. Каждый поток пишет в свои гистограммы,
+    поэтому на пути запроса нет блокировок; при выгрузке значения
+    потоков суммируются, а гистограммы завершившихся потоков
+    переносятся в общий итог retired
+    """
+
+    def __init__(self):
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.shards = {}
+        self.retired = {}
+
+    def get_shard(self):
+        shard = getattr(self.local, 'shard', None)
+        if shard is None:
+            shard = self.local.shard = {}
+            ident = threading.get_ident()
+            with self.lock:
+                # Идентификатор завершившегося потока мог достаться новому
+                merge(self.retired, self.shards.pop(ident, {}))
+                self.shards[ident] = shard
+        return shard
+
+    def observe(self, view, values):
+        shard = self.get_shard()
+        for name, value in values.items():
+            histogram = shard.get((name, view))
+            if histogram is None:
+                histogram = shard[name, view] = Histogram(
+                    HISTOGRAMS[name][0]
+                )
+            histogram.observe(value)
+
+    def collect(self):
+        """Суммарные гистограммы по (метрика, view)"""
+        totals = {}
+        with self.lock:
+            alive = {thread.ident for thread in threading.enumerate()}
+            for ident in list(self.shards):
+                if ident not in alive:
+                    merge(self.retired, self.shards.pop(ident))
+            merge(totals, self.retired)
+            for shard in self.shards.values():
+                merge(totals, shard)
+        return totals
+
+
+registry = Registry()
+
+
+class SlowRequests:
+    """
+    Самые медленные запросы процесса вместе с их SQL: хранится
+    не больше METRICS_SLOW_REQUESTS записей дольше
+    METRICS_SLOW_REQUEST_MS миллисекунд
+    """
+
+    def __init__(self):
+        self.heap = []
+        self.counter = itertools.count()
+        self.lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return settings.METRICS_SLOW_REQUESTS > 0
+
+    def is_slow(self, duration):
+        return (
+            duration * 1000 >= settings.METRICS_SLOW_REQUEST_MS
+            and (len(self.heap) < settings.METRICS_SLOW_REQUESTS
+                 or duration > self.heap[0][0])
+        )
+
+    def add(self, duration, sample):
+        item = (duration, next(self.counter), sample)
+        with self.lock:
+            if len(self.heap) < settings.METRICS_SLOW_REQUESTS:
+                heapq.heappush(self.heap, item)
+            else:
+                heapq.heappushpop(self.heap, item)
+
+    def get(self):
+        with self.lock:
+            items = sorted(self.heap, reverse=True)
+        return [sample for _, _, sample in items]
+
+
+slow_requests = SlowRequests()
+
+
+class QueryTimer:
+    """Обёртка выполнения SQL: считает запросы и их время"""
+
+    __slots__ = ('count', 'duration', 'statements')
+
+    def __init__(self, capture=False):
+        self.count = 0
+        self.duration = 0
+        self.statements = [] if capture else None
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.count += 1
+            self.duration += elapsed
+            if self.statements is not None:
+                self.statements.append((sql, elapsed))
+
+
+_serializer = threading.local()
+
+
+def reset_serializer_time():
+    _serializer.duration = 0
+
+
+def get_serializer_time():
+    return getattr(_serializer, 'duration', 0)
+
+
+class SerializerTimerMixin:
+    """
+    Замер времени сериализации ответа view: от создания сериализатора
+    для вывода (get_serializer без data), сохранения объекта
+    или явного start_serialization до рендеринга ответа
+    в finalize_response
+    """
+
+    serialization_start = None
+
+    def start_serialization(self):
+        if self.serialization_start is None:
+            self.serialization_start = time.perf_counter()
+
+    def get_serializer(self, *args, **kwargs):
+        if args and 'data' not in kwargs:
+            self.start_serialization()
+        return super().get_serializer(*args, **kwargs)
+
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+        self.start_serialization()
+
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        self.start_serialization()
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(
+            request, response, *args, **kwargs
+        )
+        if self.serialization_start is None:
+            return response
+        if isinstance(response, Response):
+            response.render()
+        _serializer.duration = get_serializer_time() + (
+            time.perf_counter() - self.serialization_start
+        )
+        self.serialization_start = None
+        return response
+
+
+def get_view_name(request):
+    """
+    Имя view для меток: класс и действие для DRF
+    (RecipeViewSet.list), иначе имя маршрута
+    """
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unresolved'
+    view_class = getattr(match.func, 'cls', None)
+    if view_class is None:
+        return match.view_name or match.func.__name__
+    method = request.method.lower()
+    actions = getattr(match.func, 'actions', None) or {}
+    return f'{view_class.__name__}.{actions.get(method, method)}'
+
+
+def format_labels(labels):
+    return '{' + ','.join(
+        '{}="{}"'.format(
+            name,
+            str(value).replace('\\', '\\\\').replace('"', '\\"')
+        )
+        for name, value in labels.items()
+    ) + '}'
+
+
+def render_histograms(totals):
+    lines = []
+    for name, (buckets, help_text) in HISTOGRAMS.items():
+        metric = f'foodgram_{name}'
+        lines.append(f'# HELP {metric} {help_text}')
+        lines.append(f'# TYPE {metric} histogram')
+        for (histogram_name, view), histogram in sorted(totals.items()):
+            if histogram_name != name:
+                continue
+            cumulative = 0
+            for bound, count in zip((*buckets, '+Inf'), histogram.counts):
+                cumulative += count
+                labels = format_labels({'view': view, 'le': bound})
+                lines.append(f'{metric}_bucket{labels} {cumulative}')
+            labels = format_labels({'view': view})
+            lines.append(f'{metric}_sum{labels} {histogram.sum}')
+            lines.append(f'{metric}_count{labels} {cumulative}')
+    return lines
+
+
+def render_counters(name, help_text, label, values):
+    metric = f'foodgram_{name}'
+    return [
+        f'# HELP {metric} {help_text}',
+        f'# TYPE {metric} counter',
+        *(f'{metric}{format_labels({label: key})} {value}'
+          for key, value in values.items()),
+    ]
+
+
+def render_pools(pools):
+    """Заполненность пулов соединений с БД по псевдонимам"""
+    lines = [
+        '# HELP foodgram_db_pool_connections Соединения пула',
+        '# TYPE foodgram_db_pool_connections gauge',
+    ]
+    for alias, stats in pools.items():
+        for state in ('in_use', 'idle'):
+            labels = format_labels({'alias': alias, 'state': state})
+            lines.append(f'foodgram_db_pool_connections{labels} '
+                         f'{stats[state]}')
+    for name, help_text in (('max_size', 'Размер пула'),
+                            ('waiting', 'Потоки, ждущие соединения')):
+        metric = f'foodgram_db_pool_{name}'
+        lines += [f'# HELP {metric} {help_text}', f'# TYPE {metric} gauge']
+        lines += [
+            f'{metric}{format_labels({"alias": alias})} {stats[name]}'
+            for alias, stats in pools.items()
+        ]
+    lines += [
+        '# HELP foodgram_db_pool_wait_seconds_total Время ожидания '
+        'соединения',
+        '# TYPE foodgram_db_pool_wait_seconds_total counter',
+        *(f'foodgram_db_pool_wait_seconds_total'
+          f'{format_labels({"alias": alias})} {stats["wait_seconds"]}'
+          for alias, stats in pools.items()),
+        '# HELP foodgram_db_pool_events_total События пула',
+        '# TYPE foodgram_db_pool_events_total counter',
+    ]
+    for alias, stats in pools.items():
+        for event in ('created', 'reused', 'discarded', 'waits',
+                      'timeouts'):
+            labels = format_labels({'alias': alias, 'event': event})
+            lines.append(f'foodgram_db_pool_events_total{labels} '
+                         f'{stats[event]}')
+    return lines
+
+
+def render():
+    """Метрики процесса в текстовом формате Prometheus"""
+    from foodgram.db import pool
+
+    from .request_log import get_buffer
+    from .response_cache import stats
+
+    lines = render_histograms(registry.collect())
+    lines += render_counters('response_cache_total', 'Кэш ответов',
+                             'result', stats)
+    lines += render_counters('api_log_records_total',
+                             'Журнал запросов API', 'state',
+                             get_buffer().stats)
+    lines += render_pools(pool.get_stats())
+    return '\n'.join(lines) + '\n'
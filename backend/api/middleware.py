@@ -0,0 +1,114 @@
+import random
+import time
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+from drf_api_logger.utils import get_client_ip, get_headers
+
+from . import metrics
+from .request_log import get_buffer
+
+LOGGED_CONTENT_TYPES = ('application/json', 'application/vnd.api+json')
+
+
+def get_sample_rate(request):
+    """
+    Доля логируемых GET-запросов по префиксу пути из
+    API_LOG_SAMPLE_RATES; остальные запросы логируются всегда
+    """
+    if request.method != 'GET':
+        return 1
+    for prefix, rate in settings.API_LOG_SAMPLE_RATES.items():
+        if request.path_info.startswith(prefix):
+            return rate
+    return 1
+
+
+class BufferedAPILoggerMiddleware:
+    """
+    Журнал запросов API в таблицу drf_api_logger без записи в БД
+    на пути запроса: сохраняются сырые данные, а разбор и вставка
+    выполняются фоновым потоком пачками
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.buffer = get_buffer()
+
+    def __call__(self, request):
+        if not settings.DRF_API_LOGGER_DATABASE:
+            return self.get_response(request)
+        rate = get_sample_rate(request)
+        if rate < 1 and random.random() >= rate:
+            return self.get_response(request)
+        start = time.time()
+        body = request.body
+        response = self.get_response(request)
+        match = request.resolver_match
+        if (
+            match is not None and match.namespace == 'admin'
+            or response.get('content-type') not in LOGGED_CONTENT_TYPES
+        ):
+            return response
+        self.buffer.put({
+            'api': request.build_absolute_uri(),
+            'headers': get_headers(request=request),
+            'body': body,
+            'method': request.method,
+            'client_ip_address': get_client_ip(request),
+            'response': (
+                '** Streaming **' if response.streaming
+                else response.content
+            ),
+            'status_code': response.status_code,
+            'execution_time': time.time() - start,
+            'added_on': timezone.now(),
+        })
+        return response
+
+
+class MetricsMiddleware:
+    """
+    Замер времени запроса, количества и времени запросов к БД,
+    времени сериализации и размера ответа по имени view. При
+    включённом сэмплере сохраняются SQL самых медленных запросов
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.METRICS_ENABLED:
+            return self.get_response(request)
+        timer = metrics.QueryTimer(capture=metrics.slow_requests.enabled)
+        metrics.reset_serializer_time()
+        start = time.perf_counter()
+        with connection.execute_wrapper(timer):
+            response = self.get_response(request)
+        duration = time.perf_counter() - start
+        view = metrics.get_view_name(request)
+        values = {
+            'request_duration_seconds': duration,
+            'db_queries': timer.count,
+            'db_duration_seconds': timer.duration,
+            'serializer_duration_seconds': metrics.get_serializer_time(),
+        }
+        if not response.streaming:
+            values['response_size_bytes'] = len(response.content)
+        metrics.registry.observe(view, values)
+        if timer.statements is not None and metrics.slow_requests.is_slow(
+            duration
+        ):
+            metrics.slow_requests.add(duration, {
+                'view': view,
+                'path': request.get_full_path(),
+                'status': response.status_code,
+                'duration_ms': round(duration * 1000, 3),
+                'db_ms': round(timer.duration * 1000, 3),
+                'queries': [
+                    {'sql': sql, 'ms': round(elapsed * 1000, 3)}
+                    for sql, elapsed in timer.statements
+                ],
+            })
+        return response
@@ -1,7 +1,208 @@
+import hashlib
+from collections import OrderedDict
+from datetime import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Q
 from rest_framework import pagination
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+
+
+def estimate_count(queryset):
+    """
+    Приблизительное количество строк выборки: для всей таблицы
+    PostgreSQL берётся оценка планировщика из pg_class, иначе
+    точный COUNT кэшируется на PAGINATION_COUNT_CACHE_TIMEOUT
+    """
+    if connection.vendor == 'postgresql' and not queryset.query.where:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT reltuples::bigint FROM pg_class WHERE relname = %s',
+                [queryset.model._meta.db_table]
+            )
+            row = cursor.fetchone()
+        if row and row[0] >= 0:
+            return row[0]
+    key = 'count:' + hashlib.md5(str(queryset.query).encode()).hexdigest()
+    return cache.get_or_set(key, queryset.count,
+                            settings.PAGINATION_COUNT_CACHE_TIMEOUT)
+
+
+class CountCursorPagination(pagination.CursorPagination):
+    """
+    Курсорная пагинация: страница выбирается по ключу сортировки,
+    а не смещением. Общее количество возвращается только по
+    запросу count=1 и может быть приблизительным
+    """
+
+    page_size_query_param = 'limit'
+    count_query_param = 'count'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count = None
+        if request.query_params.get(self.count_query_param):
+            self.count = estimate_count(queryset)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        response = OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ])
+        if self.count is not None:
+            response['count'] = self.count
+            response.move_to_end('count', last=False)
+        return Response(response)
+
+
+class SubscriptionCursorPagination(CountCursorPagination):
+    """Курсорная пагинация подписок по уникальному username"""
+
+    ordering = ('username',)
+
+
+class TimelineCursorPagination(pagination.CursorPagination):
+    """
+    Курсорная пагинация по (pub_date, id): позиция курсора — дата
+    публикации и id крайнего рецепта страницы ('pub_date|pk').
+    Ключ уникален, поэтому рецепты с одинаковой датой не требуют
+    смещения и не теряются при вставке новых
+    """
+
+    page_size_query_param = 'limit'
+    ordering = ('-pub_date', '-id')
+    has_previous = False
+
+    def get_position(self, item):
+        return item.pub_date, item.pk
+
+    def decode_position(self, cursor):
+        if cursor is None or not cursor.position:
+            return None
+        try:
+            pub_date, pk = cursor.position.rsplit('|', 1)
+            return datetime.fromisoformat(pub_date), int(pk)
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_position(self, position, reverse=False):
+        pub_date, pk = position
+        return self.encode_cursor(pagination.Cursor(
+            offset=0, reverse=reverse,
+            position=f'{pub_date.isoformat()}|{pk}'
+        ))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+        self.cursor = self.decode_cursor(request)
+        self.position = self.decode_position(self.cursor)
+        reverse = self.cursor is not None and self.cursor.reverse
+        if self.position is not None:
+            pub_date, pk = self.position
+            lookup = 'gt' if reverse else 'lt'
+            queryset = queryset.filter(
+                Q(**{f'pub_date__{lookup}': pub_date})
+                | Q(pub_date=pub_date, **{f'pk__{lookup}': pk})
+            )
+        queryset = queryset.order_by(
+            *(('pub_date', 'id') if reverse else self.ordering)
+        )
+        rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = self.position is not None
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        if not self.page:
+            return self.encode_position(self.position)
+        return self.encode_position(self.get_position(self.page[-1]))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return self.encode_position(self.position, reverse=True)
+        return self.encode_position(self.get_position(self.page[0]),
+                                    reverse=True)
+
+
+class RecipeCursorPagination(CountCursorPagination,
+                             TimelineCursorPagination):
+    """Курсорная пагинация списка рецептов по (pub_date, id)"""
+
+
+class FeedPagination(TimelineCursorPagination):
+    """
+    Курсорная пагинация ленты подписок: каждая страница читается
+    одним срезом ленты без смещения, только вперёд
+    """
+
+    def get_position(self, item):
+        return item
+
+    def paginate_timeline(self, get_timeline, request):
+        """Страница пар (дата публикации, id) из get_timeline"""
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.position = self.decode_position(self.decode_cursor(request))
+        rows = get_timeline(self.position, self.page_size + 1)
+        self.page = rows[:self.page_size]
+        self.has_next = len(rows) > self.page_size
+        return self.page
 
 
 class CustomPagination(pagination.PageNumberPagination):
-    """Кастомный пагинатор"""
+    """
+    Кастомный пагинатор. Параметр pagination=cursor включает
+    курсорную пагинацию, если для выборки задан cursor_class
+    """
 
     page_size_query_param = 'limit'
+    cursor_class = None
+    cursor_paginator = None
+
+    def use_cursor(self, request):
+        return self.cursor_class is not None and (
+            request.query_params.get('pagination') == 'cursor'
+            or self.cursor_class.cursor_query_param in request.query_params
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.use_cursor(request):
+            self.cursor_paginator = self.cursor_class()
+            return self.cursor_paginator.paginate_queryset(
+                queryset, request, view
+            )
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+
+class RecipePagination(CustomPagination):
+    """Пагинатор ленты рецептов"""
+
+    cursor_class = RecipeCursorPagination
+
+
+class SubscriptionPagination(CustomPagination):
+    """Пагинатор подписок"""
+
+    cursor_class = SubscriptionCursorPagination
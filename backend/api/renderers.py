@@ -0,0 +1,57 @@
+from rest_framework import renderers
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# JSONRenderer экранирует разделители строк, недопустимые в JavaScript
+LINE_SEPARATORS = (
+    ('\u2028'.encode(), b'\\u2028'),
+    ('\u2029'.encode(), b'\\u2029'),
+)
+
+
+class FastJSONRenderer(renderers.JSONRenderer):
+    """
+    JSONRenderer, который кодирует через orjson, если он установлен.
+    Результат побайтно совпадает с JSONRenderer: типы, которые orjson
+    записывает по-своему (даты, dataclass), проходят через JSONEncoder
+    DRF, а ответы с отступами или нестандартными настройками JSON
+    рендерятся стандартным путём. Дробные числа orjson записывает
+    иначе, чем json (1e-05 и 1e-5), поэтому рендерер подключается
+    только к представлениям, в ответах которых их нет
+    """
+
+    encoder = JSONEncoder()
+
+    def is_fast(self, accepted_media_type, renderer_context):
+        return (
+            orjson is not None
+            and self.compact and self.strict and not self.ensure_ascii
+            and self.get_indent(accepted_media_type,
+                                renderer_context or {}) is None
+        )
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None or not self.is_fast(accepted_media_type,
+                                            renderer_context):
+            return super().render(data, accepted_media_type,
+                                  renderer_context)
+        try:
+            content = orjson.dumps(
+                data, default=self.encoder.default,
+                option=(orjson.OPT_PASSTHROUGH_DATETIME
+                        | orjson.OPT_PASSTHROUGH_DATACLASS)
+            )
+        except TypeError:
+            return super().render(data, accepted_media_type,
+                                  renderer_context)
+        for separator, escaped in LINE_SEPARATORS:
+            content = content.replace(separator, escaped)
+        return content
+
+
+# Рендереры представлений, в ответах которых нет дробных чисел
+FAST_RENDERER_CLASSES = (FastJSONRenderer, renderers.BrowsableAPIRenderer)
@@ -0,0 +1,158 @@
+import atexit
+import json
+import logging
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections, connection, connections
+from drf_api_logger.models import APILogsModel
+from drf_api_logger.utils import mask_sensitive_data
+
+logger = logging.getLogger(__name__)
+
+# Сигнал потоку записи: дописать очередь и завершиться
+STOP = object()
+
+
+def dump(data):
+    return json.dumps(data, indent=4, ensure_ascii=False)
+
+
+def parse(content):
+    try:
+        return json.loads(content) if content else ''
+    except ValueError:
+        return ''
+
+
+def make_log(record):
+    """
+    Запись APILogsModel из сырых данных запроса. Разбор и
+    маскирование тел выполняются в потоке записи, а не в запросе
+    """
+    body = mask_sensitive_data(parse(record['body']))
+    response = record['response']
+    if isinstance(response, bytes):
+        response = parse(response)
+    return APILogsModel(
+        api=mask_sensitive_data(record['api'], mask_api_parameters=True),
+        headers=dump(mask_sensitive_data(record['headers'])),
+        body=dump(body) if body else '',
+        method=record['method'],
+        client_ip_address=record['client_ip_address'],
+        response=dump(mask_sensitive_data(response)),
+        status_code=record['status_code'],
+        execution_time=record['execution_time'],
+        added_on=record['added_on'],
+    )
+
+
+class LogBuffer:
+    """
+    Ограниченная очередь записей журнала API. Фоновый поток
+    сохраняет их через bulk_create пачками по API_LOG_BATCH_SIZE
+    или раз в API_LOG_FLUSH_INTERVAL мс. При переполнении очереди
+    запись отбрасывается и учитывается в счётчике dropped. При
+    завершении процесса очередь дописывается не дольше
+    API_LOG_SHUTDOWN_TIMEOUT секунд
+    """
+
+    def __init__(self, size, batch_size, interval, shutdown_timeout):
+        self.queue = queue.Queue(maxsize=size)
+        self.batch_size = batch_size
+        self.interval = interval
+        self.shutdown_timeout = shutdown_timeout
+        self.lock = threading.Lock()
+        self.thread = None
+        self.stopping = False
+        self.stats = {'queued': 0, 'written': 0, 'dropped': 0, 'failed': 0}
+
+    def put(self, record):
+        self.start()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.stats['dropped'] += 1
+            return
+        self.stats['queued'] += 1
+
+    def start(self):
+        if self.thread is not None:
+            return
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(
+                    target=self.run, name='api-log-writer', daemon=True
+                )
+                self.thread.start()
+                atexit.register(self.stop)
+
+    def stop(self):
+        """Дописывает очередь и останавливает поток записи"""
+        deadline = time.monotonic() + self.shutdown_timeout
+        try:
+            self.queue.put(STOP, timeout=self.shutdown_timeout)
+        except queue.Full:
+            logger.warning('Журнал запросов API не дописан: очередь полна')
+            return
+        self.thread.join(max(0, deadline - time.monotonic()))
+        if self.thread.is_alive():
+            logger.warning('Журнал запросов API не дописан за %s с',
+                           self.shutdown_timeout)
+
+    def take(self):
+        """
+        Пачка записей: до batch_size, до истечения интервала
+        или до сигнала остановки
+        """
+        batch = []
+        item = self.queue.get()
+        deadline = time.monotonic() + self.interval
+        while item is not STOP:
+            batch.append(item)
+            timeout = deadline - time.monotonic()
+            if len(batch) >= self.batch_size or timeout <= 0:
+                return batch
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                return batch
+        self.stopping = True
+        return batch
+
+    def write(self, batch):
+        try:
+            APILogsModel.objects.using(
+                getattr(settings, 'DRF_API_LOGGER_DEFAULT_DATABASE',
+                        'default')
+            ).bulk_create([make_log(record) for record in batch])
+        except Exception:
+            self.stats['failed'] += len(batch)
+            logger.exception('Не удалось сохранить журнал запросов API')
+            connection.close()
+            return
+        self.stats['written'] += len(batch)
+
+    def run(self):
+        while not self.stopping:
+            batch = self.take()
+            if batch:
+                self.write(batch)
+            # Соединение между пачками живёт не дольше CONN_MAX_AGE,
+            # а с пулом сразу возвращается в него
+            close_old_connections()
+        connections.close_all()
+
+
+_buffer = LogBuffer(
+    settings.API_LOG_QUEUE_SIZE,
+    settings.API_LOG_BATCH_SIZE,
+    settings.API_LOG_FLUSH_INTERVAL / 1000,
+    settings.API_LOG_SHUTDOWN_TIMEOUT
+)
+
+
+def get_buffer():
+    return _buffer
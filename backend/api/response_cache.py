@@ -0,0 +1,118 @@
+import hashlib
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from recipes.user_state import get_user_state
+from rest_framework.response import Response
+
+KEY = 'response:{}'
+
+stats = Counter(hits=0, misses=0, not_modified=0)
+
+
+def get_stats():
+    """Счётчики кэша ответов процесса и доля попаданий"""
+    requests = stats['hits'] + stats['misses'] + stats['not_modified']
+    return {
+        **stats,
+        'hit_rate': (
+            (stats['hits'] + stats['not_modified']) / requests
+            if requests else 0
+        ),
+    }
+
+
+def get_auth_key(request):
+    """
+    Часть ключа, зависящая от пользователя: аноним или id
+    пользователя с отпечатком его избранного, покупок и подписок
+    """
+    if not request.user.is_authenticated:
+        return 'anonymous'
+    return f'user:{request.user.pk}:{get_user_state(request).digest()}'
+
+
+def get_key(request, version):
+    query = '&'.join(sorted(request.META.get('QUERY_STRING', '').split('&')))
+    raw = '|'.join((request.get_host(), request.path, query,
+                    get_auth_key(request), repr(version)))
+    return KEY.format(hashlib.sha1(raw.encode()).hexdigest())
+
+
+def set_validators(response, etag, version):
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(int(version))
+    return response
+
+
+class CachedResponseMixin:
+    """
+    Кэширование ответов GET в JSON. Ключ строится из пути, строки
+    запроса, пользователя и версии данных из get_cache_version; при
+    совпадении If-None-Match ответ 304 отдаётся без сериализации.
+    Без общего кэша (SHARED_CACHE) ответы не кэшируются: версии
+    в кэше процесса не узнают об изменениях из других процессов
+    """
+
+    cached_actions = ()
+    cache_key = None
+    cache_version = None
+
+    def get_cache_version(self, request):
+        """
+        Версия данных ответа (время последнего изменения в секундах);
+        None — ответ не кэшируется
+        """
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self.cache_key = None
+        if (
+            settings.SHARED_CACHE
+            and self.action in self.cached_actions
+            and request.accepted_renderer.format == 'json'
+        ):
+            self.cache_version = self.get_cache_version(request)
+            if self.cache_version is not None:
+                self.cache_key = get_key(request, self.cache_version)
+
+    def get_cached_response(self, request):
+        if self.cache_key is None:
+            return None
+        entry = cache.get(self.cache_key)
+        if entry is None:
+            stats['misses'] += 1
+            return None
+        content, etag = entry
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            stats['hits'] += 1
+            response = HttpResponse(content, content_type='application/json')
+            response['X-Cache'] = 'HIT'
+        else:
+            stats['not_modified'] += 1
+        return set_validators(response, etag, self.cache_version)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(
+            request, response, *args, **kwargs
+        )
+        if (
+            self.cache_key is None
+            or not isinstance(response, Response)
+            or response.status_code != 200
+        ):
+            return response
+        response.render()
+        etag = '"{}"'.format(hashlib.sha1(response.content).hexdigest())
+        cache.set(self.cache_key, (response.content, etag),
+                  settings.RESPONSE_CACHE_TIMEOUT)
+        response['X-Cache'] = 'MISS'
+        return set_validators(
+            get_conditional_response(request, etag=etag) or response,
+            etag, self.cache_version
+        )
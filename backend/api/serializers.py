@@ -1,15 +1,76 @@
+from django.conf import settings
+from django.db import transaction
+from django.utils.functional import cached_property
 from djoser.serializers import UserSerializer
 from drf_extra_fields.fields import Base64ImageField
-from recipes.models import (Favourites, Ingredient, IngredientAmount, Recipe,
-                            ShopList, Tag)
+from recipes import cart, images, reference, search
+from recipes.models import (CartSummary, Ingredient, IngredientAmount, Recipe,
+                            Tag)
+from recipes.user_state import get_user_state
 from rest_framework import serializers
 from user.models import Subscription, User
 
+from . import compiled
+from .fieldsets import FULL
+
 MIN_VALUE_FOR_AMOUNT = 1
 MIN_VALUE_FOR_COOKING_TIME = 1
 
 
-class UserReadSerializer(UserSerializer):
+class CompiledMixin:
+    """
+    Вывод функцией, собранной по полям сериализатора один раз
+    (см. compiled.compile_representation): для списка это один раз
+    на весь список. Отключается настройкой COMPILED_SERIALIZERS
+    """
+
+    @cached_property
+    def represent(self):
+        if not settings.COMPILED_SERIALIZERS:
+            return super().to_representation
+        return compiled.compile_representation(self)
+
+    def to_representation(self, instance):
+        return self.represent(instance)
+
+
+class SparseFieldsMixin:
+    """
+    Вывод только выбранных полей (см. fieldsets.get_fieldset).
+    Связи из expandable, если их не раскрыли, выводятся
+    первичными ключами, вложенным сериализаторам передаётся
+    их часть выбора
+    """
+
+    expandable = ()
+    profiles = {}
+
+    def __init__(self, *args, fieldset=FULL, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fieldset = fieldset
+
+    def get_fields(self):
+        fields = super().get_fields()
+        if self.fieldset.fields is not None:
+            fields = type(fields)(
+                (name, field) for name, field in fields.items()
+                if name in self.fieldset.fields
+            )
+        for name, field in list(fields.items()):
+            if name in self.expandable and not self.fieldset.expands(name):
+                fields[name] = self.get_collapsed_field(name)
+            elif self.fieldset.fields and self.fieldset.fields.get(name):
+                fields[name] = type(field)(*field._args, **{
+                    **field._kwargs, 'fieldset': self.fieldset.nested(name)
+                })
+        return fields
+
+    def get_collapsed_field(self, name):
+        """Поле связи name в виде первичного ключа"""
+        return serializers.ReadOnlyField(source=f'{name}_id')
+
+
+class UserReadSerializer(SparseFieldsMixin, UserSerializer):
     """Преобразование данных класса User на чтение"""
     is_subscribed = serializers.SerializerMethodField()
     email = serializers.ReadOnlyField()
@@ -29,16 +90,40 @@ class UserReadSerializer(UserSerializer):
         )
 
     def get_is_subscribed(self, obj):
+        return get_user_state(
+            self.context.get('request')
+        ).is_subscribed(obj.id)
+
+
+class HashedBase64ImageField(Base64ImageField):
+    """
+    Картинка в base64 с именем файла по хэшу содержимого.
+    Декодирование и проверка выполняются в запросе: о неверной
+    картинке клиент узнаёт из ответа 400
+    """
+
+    def get_file_name(self, decoded_file):
+        return images.content_name(decoded_file)
+
+
+class ThumbnailsMixin(serializers.Serializer):
+    """Адреса миниатюр картинки рецепта"""
+
+    thumbnails = serializers.SerializerMethodField()
+
+    def get_thumbnails(self, obj):
         request = self.context.get('request')
-        return (
-            request and request.user.is_authenticated
-            and Subscription.objects.filter(
-                author=obj, user=request.user
-            ).exists()
-        )
+        urls = images.thumbnail_urls(obj.image, obj.thumbnails_ready)
+        if request is None:
+            return urls
+        return {
+            label: request.build_absolute_uri(url)
+            for label, url in urls.items()
+        }
 
 
-class ShortRecipeSerializer(serializers.ModelSerializer):
+class ShortRecipeSerializer(CompiledMixin, ThumbnailsMixin,
+                            serializers.ModelSerializer):
     """
     Преобразование данных класса Recipe в короткой форме для
     Subscription, Favourite, ShopList
@@ -54,14 +139,42 @@ class ShortRecipeSerializer(serializers.ModelSerializer):
             'id',
             'name',
             'image',
+            'thumbnails',
             'cooking_time'
         )
 
 
+def get_recipes_limit(request):
+    """Значение recipes_limit из запроса: целое неотрицательное или None"""
+    limit = request.query_params.get('recipes_limit')
+    if limit in (None, ''):
+        return None
+    try:
+        limit = int(limit)
+    except ValueError:
+        raise serializers.ValidationError(
+            {'recipes_limit': 'Ожидается целое неотрицательное число'}
+        )
+    if limit < 0:
+        raise serializers.ValidationError(
+            {'recipes_limit': 'Ожидается целое неотрицательное число'}
+        )
+    return limit
+
+
+def attach_recipe_previews(authors, limit):
+    """Загружает рецепты для карточек авторов одним запросом"""
+    previews = {author.id: [] for author in authors}
+    for recipe in Recipe.objects.latest_by_author(previews, limit):
+        previews[recipe.author_id].append(recipe)
+    for author in authors:
+        author.recipe_previews = previews[author.id]
+
+
 class SubscriptionSerializer(UserReadSerializer):
     """Преобразование данных класса User для подписки"""
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
+    recipes_count = serializers.ReadOnlyField()
     is_subscribed = serializers.SerializerMethodField()
 
     class Meta:
@@ -100,10 +213,10 @@ class SubscriptionSerializer(UserReadSerializer):
 
     def get_recipes(self, obj):
         request = self.context.get('request')
-        limit = request.query_params.get('recipes_limit')
-        recipes = Recipe.objects.filter(author=obj).all()
-        if limit:
-            recipes = recipes[:int(limit)]
+        recipes = getattr(obj, 'recipe_previews', None)
+        if recipes is None:
+            limit = get_recipes_limit(request)
+            recipes = Recipe.objects.filter(author=obj)[:limit]
         serializer = ShortRecipeSerializer(recipes, many=True, read_only=True,
                                            context={'request': request})
         return serializer.data
@@ -111,11 +224,8 @@ class SubscriptionSerializer(UserReadSerializer):
     def get_is_subscribed(*args):
         return True
 
-    def get_recipes_count(self, obj):
-        return obj.recipes.count()
 
-
-class TagSerializer(serializers.ModelSerializer):
+class TagSerializer(CompiledMixin, serializers.ModelSerializer):
     """Преобразование данных класса Tag"""
 
     class Meta:
@@ -128,7 +238,7 @@ class TagSerializer(serializers.ModelSerializer):
         )
 
 
-class IngredientSerializer(serializers.ModelSerializer):
+class IngredientSerializer(CompiledMixin, serializers.ModelSerializer):
     """Преобразование данных класса Ingredient"""
 
     class Meta:
@@ -153,6 +263,13 @@ class IngredientAmountSerializer(serializers.ModelSerializer):
         model = IngredientAmount
         fields = ('id', 'name', 'measurement_unit', 'amount')
 
+    def to_representation(self, instance):
+        ingredient = reference.ingredients().get(instance.ingredient_id)
+        if ingredient is None:
+            return super().to_representation(instance)
+        ingredient['amount'] = instance.amount
+        return ingredient
+
 
 class RecipeWriteSerializer(serializers.ModelSerializer):
     """Преобразование данных класса Recipe на запись"""
@@ -165,7 +282,7 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
         slug_field='id',
         many=True
     )
-    image = Base64ImageField(required=True)
+    image = HashedBase64ImageField(required=True)
     author = UserReadSerializer(read_only=True)
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
@@ -187,34 +304,16 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
         )
 
     def validate(self, attrs):
-        tags = []
-        for tag in attrs['tags']:
-            if tag not in tags:
-                tags.append(tag)
-            else:
-                raise serializers.ValidationError(
-                    {'tags': 'Тег должен быть уникальным'}
-                )
-        if not tags:
+        tags = attrs['tags']
+        if len(set(tags)) != len(tags):
             raise serializers.ValidationError(
-                {'tags': 'Должен быть выбран хотя бы один тег'}
+                {'tags': 'Тег должен быть уникальным'}
             )
-        ingredients = []
-        for ingredient in attrs['ingredientamount_set']:
-            if ingredient['ingredient'] not in ingredients:
-                ingredients.append(ingredient['ingredient'])
-            else:
-                raise serializers.ValidationError(
-                    {'ingredients': 'Ингредиент должен быть уникальным'}
-                )
-            if int(ingredient['amount']) < MIN_VALUE_FOR_AMOUNT:
-                raise serializers.ValidationError(
-                    {'amount': 'Минимальный объем|вес 1'}
-                )
-        if not ingredients:
+        if not tags:
             raise serializers.ValidationError(
-                {'ingredients': 'Должен быть выбран хотя бы один ингредиент'}
+                {'tags': 'Должен быть выбран хотя бы один тег'}
             )
+        self.validate_ingredient_amounts(attrs['ingredientamount_set'])
         if int(attrs['cooking_time']) < MIN_VALUE_FOR_COOKING_TIME:
             raise serializers.ValidationError(
                 {'cooking_time': 'Минимальное время приготовления 1'}
@@ -222,47 +321,120 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
         return attrs
 
     @staticmethod
-    def recipes_ingredients_add(ingredients, recipe):
-        ingredients_amount = [
-            IngredientAmount(
-                ingredient=Ingredient.objects.get(
-                    id=ingredient['ingredient']['id']
-                ),
-                recipes=recipe,
-                amount=ingredient['amount']
-            ) for ingredient in ingredients
+    def validate_ingredient_amounts(ingredients):
+        ids = [ingredient['ingredient']['id'] for ingredient in ingredients]
+        if len(set(ids)) != len(ids):
+            raise serializers.ValidationError(
+                {'ingredients': 'Ингредиент должен быть уникальным'}
+            )
+        if any(int(ingredient['amount']) < MIN_VALUE_FOR_AMOUNT
+               for ingredient in ingredients):
+            raise serializers.ValidationError(
+                {'amount': 'Минимальный объем|вес 1'}
+            )
+        if not ids:
+            raise serializers.ValidationError(
+                {'ingredients': 'Должен быть выбран хотя бы один ингредиент'}
+            )
+        if len(Ingredient.objects.in_bulk(ids)) != len(ids):
+            raise serializers.ValidationError(
+                {'ingredients': 'Ингредиент не найден'}
+            )
+
+    @staticmethod
+    def save_ingredients(ingredients, recipe, created=False):
+        """
+        Приводит ингредиенты рецепта к переданным: удаляет лишние,
+        обновляет изменившееся количество и добавляет новые
+        """
+        amounts = {
+            ingredient['ingredient']['id']: ingredient['amount']
+            for ingredient in ingredients
+        }
+        existing = {} if created else {
+            ingredient_amount.ingredient_id: ingredient_amount
+            for ingredient_amount in IngredientAmount.objects.filter(
+                recipes=recipe
+            )
+        }
+        removed = [
+            ingredient_amount.pk
+            for ingredient_id, ingredient_amount in existing.items()
+            if ingredient_id not in amounts
+        ]
+        if removed:
+            IngredientAmount.objects.filter(pk__in=removed).delete()
+        changed = []
+        deltas = {}
+        for ingredient_id, ingredient_amount in existing.items():
+            amount = amounts.get(ingredient_id)
+            if amount is not None and ingredient_amount.amount != amount:
+                deltas[ingredient_id] = amount - ingredient_amount.amount
+                ingredient_amount.amount = amount
+                changed.append(ingredient_amount)
+        IngredientAmount.objects.bulk_update(changed, ['amount'])
+        added = [
+            IngredientAmount(recipes=recipe, ingredient_id=ingredient_id,
+                             amount=amount)
+            for ingredient_id, amount in amounts.items()
+            if ingredient_id not in existing
         ]
-        IngredientAmount.objects.bulk_create(ingredients_amount)
+        IngredientAmount.objects.bulk_create(added)
+        if not created:
+            deltas.update(
+                (ingredient_amount.ingredient_id, ingredient_amount.amount)
+                for ingredient_amount in added
+            )
+            # bulk-операции не отправляют сигналов, удалённые
+            # ингредиенты уже учтены сигналом post_delete
+            cart.change_recipe(recipe.pk, deltas.items())
 
     def create(self, validated_data):
         tags = validated_data.pop('tags')
         ingredients = validated_data.pop('ingredientamount_set')
-        recipes = Recipe.objects.create(**validated_data,
-                                        author=self.context['request'].user)
-        recipes.tags.set(tags)
-        self.recipes_ingredients_add(ingredients, recipes)
+        validated_data['image'] = images.store_original(
+            validated_data['image']
+        )
+        with transaction.atomic(), search.deferred_indexing():
+            recipes = Recipe.objects.create(
+                **validated_data, author=self.context['request'].user
+            )
+            recipes.tags.set(tags)
+            self.save_ingredients(ingredients, recipes, created=True)
+            images.schedule_thumbnails(recipes.image.name)
         return recipes
 
     def update(self, instance, validated_data):
-        instance.tags.clear()
-        IngredientAmount.objects.filter(recipes=instance).delete()
         tags = validated_data.pop('tags')
-        instance.tags.set(tags)
         ingredients = validated_data.pop('ingredientamount_set')
-        self.recipes_ingredients_add(ingredients, instance)
-        return super().update(instance, validated_data)
+        if 'image' in validated_data:
+            validated_data['image'] = images.store_original(
+                validated_data['image']
+            )
+            validated_data['thumbnails_ready'] = (
+                instance.thumbnails_ready
+                and validated_data['image'] == instance.image.name
+            )
+        with transaction.atomic(), search.deferred_indexing():
+            instance.tags.set(tags)
+            self.save_ingredients(ingredients, instance)
+            super().update(instance, validated_data)
+            if not instance.thumbnails_ready:
+                images.schedule_thumbnails(instance.image.name)
+        return instance
 
     def to_representation(self, instance):
         return RecipeReadSerializer(
-            instance,
+            Recipe.objects.with_related().get(pk=instance.pk),
             context={'request': self.context.get('request')}
         ).data
 
 
-class RecipeReadSerializer(serializers.ModelSerializer):
+class RecipeReadSerializer(CompiledMixin, SparseFieldsMixin, ThumbnailsMixin,
+                           serializers.ModelSerializer):
     """Преобразование данных класса Recipe на чтение"""
     author = UserReadSerializer(read_only=True)
-    tags = TagSerializer(many=True, read_only=True)
+    tags = serializers.SerializerMethodField()
     ingredients = IngredientAmountSerializer(
         many=True,
         source='ingredientamount_set'
@@ -281,76 +453,67 @@ class RecipeReadSerializer(serializers.ModelSerializer):
             'is_in_shopping_cart',
             'name',
             'image',
+            'thumbnails',
             'text',
             'cooking_time',
         )
 
+    expandable = ('author', 'tags')
+    profiles = {
+        # Карточка в сетке рецептов
+        'card': (
+            'id,name,image,thumbnails,cooking_time,tags,'
+            'is_favorited,is_in_shopping_cart',
+            'tags'
+        ),
+    }
+
+    def get_collapsed_field(self, name):
+        if name == 'tags':
+            return serializers.SerializerMethodField('get_tag_ids')
+        return super().get_collapsed_field(name)
+
+    def get_tag_ids(self, obj):
+        return [tag.id for tag in obj.tags.all()]
+
+    def get_tags(self, obj):
+        tags = reference.tags()
+        return [
+            tags.get(tag.id) or TagSerializer(tag).data
+            for tag in obj.tags.all()
+        ]
+
     def get_is_favorited(self, obj):
-        request = self.context.get('request')
-        return (
-            request and request.user.is_authenticated
-            and Favourites.objects.filter(
-                recipe=obj, user=request.user
-            ).exists()
-        )
+        return get_user_state(
+            self.context.get('request')
+        ).is_favorited(obj.id)
 
     def get_is_in_shopping_cart(self, obj):
-        request = self.context.get('request')
-        return (
-            request and request.user.is_authenticated
-            and ShopList.objects.filter(
-                recipe=obj, user=request.user
-            ).exists()
-        )
-
+        return get_user_state(
+            self.context.get('request')
+        ).is_in_shopping_cart(obj.id)
 
-class FavouritesSerializer(serializers.ModelSerializer):
-    """Преобразование данных класса Favourite"""
 
-    def validate(self, data):
-        request = self.context['request']
-
-        if request.method == 'POST':
-            if Favourites.objects.filter(
-                    user=data['user'], recipe=data['recipe']).exists():
-                raise serializers.ValidationError('Рецепт уже в избранном')
-        if request.method == 'DELETE':
-            if not Favourites.objects.filter(
-                    user=data['user'], recipe=data['recipe']
-            ).exists():
-                raise serializers.ValidationError("Рецепт не в избранном")
-        return data
-
-    class Meta:
-        model = Favourites
-        fields = (
-            'user',
-            'recipe'
-        )
+class RecipeIdsSerializer(serializers.Serializer):
+    """Список id рецептов для массового изменения избранного и покупок"""
 
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.BULK_RECIPES_LIMIT
+    )
 
-class ShopListSerializer(serializers.ModelSerializer):
-    """Преобразование данных класса ShopList"""
+    def validate_recipes(self, value):
+        return list(dict.fromkeys(value))
 
-    def validate(self, data):
-        requests = self.context['request']
 
-        if requests.method == 'POST':
-            if ShopList.objects.filter(
-                    user=data['user'], recipe=data['recipe']).exists():
-                raise serializers.ValidationError(
-                    'Рецепт уже в списке покупок')
-        if requests.method == "DELETE":
-            if not ShopList.objects.filter(
-                    user=data['user'], recipe=data['recipe']
-            ).exists():
-                raise serializers.ValidationError(
-                    'Рецепта нету в списке покупок')
-        return data
+class CartSummarySerializer(serializers.ModelSerializer):
+    """Преобразование данных класса CartSummary"""
 
     class Meta:
-        model = ShopList
+        model = CartSummary
         fields = (
-            'user',
-            'recipe'
+            'name',
+            'amount',
+            'measurement_unit'
         )
@@ -0,0 +1,691 @@
+import base64
+import io
+import json
+import os
+import tempfile
+from collections import Counter
+from unittest import mock
+
+import PIL.Image
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.client import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from foodgram.db.pool import ConnectionPool, PoolTimeoutError
+from recipes import (images, recommendations, relations, tasks, user_state,
+                     versions)
+from recipes.models import (Favourites, FeedEntry, Ingredient,
+                            IngredientAmount, Recipe, ShopList, Tag)
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from user.models import Subscription, User
+
+from .filters import RecipesFilter
+
+RECIPES = 12
+# Без кэша ответы, состояние пользователя и количество рецептов
+# загружаются в каждом запросе
+NO_CACHE = {
+    'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}
+}
+# Признаки устранения дубликатов рецептов в плане запроса. PostgreSQL
+# может группировать внутреннюю сторону полусоединения
+# (Group Key: u0.recipe_id) — это не DISTINCT по рецептам
+DEDUPLICATION = {
+    'sqlite': ('DISTINCT',),
+    'postgresql': ('Unique', 'Group Key: recipes_recipe.'),
+}
+
+
+# Фоновые задачи выполняются сразу после фиксации транзакции
+@override_settings(CACHES=NO_CACHE, DRF_API_LOGGER_DATABASE=False,
+                   IMAGE_WORKERS=0, FEED_WORKERS=0)
+class RecipesTestCase(TestCase):
+    """Рецепты разных авторов с тегами, избранным и покупками читателя"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='reader', email='reader@example.com',
+            password='password', first_name='Reader', last_name='Reader'
+        )
+        authors = [
+            User.objects.create_user(
+                username=f'author{index}',
+                email=f'author{index}@example.com', password='password',
+                first_name='Author', last_name='Author'
+            )
+            for index in range(3)
+        ]
+        tags = [
+            Tag.objects.create(name=f'Тег {index}', color='#E26C2D',
+                               slug=f'tag{index}')
+            for index in range(3)
+        ]
+        ingredients = [
+            Ingredient.objects.create(name=f'Ингредиент {index}',
+                                      measurement_unit='г')
+            for index in range(5)
+        ]
+        for index in range(RECIPES):
+            recipe = Recipe.objects.create(
+                author=authors[index % len(authors)], name=f'Рецепт {index}',
+                image='recipes/recipe.png', text='Описание', cooking_time=10
+            )
+            recipe.tags.set(tags[:index % len(tags) + 1])
+            IngredientAmount.objects.bulk_create(
+                IngredientAmount(recipes=recipe, ingredient=ingredient,
+                                 amount=index + 1)
+                for ingredient in ingredients[:index % len(ingredients) + 1]
+            )
+            if index % 2:
+                Favourites.objects.create(user=cls.user, recipe=recipe)
+            if index % 3:
+                ShopList.objects.create(user=cls.user, recipe=recipe)
+        Subscription.objects.create(user=cls.user, author=authors[0])
+        cls.token = Token.objects.create(user=cls.user)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+
+class RecipeListQueriesTest(RecipesTestCase):
+    """Количество запросов списка рецептов не зависит от размера страницы"""
+
+    def get_list(self, limit):
+        response = self.client.get('/api/recipes/', {'limit': limit})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), limit)
+        return response
+
+    def assert_queries_do_not_depend_on_page_size(self):
+        # Справочники тегов и ингредиентов загружаются первым запросом
+        self.get_list(1)
+        with CaptureQueriesContext(connection) as context:
+            self.get_list(2)
+        with self.assertNumQueries(len(context.captured_queries)):
+            self.get_list(RECIPES)
+
+    def test_queries_do_not_depend_on_page_size(self):
+        self.assert_queries_do_not_depend_on_page_size()
+
+    def test_anonymous_queries_do_not_depend_on_page_size(self):
+        self.client.credentials()
+        self.assert_queries_do_not_depend_on_page_size()
+
+
+class RecipeFilterPlanTest(RecipesTestCase):
+    """Фильтры списка рецептов используют индексы и не требуют DISTINCT"""
+
+    def get_plan(self, data):
+        request = RequestFactory().get('/')
+        request.user = self.user
+        queryset = RecipesFilter(
+            data, Recipe.objects.all(), request=request
+        ).qs
+        self.assertFalse(queryset.query.distinct)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+            # На маленьких таблицах PostgreSQL всегда выбирает Seq Scan
+            if connection.vendor == 'postgresql':
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        plan = queryset.explain()
+        for marker in DEDUPLICATION.get(connection.vendor, ()):
+            self.assertNotIn(marker, plan)
+        return plan
+
+    def test_tags_filter_uses_index(self):
+        self.assertIn(
+            'recipe_tags_tag_recipe_idx',
+            self.get_plan({'tags': ['tag0', 'tag1']})
+        )
+
+    def test_user_filters_use_indexes(self):
+        self.assertIn('favourites_user_recipe_idx', self.get_plan({
+            'tags': ['tag0', 'tag1'], 'is_favorited': 'true',
+            'is_in_shopping_cart': 'true',
+        }))
+
+
+class CountersTest(RecipesTestCase):
+    """Счётчики рецептов и пользователей совпадают с данными"""
+
+    def assert_counters(self):
+        for recipe in Recipe.objects.all():
+            self.assertEqual(recipe.favourites_count,
+                             recipe.favourites.count())
+            self.assertEqual(recipe.in_cart_count, recipe.shop_list.count())
+        for user in User.objects.all():
+            self.assertEqual(user.recipes_count, user.recipes.count())
+            self.assertEqual(user.subscribers_count,
+                             user.author.count())
+
+    def test_counters_follow_relations(self):
+        self.assert_counters()
+        recipe = Recipe.objects.get(name='Рецепт 1')
+        self.client.delete(f'/api/recipes/{recipe.pk}/favorite/')
+        self.client.post(f'/api/recipes/{recipe.pk}/shopping_cart/')
+        self.assert_counters()
+
+    def test_full_save_keeps_counters(self):
+        recipe = Recipe.objects.get(name='Рецепт 0')
+        author = User.objects.get(pk=recipe.author_id)
+        Favourites.objects.create(user=self.user, recipe=recipe)
+        Subscription.objects.create(user=author, author=author)
+        recipe.name = 'Новое название'
+        recipe.save()
+        author.first_name = 'Новое имя'
+        author.save()
+        recipe.refresh_from_db()
+        author.refresh_from_db()
+        self.assertEqual(recipe.name, 'Новое название')
+        self.assertEqual(author.first_name, 'Новое имя')
+        self.assert_counters()
+
+
+class SearchTest(RecipesTestCase):
+    """Поиск находит рецепты по ингредиентам и тегам"""
+
+    def search(self, text):
+        response = self.client.get('/api/recipes/', {'search': text})
+        self.assertEqual(response.status_code, 200)
+        return {recipe['name'] for recipe in response.json()['results']}
+
+    def test_search_by_ingredient(self):
+        ingredient = Ingredient.objects.get(name='Ингредиент 4')
+        ingredient.name = 'Шафран'
+        ingredient.save()
+        self.assertEqual(self.search('шафр'), {'Рецепт 4', 'Рецепт 9'})
+
+    def test_search_by_tag(self):
+        tag = Tag.objects.get(slug='tag2')
+        tag.name = 'Десерт'
+        tag.save()
+        self.assertEqual(
+            self.search('десерт'),
+            {f'Рецепт {index}' for index in range(2, RECIPES, 3)}
+        )
+
+
+class RecipeCursorPaginationTest(RecipesTestCase):
+    """Курсор списка рецептов не теряет и не повторяет рецепты"""
+
+    def setUp(self):
+        super().setUp()
+        self.pub_date = Recipe.objects.earliest('pub_date').pub_date
+        Recipe.objects.update(pub_date=self.pub_date)
+
+    def get_page(self, url, data=None):
+        response = self.client.get(url, data)
+        self.assertEqual(response.status_code, 200)
+        page = response.json()
+        return [recipe['id'] for recipe in page['results']], page
+
+    def test_pages_with_equal_pub_date(self):
+        ids, page = self.get_page(
+            '/api/recipes/', {'pagination': 'cursor', 'limit': 5}
+        )
+        # Новый рецепт с той же датой встаёт перед курсором
+        # и не сдвигает следующие страницы
+        recipe = Recipe.objects.create(
+            author=self.user, name='Новый', image='recipes/recipe.png',
+            text='Описание', cooking_time=10
+        )
+        Recipe.objects.filter(pk=recipe.pk).update(pub_date=self.pub_date)
+        pages = [ids]
+        while page['next']:
+            ids, page = self.get_page(page['next'])
+            pages.append(ids)
+        self.assertEqual([len(ids) for ids in pages], [5, 5, 2])
+        self.assertEqual(
+            [pk for ids in pages for pk in ids],
+            sorted(Recipe.objects.exclude(pk=recipe.pk)
+                   .values_list('pk', flat=True), reverse=True)
+        )
+        previous, _ = self.get_page(page['previous'])
+        self.assertEqual(previous, pages[1])
+
+
+LOCAL_CACHE = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'response-cache-test',
+    }
+}
+
+
+# Кэш в памяти процесса заменяет общий кэш в тестах
+@override_settings(CACHES=LOCAL_CACHE, SHARED_CACHE=True)
+class ResponseCacheTest(RecipesTestCase):
+    """Кэш ответов сбрасывается изменениями и требует общего кэша"""
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.recipe = Recipe.objects.get(name='Рецепт 0')
+        self.url = f'/api/recipes/{self.recipe.pk}/'
+
+    def get(self, url, **headers):
+        response = self.client.get(url, **headers)
+        self.assertIn(response.status_code, (200, 304))
+        return response
+
+    def test_recipe_change_invalidates_response(self):
+        self.assertEqual(self.get(self.url)['X-Cache'], 'MISS')
+        response = self.get(self.url)
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertEqual(
+            self.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+            .status_code, 304
+        )
+        self.recipe.name = 'Новое название'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.recipe.save()
+        response = self.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.json()['name'], 'Новое название')
+
+    def test_list_follows_recipe_changes(self):
+        self.assertEqual(self.get('/api/recipes/')['X-Cache'], 'MISS')
+        self.assertEqual(self.get('/api/recipes/')['X-Cache'], 'HIT')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.recipe.tags.clear()
+        self.assertEqual(self.get('/api/recipes/')['X-Cache'], 'MISS')
+
+    @override_settings(SHARED_CACHE=False)
+    def test_no_response_cache_without_shared_cache(self):
+        for _ in range(2):
+            self.assertNotIn('X-Cache', self.get(self.url))
+            self.assertNotIn('X-Cache', self.get('/api/recipes/'))
+        self.assertIsNone(cache.get(versions.FEED_KEY))
+
+
+@override_settings(CACHES=LOCAL_CACHE, SHARED_CACHE=True)
+class RelationsTest(RecipesTestCase):
+    """Пакетные изменения избранного и списка покупок"""
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.recipes = list(Recipe.objects.filter(
+            name__in=['Рецепт 0', 'Рецепт 2', 'Рецепт 4']
+        ))
+        self.ids = [recipe.pk for recipe in self.recipes]
+
+    def get_counts(self):
+        return dict(Recipe.objects.filter(pk__in=self.ids).values_list(
+            'pk', 'favourites_count'
+        ))
+
+    def test_add_and_remove(self):
+        counts = self.get_counts()
+        with self.captureOnCommitCallbacks(execute=True):
+            results = relations.add(Favourites, self.user.pk,
+                                    [*self.ids, 0])
+        self.assertEqual(results, {**dict.fromkeys(self.ids, relations.ADDED),
+                                   0: relations.NOT_FOUND})
+        self.assertEqual(
+            self.get_counts(), {pk: count + 1 for pk, count in counts.items()}
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            results = relations.remove(Favourites, self.user.pk, self.ids)
+        self.assertEqual(results, dict.fromkeys(self.ids, relations.REMOVED))
+        self.assertEqual(self.get_counts(), counts)
+
+    def test_state_invalidated_after_commit(self):
+        key = user_state.CACHE_KEY.format(self.user.pk)
+        state = user_state.load(self.user.pk)
+        self.assertFalse(state.is_favorited(self.ids[0]))
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            relations.add(Favourites, self.user.pk, self.ids)
+            # До фиксации параллельный запрос видит старые данные,
+            # поэтому закэшированное состояние ещё не сбрасывается
+            self.assertIsNotNone(cache.get(key))
+        self.assertTrue(callbacks)
+        self.assertIsNone(cache.get(key))
+        self.assertTrue(
+            user_state.load(self.user.pk).is_favorited(self.ids[0])
+        )
+
+    def test_concurrent_insert_is_not_counted(self):
+        favourite = Recipe.objects.get(name='Рецепт 1')
+        counts = self.get_counts()
+        # Строку вставил параллельный запрос после проверки
+        with mock.patch.object(
+            relations, 'check',
+            return_value=dict.fromkeys([favourite.pk, *self.ids], False)
+        ), self.captureOnCommitCallbacks(execute=True):
+            results = relations.add(Favourites, self.user.pk,
+                                    [favourite.pk, *self.ids])
+        self.assertEqual(results[favourite.pk], relations.EXISTS)
+        favourite.refresh_from_db()
+        self.assertEqual(favourite.favourites_count,
+                         favourite.favourites.count())
+        self.assertEqual(
+            self.get_counts(), {pk: count + 1 for pk, count in counts.items()}
+        )
+
+
+class ThumbnailsTest(RecipesTestCase):
+    """Миниатюры создаются после сохранения рецепта"""
+
+    def setUp(self):
+        super().setUp()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+
+    def create_recipe(self, image):
+        return self.client.post('/api/recipes/', {
+            'name': 'С картинкой', 'text': 'Описание', 'cooking_time': 5,
+            'tags': [Tag.objects.first().pk],
+            'ingredients': [
+                {'id': Ingredient.objects.first().pk, 'amount': 10}
+            ],
+            'image': image,
+        }, format='json')
+
+    def test_thumbnails_after_commit(self):
+        buffer = io.BytesIO()
+        PIL.Image.new('RGB', (800, 600), 'orange').save(buffer, 'PNG')
+        image = base64.b64encode(buffer.getvalue()).decode()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.create_recipe(f'data:image/png;base64,{image}')
+            self.assertEqual(response.status_code, 201)
+            recipe = response.json()
+            # До фиксации миниатюр нет: отдаётся исходная картинка
+            self.assertEqual(set(recipe['thumbnails'].values()),
+                             {recipe['image']})
+            self.assertTrue(default_storage.exists(
+                Recipe.objects.get(pk=recipe['id']).image.name
+            ))
+        self.assertTrue(Recipe.objects.get(pk=recipe['id']).thumbnails_ready)
+        thumbnails = self.client.get(
+            f'/api/recipes/{recipe["id"]}/'
+        ).json()['thumbnails']
+        for label, size in settings.RECIPE_THUMBNAIL_SIZES.items():
+            self.assertIn(images.THUMBNAIL_DIR, thumbnails[label])
+            name = images.thumbnail_name(recipe['image'], size)
+            with default_storage.open(name) as file:
+                self.assertEqual(max(PIL.Image.open(file).size), size)
+
+    def test_invalid_image(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            response = self.create_recipe('data:image/png;base64,bm90IGltYWdl')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(callbacks, [])
+
+
+@override_settings(FEED_FANOUT_LIMIT=1)
+class FeedTest(RecipesTestCase):
+    """Лента подписок с рассылкой и чтением рецептов крупных авторов"""
+
+    def setUp(self):
+        super().setUp()
+        self.author = User.objects.get(username='author0')
+        self.follower = User.objects.get(username='author1')
+
+    def get_feed(self):
+        ids = []
+        url, data = '/api/recipes/feed/', {'limit': 2}
+        while url:
+            response = self.client.get(url, data)
+            self.assertEqual(response.status_code, 200)
+            page = response.json()
+            ids.extend(recipe['id'] for recipe in page['results'])
+            url, data = page['next'], None
+        return ids
+
+    def get_author_recipes(self):
+        return list(self.author.recipes.order_by(
+            '-pub_date', '-id'
+        ).values_list('pk', flat=True))
+
+    def test_feed_after_author_falls_below_limit(self):
+        self.assertEqual(self.get_feed(), self.get_author_recipes())
+        with self.captureOnCommitCallbacks(execute=True):
+            Subscription.objects.create(user=self.follower,
+                                        author=self.author)
+        # Рецепт крупного автора не рассылается и читается при запросе
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe = Recipe.objects.create(
+                author=self.author, name='Новый', image='recipes/recipe.png',
+                text='Описание', cooking_time=10
+            )
+        self.assertFalse(FeedEntry.objects.filter(recipe=recipe).exists())
+        self.assertEqual(self.get_feed(), self.get_author_recipes())
+        with self.captureOnCommitCallbacks(execute=True):
+            Subscription.objects.filter(user=self.follower,
+                                        author=self.author).delete()
+        self.assertTrue(FeedEntry.objects.filter(
+            user=self.user, recipe=recipe
+        ).exists())
+        self.assertEqual(self.get_feed(), self.get_author_recipes())
+
+
+class ShoppingCartTest(RecipesTestCase):
+    """Итог списка покупок следует за покупками и рецептами"""
+
+    url = '/api/recipes/download_shopping_cart/'
+
+    def get_expected(self):
+        totals = Counter()
+        for name, amount in IngredientAmount.objects.filter(
+            recipes__shop_list__user=self.user
+        ).values_list('ingredient__name', 'amount'):
+            totals[name] += amount
+        return dict(totals)
+
+    def download(self):
+        response = self.client.get(self.url, {'format': 'json'})
+        self.assertEqual(response.status_code, 200)
+        rows = json.loads(b''.join(response.streaming_content))
+        return {row['name']: row['amount'] for row in rows}, response['ETag']
+
+    def test_summary_follows_changes(self):
+        summary, etag = self.download()
+        self.assertEqual(summary, self.get_expected())
+        added, removed = Recipe.objects.filter(
+            name__in=['Рецепт 3', 'Рецепт 4']
+        ).order_by('name')
+        self.client.post(f'/api/recipes/{added.pk}/shopping_cart/')
+        self.client.delete(f'/api/recipes/{removed.pk}/shopping_cart/')
+        amount = IngredientAmount.objects.filter(
+            recipes__name='Рецепт 5'
+        ).first()
+        amount.amount += 5
+        amount.save()
+        summary, changed_etag = self.download()
+        self.assertEqual(summary, self.get_expected())
+        self.assertNotEqual(changed_etag, etag)
+
+    def test_repeat_download_not_modified(self):
+        _, etag = self.download()
+        response = self.client.get(self.url, {'format': 'json'},
+                                   HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_formats(self):
+        for format in ('txt', 'csv', 'pdf'):
+            with self.subTest(format=format):
+                response = self.client.get(self.url, {'format': format})
+                self.assertEqual(response.status_code, 200)
+                self.assertTrue(b''.join(response.streaming_content))
+        self.assertEqual(
+            self.client.get(self.url, {'format': 'xml'}).status_code, 400
+        )
+
+
+class LoaderTest(RecipesTestCase):
+    """Загрузка справочников идемпотентна и отбрасывает дубликаты"""
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def write(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(content)
+        return path
+
+    def load(self, ingredients, tags):
+        call_command('add_ingredients', ingredients=ingredients, tags=tags,
+                     chunk_size=2, stdout=io.StringIO())
+
+    def test_load_is_idempotent(self):
+        ingredients = self.write(
+            'ingredients.csv',
+            'name,measurement_unit\n\nсоль,г\nсахар,г\nсоль,г\n'
+            'Ингредиент 0,г\nмука,кг\n'
+        )
+        tags = self.write('tags.csv', 'Ужин,#8775D2,dinner\n'
+                                      'Тег 0,#E26C2D,tag0\n')
+        ingredients_count = Ingredient.objects.count()
+        tags_count = Tag.objects.count()
+        for _ in range(2):
+            self.load(ingredients, tags)
+            self.assertEqual(Ingredient.objects.count(),
+                             ingredients_count + 3)
+            self.assertEqual(Tag.objects.count(), tags_count + 1)
+        self.load(self.write('ingredients.json', json.dumps([
+            {'name': 'соль', 'measurement_unit': 'г'},
+            {'name': 'перец', 'measurement_unit': 'г'},
+        ], ensure_ascii=False)), tags)
+        self.assertEqual(Ingredient.objects.count(), ingredients_count + 4)
+        self.assertTrue(Ingredient.objects.filter(
+            name='мука', measurement_unit='кг'
+        ).exists())
+
+
+@override_settings(RECOMMENDATIONS_WORKERS=1)
+class RecommendationsTest(RecipesTestCase):
+    """Рекомендации по совместному добавлению в избранное"""
+
+    def setUp(self):
+        super().setUp()
+        self.recipes = {
+            recipe.name: recipe.pk for recipe in Recipe.objects.all()
+        }
+
+    def favour(self, username, *names):
+        user = User.objects.create_user(
+            username=username, email=f'{username}@example.com',
+            password='password', first_name='User', last_name='User'
+        )
+        relations.add(Favourites, user.pk,
+                      [self.recipes[name] for name in names])
+
+    def get_recommended(self):
+        response = self.client.get('/api/recipes/recommended/')
+        self.assertEqual(response.status_code, 200)
+        return [recipe['id'] for recipe in response.json()['results']]
+
+    def test_recommendations_follow_co_favourites(self):
+        # Все рецепты, кроме 0 и 6, уже есть у читателя
+        self.favour('first', 'Рецепт 0', 'Рецепт 1')
+        call_command('build_recommendations', full=True,
+                     stdout=io.StringIO())
+        self.assertEqual(self.get_recommended(), [self.recipes['Рецепт 0']])
+        self.favour('second', 'Рецепт 6', 'Рецепт 2', 'Рецепт 4')
+        self.assertGreater(recommendations.build(), 0)
+        self.assertEqual(set(self.get_recommended()),
+                         {self.recipes['Рецепт 0'], self.recipes['Рецепт 6']})
+
+
+class SparseFieldsTest(RecipesTestCase):
+    """Выбор полей ответа сокращает и данные, и запросы к БД"""
+
+    def get_list(self, **params):
+        response = self.client.get('/api/recipes/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()['results']
+
+    def test_relations_collapse_to_ids(self):
+        recipes = self.get_list(fields='id,author,tags')
+        authors = dict(Recipe.objects.values_list('pk', 'author_id'))
+        for recipe in recipes:
+            self.assertEqual(set(recipe), {'id', 'author', 'tags'})
+            self.assertEqual(recipe['author'], authors[recipe['id']])
+            self.assertTrue(all(isinstance(tag, int)
+                                for tag in recipe['tags']))
+
+    def test_expand_and_nested_fields(self):
+        recipe = self.get_list(fields='id,tags', expand='tags')[0]
+        self.assertEqual(set(recipe['tags'][0]),
+                         {'id', 'name', 'color', 'slug'})
+        recipe = self.get_list(fields='id,author.username')[0]
+        self.assertEqual(set(recipe['author']), {'username'})
+
+    def test_card_profile_needs_fewer_queries(self):
+        # Справочники загружаются первым запросом
+        self.get_list()
+        with CaptureQueriesContext(connection) as full:
+            self.get_list()
+        with CaptureQueriesContext(connection) as card:
+            recipes = self.get_list(profile='card')
+        self.assertLess(len(card), len(full))
+        self.assertNotIn('text', recipes[0])
+        self.assertNotIn('author', recipes[0])
+
+    def test_unknown_field(self):
+        response = self.client.get('/api/recipes/', {'fields': 'id,secret'})
+        self.assertEqual(response.status_code, 400)
+
+
+class FakeConnection:
+    closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class ConnectionPoolTest(TestCase):
+    """Пул соединений и возврат соединений фоновыми задачами"""
+
+    def test_connections_are_reused(self):
+        pool = ConnectionPool(max_size=2, timeout=1, max_lifetime=60)
+        connection = pool.acquire(FakeConnection)
+        pool.release(connection)
+        self.assertIs(pool.acquire(FakeConnection), connection)
+        stats = pool.stats()
+        self.assertEqual((stats['created'], stats['reused'],
+                          stats['in_use']), (1, 1, 1))
+
+    def test_broken_and_old_connections_are_closed(self):
+        pool = ConnectionPool(max_size=1, timeout=1, max_lifetime=60)
+        broken = pool.acquire(FakeConnection)
+        pool.release(broken)
+        connection = pool.acquire(FakeConnection, check=lambda conn: False)
+        self.assertIsNot(connection, broken)
+        self.assertTrue(broken.closed)
+        pool.max_lifetime = -1
+        pool.release(connection)
+        self.assertTrue(connection.closed)
+        self.assertEqual(pool.stats()['discarded'], 2)
+        self.assertEqual(pool.stats()['in_use'], 0)
+
+    def test_timeout_when_pool_is_exhausted(self):
+        pool = ConnectionPool(max_size=1, timeout=0.01, max_lifetime=60)
+        pool.acquire(FakeConnection)
+        with self.assertRaises(PoolTimeoutError):
+            pool.acquire(FakeConnection)
+        self.assertEqual(pool.stats()['timeouts'], 1)
+
+    def test_task_returns_connections(self):
+        def fail():
+            raise ValueError
+
+        with mock.patch.object(tasks.connections, 'close_all') as close_all:
+            self.assertEqual(tasks.run_task(sum, [1, 2]), 3)
+            with self.assertRaises(ValueError):
+                tasks.run_task(fail)
+        self.assertEqual(close_all.call_count, 2)
@@ -36,6 +36,11 @@ router.register(
 )
 
 urlpatterns = [
+    path('metrics/', views.MetricsView.as_view(), name='metrics'),
+    path('metrics/slow/', views.SlowRequestsView.as_view(),
+         name='slow_requests'),
+    path('cache/stats/', views.ResponseCacheStatsView.as_view(),
+         name='cache_stats'),
     path('', include(router.urls)),
     path(r'auth/', include('djoser.urls')),
     path(r'auth/', include('djoser.urls.authtoken')),
@@ -1,29 +1,80 @@
-from django.db.models import Sum
-from django.http import HttpResponse
+from functools import partial
+
+from django.conf import settings
+from django.db.models import Count, Max
+from django.http import (Http404, HttpResponse, HttpResponseRedirect,
+                         StreamingHttpResponse)
 from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.utils.cache import get_conditional_response
+from django.utils.functional import cached_property
+from django.utils.http import http_date
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet as DjoserUserViewSet
-from recipes.models import (Favourites, Ingredient, IngredientAmount, Recipe,
+from recipes import (autocomplete, catalog, feed, recommendations, reference,
+                     relations, versions)
+from recipes.models import (CartSummary, Favourites, Ingredient, Recipe,
                             ShopList, Tag)
-from rest_framework import filters, mixins, status, viewsets
+from rest_framework import filters, mixins, serializers, status, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.views import APIView
 from user.models import Subscription, User
 
-from .filters import IngredientFilter, RecipesFilter
-from .pagination import CustomPagination
+from . import fieldsets, metrics
+from .exporters import EXPORTERS
+from .filters import IngredientFilter, RecipeSearchFilter, RecipesFilter
+from .pagination import (CustomPagination, FeedPagination, RecipePagination,
+                         SubscriptionPagination)
 from .permissions import IsAuthorOrReadOnly
-from .serializers import (FavouritesSerializer, IngredientSerializer,
-                          RecipeReadSerializer, RecipeWriteSerializer,
-                          ShopListSerializer, SubscriptionSerializer,
-                          TagSerializer, UserReadSerializer)
+from .renderers import FAST_RENDERER_CLASSES
+from .response_cache import CachedResponseMixin, get_stats
+from .serializers import (CartSummarySerializer, IngredientSerializer,
+                          RecipeIdsSerializer, RecipeReadSerializer,
+                          RecipeWriteSerializer, SparseFieldsMixin,
+                          SubscriptionSerializer, TagSerializer,
+                          UserReadSerializer, attach_recipe_previews,
+                          get_recipes_limit)
+
+ALREADY_ADDED = {
+    Favourites: 'Рецепт уже в избранном',
+    ShopList: 'Рецепт уже в списке покупок',
+}
+# Ошибки поля recipe в тех же формулировках, что у сериализаторов
+RECIPE_ERRORS = serializers.PrimaryKeyRelatedField.default_error_messages
+USER_COLUMNS = ('username', 'email', 'first_name', 'last_name')
+# Версионированный каталог не меняется: новая версия — новый адрес
+IMMUTABLE = 'public, max-age=31536000, immutable'
 
 
-class UserViewSet(DjoserUserViewSet):
+class UserViewSet(metrics.SerializerTimerMixin, DjoserUserViewSet):
     """View-класс реализующий операции модели User"""
 
     queryset = User.objects.all()
     serializer_class = UserReadSerializer
+    renderer_classes = FAST_RENDERER_CLASSES
+
+    @cached_property
+    def fieldset(self):
+        if self.request.method != 'GET':
+            return fieldsets.FULL
+        return fieldsets.get_fieldset(self.request, UserReadSerializer)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.fieldset.fields is None:
+            return queryset
+        return queryset.only('id', *(
+            name for name in self.fieldset.fields if name in USER_COLUMNS
+        ))
+
+    def get_serializer(self, *args, **kwargs):
+        if issubclass(self.get_serializer_class(), SparseFieldsMixin):
+            kwargs.setdefault('fieldset', self.fieldset)
+        return super().get_serializer(*args, **kwargs)
 
     @action(detail=True,
             methods=['post', 'delete'],
@@ -41,27 +92,63 @@ class UserViewSet(DjoserUserViewSet):
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(methods=['get'], detail=False,
-            pagination_class=CustomPagination)
+            pagination_class=SubscriptionPagination)
     def subscriptions(self, request):
         if self.request.user.is_anonymous:
             return Response(status=status.HTTP_401_UNAUTHORIZED)
+        limit = get_recipes_limit(request)
         pages = self.paginate_queryset(
             User.objects.filter(author__user=self.request.user)
         )
+        attach_recipe_previews(pages, limit)
+        self.start_serialization()
         serializer = SubscriptionSerializer(pages, many=True,
                                             context={'request': request})
         return self.get_paginated_response(serializer.data)
 
 
 class ListRetrieveViewSet(
+    metrics.SerializerTimerMixin,
     mixins.ListModelMixin,
     mixins.RetrieveModelMixin,
     viewsets.GenericViewSet
 ):
-    """Mixins классов Tag и Ingredients."""
+    """Mixins классов Tag и Ingredients.
+    Список без параметров и отдельный объект берутся из справочника
+    в памяти; список отдаётся готовым JSON с сильным ETag"""
     pagination_class = None
+    renderer_classes = FAST_RENDERER_CLASSES
     filter_backends = (filters.SearchFilter, DjangoFilterBackend,)
     search_fields = ('name',)
+    reference_data = None
+
+    def use_reference(self, request):
+        return (
+            self.reference_data is not None
+            and request.accepted_renderer.format == 'json'
+        )
+
+    def list(self, request, *args, **kwargs):
+        if request.query_params or not self.use_reference(request):
+            return super().list(request, *args, **kwargs)
+        snapshot = self.reference_data()
+        response = get_conditional_response(request, etag=snapshot.etag)
+        if response is None:
+            response = HttpResponse(snapshot.content,
+                                    content_type='application/json')
+        response['ETag'] = snapshot.etag
+        return response
+
+    def retrieve(self, request, *args, **kwargs):
+        if not self.use_reference(request):
+            return super().retrieve(request, *args, **kwargs)
+        try:
+            item = self.reference_data().get(int(kwargs['pk']))
+        except ValueError:
+            item = None
+        if item is None:
+            raise Http404
+        return Response(item)
 
 
 class TagViewSet(ListRetrieveViewSet):
@@ -69,6 +156,7 @@ class TagViewSet(ListRetrieveViewSet):
 
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
+    reference_data = staticmethod(reference.tags)
 
 
 class IngredientViewSet(ListRetrieveViewSet):
@@ -77,83 +165,346 @@ class IngredientViewSet(ListRetrieveViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     filterset_class = IngredientFilter
+    reference_data = staticmethod(reference.ingredients)
 
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get('name')
+        if not name or 'search' in request.query_params:
+            return super().list(request, *args, **kwargs)
+        return Response(autocomplete.get_index().search(
+            name, self.get_limit(request)
+        ))
+
+    @action(detail=False, url_path='bundle')
+    def bundle(self, request):
+        """Переадресация на текущую версию каталога ингредиентов"""
+        return self.redirect_to_bundle(request, catalog.get_bundle())
+
+    @action(detail=False, url_path=r'bundle/(?P<version>[0-9a-f]+)')
+    def versioned_bundle(self, request, version):
+        """
+        Весь каталог ингредиентов одним сжатым JSON для поиска
+        на клиенте. Ответ кэшируется навсегда: при изменении
+        ингредиентов меняется версия в адресе
+        """
+        bundle = catalog.get_bundle()
+        if version != bundle.version:
+            return self.redirect_to_bundle(request, bundle)
+        encoding = self.get_encoding(request, bundle.encodings)
+        etag = (f'"{bundle.version}"' if encoding == catalog.IDENTITY
+                else f'"{bundle.version}-{encoding}"')
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = HttpResponse(bundle.encodings[encoding],
+                                    content_type='application/json')
+            if encoding != catalog.IDENTITY:
+                response['Content-Encoding'] = encoding
+        response['ETag'] = etag
+        response['Cache-Control'] = IMMUTABLE
+        response['Vary'] = 'Accept-Encoding'
+        return response
+
+    @staticmethod
+    def redirect_to_bundle(request, bundle):
+        response = HttpResponseRedirect(request.build_absolute_uri(
+            reverse('ingredients-versioned-bundle',
+                    kwargs={'version': bundle.version})
+        ))
+        response['Cache-Control'] = 'no-cache'
+        return response
+
+    @staticmethod
+    def get_encoding(request, encodings):
+        """Первая из encodings, которую принимает клиент"""
+        accepted = set()
+        for item in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+            name, _, params = item.partition(';')
+            params = params.replace(' ', '')
+            try:
+                weight = float(params[2:]) if params.startswith('q=') else 1
+            except ValueError:
+                weight = 1
+            if weight > 0:
+                accepted.add(name.strip().lower())
+        for encoding in encodings:
+            if encoding in accepted or '*' in accepted:
+                return encoding
+        return catalog.IDENTITY
+
+    @staticmethod
+    def get_limit(request):
+        limit = request.query_params.get(
+            'limit', settings.INGREDIENT_AUTOCOMPLETE_LIMIT
+        )
+        try:
+            limit = int(limit)
+        except ValueError:
+            raise ValidationError({'limit': 'Ожидается целое число'})
+        return max(1, min(limit, settings.INGREDIENT_AUTOCOMPLETE_LIMIT))
 
-class RecipeViewSet(viewsets.ModelViewSet):
+
+class RecipeViewSet(
+    metrics.SerializerTimerMixin,
+    CachedResponseMixin,
+    viewsets.ModelViewSet
+):
     """View-класс реализующий операции модели Recipe"""
 
     queryset = Recipe.objects.all()
+    cached_actions = ('list', 'retrieve')
+    renderer_classes = FAST_RENDERER_CLASSES
     permissions = [IsAuthorOrReadOnly]
-    pagination_class = CustomPagination
-    filter_backends = (filters.SearchFilter, DjangoFilterBackend,)
+    pagination_class = RecipePagination
+    filter_backends = (RecipeSearchFilter, DjangoFilterBackend,)
     search_fields = ('name',)
     filterset_class = RecipesFilter
 
+    @cached_property
+    def fieldset(self):
+        if self.request.method != 'GET':
+            return fieldsets.FULL
+        return fieldsets.get_fieldset(self.request, RecipeReadSerializer)
+
+    def get_queryset(self):
+        if self.request.method != 'GET':
+            return Recipe.objects.all()
+        fieldset = self.fieldset
+        queryset = Recipe.objects.with_related(
+            author=fieldset.includes('author') and fieldset.expands('author'),
+            tags=fieldset.includes('tags'),
+            ingredients=fieldset.includes('ingredients')
+        )
+        # Поисковый вектор в ответ не входит
+        if fieldset.includes('text'):
+            return queryset.defer('search_vector')
+        return queryset.defer('search_vector', 'text')
+
+    def get_serializer(self, *args, **kwargs):
+        if self.get_serializer_class() is RecipeReadSerializer:
+            kwargs.setdefault('fieldset', self.fieldset)
+        return super().get_serializer(*args, **kwargs)
+
+    def get_cache_version(self, request):
+        if self.action == 'list':
+            return versions.feed_version()
+        try:
+            return versions.recipe_version(int(self.kwargs['pk']))
+        except ValueError:
+            return None
+
+    def list(self, request, *args, **kwargs):
+        response = self.get_cached_response(request)
+        if response is not None:
+            return response
+        return super().list(request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        response = self.get_cached_response(request)
+        if response is not None:
+            return response
+        return super().retrieve(request, *args, **kwargs)
+
     def get_serializer_class(self):
         if self.request.method == 'GET':
             return RecipeReadSerializer
         return RecipeWriteSerializer
 
+    def perform_content_negotiation(self, request, force=False):
+        # В выгрузке списка покупок ?format= выбирает формат файла,
+        # а не рендерер DRF, поэтому неизвестный формат не должен давать 404
+        return super().perform_content_negotiation(
+            request,
+            force=force or self.action == 'download_shopping_cart'
+        )
+
     @action(detail=True,
             methods=['post'],
-            permission_classes=(IsAuthorOrReadOnly,))
+            permission_classes=(IsAuthenticated,))
     def favorite(self, request, **kwargs):
-        return self.create_obj(kwargs['pk'], request,
-                               FavouritesSerializer)
+        return self.create_obj(kwargs['pk'], request, Favourites)
 
     @favorite.mapping.delete
     def delete_favourite(self, request, **kwargs):
-        return self.delete_obj(kwargs['pk'], request,
-                               Favourites)
+        return self.delete_obj(kwargs['pk'], request, Favourites)
+
+    @action(detail=False,
+            methods=['post', 'delete'],
+            url_path='favorite',
+            url_name='favorite-bulk',
+            permission_classes=(IsAuthenticated,))
+    def favorite_bulk(self, request):
+        return self.change_many(request, Favourites)
 
     @action(detail=True,
             methods=['post'],
-            permission_classes=(IsAuthorOrReadOnly,))
+            permission_classes=(IsAuthenticated,))
     def shopping_cart(self, request, **kwargs):
-        return self.create_obj(kwargs['pk'], request,
-                               ShopListSerializer)
+        return self.create_obj(kwargs['pk'], request, ShopList)
 
     @shopping_cart.mapping.delete
     def delete_shopping_cart(self, request, **kwargs):
-        return self.delete_obj(kwargs['pk'], request,
-                               ShopList)
+        return self.delete_obj(kwargs['pk'], request, ShopList)
 
     @action(detail=False,
             methods=['get'],
-            permission_classes=(IsAuthorOrReadOnly,))
+            permission_classes=(IsAuthenticated,))
     def download_shopping_cart(self, request):
-        ingredients = (
-            IngredientAmount.objects
-            .filter(recipes__shop_list__user=request.user)
-            .order_by('ingredient__name').values('ingredient')
-            .annotate(total_amount=Sum('amount'))
-            .values_list(
-                'ingredient__name', 'total_amount',
-                'ingredient__measurement_unit'
+        exporter_class = EXPORTERS.get(
+            request.query_params.get('format', 'txt')
+        )
+        if exporter_class is None:
+            raise ValidationError(
+                {'format': 'Доступные форматы: ' + ', '.join(EXPORTERS)}
             )
+        ingredients = CartSummary.objects.filter(user=request.user)
+        state = ingredients.aggregate(
+            count=Count('id'), updated_at=Max('updated_at')
+        )
+        updated_at = state['updated_at'] and state['updated_at'].timestamp()
+        etag = '"{}-{}-{}"'.format(
+            exporter_class.format, state['count'],
+            updated_at and int(updated_at * 1000000)
+        )
+        last_modified = updated_at and int(updated_at)
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if response is None:
+            response = self.download(exporter_class(ingredients.values_list(
+                'name', 'amount', 'measurement_unit'
+            ).iterator()))
+        response['ETag'] = etag
+        if last_modified:
+            response['Last-Modified'] = http_date(last_modified)
+        return response
+
+    @action(detail=False,
+            methods=['get'],
+            url_path='shopping_cart',
+            permission_classes=(IsAuthenticated,))
+    def shopping_cart_summary(self, request):
+        self.start_serialization()
+        return Response(CartSummarySerializer(
+            CartSummary.objects.filter(user=request.user), many=True
+        ).data)
+
+    @shopping_cart_summary.mapping.post
+    @shopping_cart_summary.mapping.delete
+    def shopping_cart_bulk(self, request):
+        return self.change_many(request, ShopList)
+
+    @action(detail=False,
+            methods=['get'],
+            permission_classes=(IsAuthenticated,),
+            pagination_class=CustomPagination)
+    def recommended(self, request):
+        return self.get_paginated_response(self.serialize_ids(
+            self.paginate_queryset(recommendations.recommend(request.user.id))
+        ))
+
+    @action(detail=False,
+            methods=['get'],
+            permission_classes=(IsAuthenticated,),
+            pagination_class=FeedPagination)
+    def feed(self, request):
+        page = self.paginator.paginate_timeline(
+            partial(feed.get_timeline, request.user.id), request
+        )
+        return self.get_paginated_response(
+            self.serialize_ids([pk for _, pk in page])
         )
-        return self.download(ingredients)
+
+    def serialize_ids(self, ids):
+        """Рецепты по списку id в его порядке"""
+        recipes = self.get_queryset().in_bulk(ids)
+        return self.get_serializer(
+            [recipes[pk] for pk in ids if pk in recipes], many=True
+        ).data
 
     @staticmethod
-    def create_obj(recipe_id, request, serializer):
-        data = {'user': request.user.id, 'recipe': recipe_id}
-        serializer = serializer(data=data, context={'request': request})
-        serializer.is_valid(raise_exception=True)
-        serializer.save()
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
+    def create_obj(recipe_id, request, model):
+        try:
+            recipe_id = int(recipe_id)
+        except ValueError:
+            raise ValidationError({'recipe': [
+                RECIPE_ERRORS['incorrect_type'].format(
+                    data_type=type(recipe_id).__name__
+                )
+            ]})
+        result = relations.add(model, request.user.id, [recipe_id])
+        if result[recipe_id] == relations.NOT_FOUND:
+            raise ValidationError({'recipe': [
+                RECIPE_ERRORS['does_not_exist'].format(pk_value=recipe_id)
+            ]})
+        if result[recipe_id] == relations.EXISTS:
+            raise ValidationError(
+                {api_settings.NON_FIELD_ERRORS_KEY: [ALREADY_ADDED[model]]}
+            )
+        return Response({'user': request.user.id, 'recipe': recipe_id},
+                        status=status.HTTP_201_CREATED)
 
     @staticmethod
     def delete_obj(recipe_id, request, model):
-        get_object_or_404(model, user=request.user,
-                          recipe=recipe_id).delete()
+        try:
+            recipe_id = int(recipe_id)
+        except ValueError:
+            raise Http404
+        result = relations.remove(model, request.user.id, [recipe_id])
+        if result[recipe_id] != relations.REMOVED:
+            raise Http404
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     @staticmethod
-    def download(obj):
-        file_list = []
-        [file_list.append('{} - {} {}.'.format(*value))
-         for value in obj]
-        file = HttpResponse('Список покупок: \n\n' + '\n'.join(file_list),
-                            content_type='text/plain')
-        file['Content-Disposition'] = 'attachment; filename=shopping_list'
+    def change_many(request, model):
+        """
+        Добавление (POST) или удаление (DELETE) списка рецептов
+        с результатом для каждого из них
+        """
+        serializer = RecipeIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        change = relations.add if request.method == 'POST' else (
+            relations.remove
+        )
+        results = change(model, request.user.id,
+                         serializer.validated_data['recipes'])
+        return Response({'results': [
+            {'recipe': pk, 'status': result}
+            for pk, result in results.items()
+        ]})
+
+    @staticmethod
+    def download(exporter):
+        file = StreamingHttpResponse(exporter,
+                                     content_type=exporter.content_type)
+        file['Content-Disposition'] = (
+            f'attachment; filename={exporter.filename}'
+        )
         return file
+
+
+class ResponseCacheStatsView(APIView):
+    """Счётчики кэша ответов текущего процесса"""
+
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request):
+        return Response(get_stats())
+
+
+class MetricsView(APIView):
+    """Метрики процесса в формате Prometheus"""
+
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request):
+        return HttpResponse(metrics.render(),
+                            content_type='text/plain; version=0.0.4')
+
+
+class SlowRequestsView(APIView):
+    """Самые медленные запросы процесса с их SQL"""
+
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request):
+        return Response(metrics.slow_requests.get())
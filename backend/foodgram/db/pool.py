@@ -0,0 +1,149 @@
+import os
+import threading
+import time
+from collections import Counter, deque
+
+
+class PoolTimeoutError(Exception):
+    """Свободное соединение не появилось за время ожидания"""
+
+
+class ConnectionPool:
+    """
+    Пул соединений DB-API процесса для многопоточных воркеров.
+    Соединения открываются по мере надобности, но не больше
+    max_size; если все заняты, поток ждёт освобождения не дольше
+    timeout секунд. Соединения старше max_lifetime секунд при
+    возврате закрываются
+    """
+
+    def __init__(self, max_size, timeout, max_lifetime):
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.idle = deque()
+        # Открытые и открываемые соединения
+        self.size = 0
+        self.created_at = {}
+        self.waiting = 0
+        self.wait_seconds = 0
+        self.condition = threading.Condition()
+        self.counters = Counter(created=0, reused=0, discarded=0, waits=0,
+                                timeouts=0)
+
+    def wait(self):
+        """Ожидание свободного места; вызывается под блокировкой"""
+        self.counters['waits'] += 1
+        self.waiting += 1
+        start = time.monotonic()
+        try:
+            ready = self.condition.wait_for(
+                lambda: self.idle or self.size < self.max_size, self.timeout
+            )
+        finally:
+            self.waiting -= 1
+            self.wait_seconds += time.monotonic() - start
+        if not ready:
+            self.counters['timeouts'] += 1
+            raise PoolTimeoutError(
+                f'Все {self.max_size} соединений пула заняты '
+                f'дольше {self.timeout} с'
+            )
+
+    def acquire(self, connect, check=None):
+        """
+        Соединение из пула: свободное, прошедшее проверку check,
+        или новое, открытое вызовом connect
+        """
+        while True:
+            with self.condition:
+                if not self.idle and self.size >= self.max_size:
+                    self.wait()
+                if not self.idle:
+                    self.size += 1
+                    break
+                connection = self.idle.pop()
+            if check is None or check(connection):
+                with self.condition:
+                    self.counters['reused'] += 1
+                return connection
+            self.discard(connection)
+        return self.create(connect)
+
+    def create(self, connect):
+        try:
+            connection = connect()
+        except Exception:
+            with self.condition:
+                self.size -= 1
+                self.condition.notify()
+            raise
+        with self.condition:
+            self.created_at[id(connection)] = time.monotonic()
+            self.counters['created'] += 1
+        return connection
+
+    def release(self, connection, reusable=True):
+        """Возврат соединения; непригодное или старое закрывается"""
+        with self.condition:
+            created = self.created_at.get(id(connection))
+            if (
+                reusable and created is not None
+                and time.monotonic() - created <= self.max_lifetime
+            ):
+                self.idle.append(connection)
+                self.condition.notify()
+                return
+        self.discard(connection)
+
+    def discard(self, connection):
+        with self.condition:
+            if self.created_at.pop(id(connection), None) is not None:
+                self.size -= 1
+            self.counters['discarded'] += 1
+            self.condition.notify()
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def stats(self):
+        with self.condition:
+            return {
+                'max_size': self.max_size,
+                'in_use': self.size - len(self.idle),
+                'idle': len(self.idle),
+                'waiting': self.waiting,
+                'wait_seconds': self.wait_seconds,
+                **self.counters,
+            }
+
+
+_pools = {}
+_lock = threading.Lock()
+
+
+def get_pool(alias, options):
+    """
+    Пул соединений псевдонима БД в текущем процессе. После fork
+    создаётся новый: соединения родителя не переиспользуются
+    """
+    key = (alias, os.getpid())
+    if key not in _pools:
+        with _lock:
+            if key not in _pools:
+                _pools[key] = ConnectionPool(
+                    options['MAX_SIZE'], options['TIMEOUT'],
+                    options['MAX_LIFETIME']
+                )
+    return _pools[key]
+
+
+def get_stats():
+    """Состояние пулов текущего процесса по псевдонимам БД"""
+    pid = os.getpid()
+    return {
+        alias: pool.stats()
+        for (alias, pool_pid), pool in list(_pools.items())
+        if pool_pid == pid
+    }
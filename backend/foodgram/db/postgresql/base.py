@@ -0,0 +1,103 @@
+from functools import partial
+
+from django.db.backends.postgresql import base
+from psycopg2 import extensions
+
+from .. import pool
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    Бэкенд PostgreSQL для постоянных соединений и пула.
+    CONN_HEALTH_CHECKS: переиспользуемое соединение проверяется
+    перед первым SQL в каждом HTTP-запросе и при ошибке открывается
+    заново (как в Django 4.1). POOL ({'MAX_SIZE', 'TIMEOUT',
+    'MAX_LIFETIME'}): соединения берутся из пула процесса и
+    возвращаются в него вместо закрытия
+    """
+
+    health_check_done = False
+
+    @property
+    def health_check_enabled(self):
+        return self.settings_dict.get('CONN_HEALTH_CHECKS', False)
+
+    def get_pool(self):
+        options = self.settings_dict.get('POOL')
+        if not options:
+            return None
+        return pool.get_pool(self.alias, options)
+
+    @staticmethod
+    def is_alive(connection):
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+        except base.Database.Error:
+            return False
+        return True
+
+    @staticmethod
+    def reset(connection):
+        """Откат незавершённой транзакции; False — соединение непригодно"""
+        if connection.closed:
+            return False
+        status = connection.info.transaction_status
+        if status == extensions.TRANSACTION_STATUS_IDLE:
+            return True
+        if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+            return False
+        try:
+            connection.rollback()
+        except base.Database.Error:
+            return False
+        return True
+
+    def get_new_connection(self, conn_params):
+        connection_pool = self.get_pool()
+        if connection_pool is None:
+            return super().get_new_connection(conn_params)
+        connection = connection_pool.acquire(
+            partial(super().get_new_connection, conn_params),
+            self.is_alive if self.health_check_enabled else None
+        )
+        # Для соединения из пула родительский метод не вызывался
+        self.isolation_level = self.settings_dict['OPTIONS'].get(
+            'isolation_level', connection.isolation_level
+        )
+        return connection
+
+    def _close(self):
+        connection_pool = self.get_pool()
+        if connection_pool is None or self.connection is None:
+            return super()._close()
+        # Соединение, закрытое внутри atomic, ещё используется обёрткой
+        connection_pool.release(
+            self.connection,
+            not self.in_atomic_block and self.reset(self.connection)
+        )
+        return None
+
+    def connect(self):
+        super().connect()
+        self.health_check_done = True
+
+    def close_if_health_check_failed(self):
+        if (
+            self.connection is None
+            or not self.health_check_enabled
+            or self.health_check_done
+        ):
+            return
+        if not self.is_usable():
+            self.close()
+        self.health_check_done = True
+
+    def _cursor(self, name=None):
+        self.close_if_health_check_failed()
+        return super()._cursor(name)
+
+    def close_if_unusable_or_obsolete(self):
+        if self.connection is not None:
+            self.health_check_done = False
+        super().close_if_unusable_or_obsolete()
@@ -26,6 +26,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -33,7 +34,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'drf_api_logger.middleware.api_logger_middleware.APILoggerMiddleware',
+    'api.middleware.BufferedAPILoggerMiddleware',
 ]
 
 ROOT_URLCONF = 'foodgram.urls'
@@ -57,16 +58,33 @@ TEMPLATES = [
 WSGI_APPLICATION = 'foodgram.wsgi.application'
 
 
+DB_POOL_MAX_SIZE = int(os.getenv('DB_POOL_MAX_SIZE', default=0))
+
 if os.getenv('DATABASE') == 'True':
     DATABASES = {
         'default': {
             'ENGINE': os.getenv('DB_ENGINE',
-                                default='django.db.backends.postgresql'),
+                                default='foodgram.db.postgresql'),
             'NAME': os.getenv('DB_NAME', default='postgres'),
             'USER': os.getenv('POSTGRES_USER', default='postgres'),
             'PASSWORD': os.getenv('POSTGRES_PASSWORD', default='postgres'),
             'HOST': os.getenv('DB_HOST', default='db'),
-            'PORT': os.getenv('DB_PORT', default='5432')
+            'PORT': os.getenv('DB_PORT', default='5432'),
+            # С пулом соединение возвращается в него после каждого
+            # запроса, без пула живёт в потоке CONN_MAX_AGE секунд
+            'CONN_MAX_AGE': int(os.getenv(
+                'DB_CONN_MAX_AGE', default=0 if DB_POOL_MAX_SIZE else 60
+            )),
+            'CONN_HEALTH_CHECKS': (
+                os.getenv('DB_CONN_HEALTH_CHECKS', default='True') == 'True'
+            ),
+            'POOL': {
+                'MAX_SIZE': DB_POOL_MAX_SIZE,
+                'TIMEOUT': float(os.getenv('DB_POOL_TIMEOUT', default=10)),
+                'MAX_LIFETIME': int(
+                    os.getenv('DB_POOL_MAX_LIFETIME', default=3600)
+                ),
+            } if DB_POOL_MAX_SIZE else None,
         },
     }
 else:
@@ -77,6 +95,26 @@ else:
         },
     }
 
+LOCAL_CACHE_BACKEND = 'django.core.cache.backends.locmem.LocMemCache'
+CACHE_LOCATION = os.getenv('CACHE_LOCATION', default='')
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            default=(
+                'django.core.cache.backends.memcached.PyMemcacheCache'
+                if CACHE_LOCATION else LOCAL_CACHE_BACKEND
+            )
+        ),
+        'LOCATION': CACHE_LOCATION,
+    }
+}
+# Кэш в памяти процесса не видит изменений из других воркеров
+# и команд, поэтому состояние пользователя и ответы API в нём
+# не хранятся
+SHARED_CACHE = CACHES['default']['BACKEND'] != LOCAL_CACHE_BACKEND
+
 AUTH_USER_MODEL = 'user.User'
 
 AUTH_PASSWORD_VALIDATORS = [
@@ -133,6 +171,10 @@ REST_FRAMEWORK = {
     'PAGE_SIZE': 6,
 }
 
+COMPILED_SERIALIZERS = (
+    os.getenv('COMPILED_SERIALIZERS', default='True') == 'True'
+)
+
 STATIC_URL = '/backend_static/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'backend_static')
 MEDIA_URL = '/media/'
@@ -141,9 +183,84 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 DRF_API_LOGGER_DATABASE = True
+API_LOG_QUEUE_SIZE = int(os.getenv('API_LOG_QUEUE_SIZE', default=10000))
+API_LOG_BATCH_SIZE = int(os.getenv('API_LOG_BATCH_SIZE', default=200))
+API_LOG_FLUSH_INTERVAL = int(os.getenv('API_LOG_FLUSH_INTERVAL', default=500))
+API_LOG_SHUTDOWN_TIMEOUT = float(
+    os.getenv('API_LOG_SHUTDOWN_TIMEOUT', default=5)
+)
+API_LOG_SAMPLE_RATES = {
+    '/api/ingredients/': float(
+        os.getenv('API_LOG_INGREDIENTS_SAMPLE_RATE', default=0)
+    ),
+}
+
+RECIPE_THUMBNAIL_SIZES = {
+    'small': 240,
+    'medium': 640,
+}
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', default=2))
+
+SHOPPING_CART_PDF_FONT = os.getenv(
+    'SHOPPING_CART_PDF_FONT',
+    default='/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+)
 
 # CSRF_TRUSTED_ORIGINS = ['http://тут ваш порт:тут что слушает nginx']
 
+INGREDIENT_AUTOCOMPLETE_LIMIT = int(
+    os.getenv('INGREDIENT_AUTOCOMPLETE_LIMIT', default=50)
+)
+REFERENCE_CACHE_TTL = int(os.getenv('REFERENCE_CACHE_TTL', default=300))
+REFERENCE_CHECK_INTERVAL = float(
+    os.getenv('REFERENCE_CHECK_INTERVAL', default=1)
+)
+
+USER_STATE_CACHE_TIMEOUT = int(
+    os.getenv('USER_STATE_CACHE_TIMEOUT', default=300)
+)
+
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', default='True') == 'True'
+METRICS_SLOW_REQUESTS = int(os.getenv('METRICS_SLOW_REQUESTS', default=0))
+METRICS_SLOW_REQUEST_MS = int(
+    os.getenv('METRICS_SLOW_REQUEST_MS', default=500)
+)
+
+RESPONSE_CACHE_TIMEOUT = int(
+    os.getenv('RESPONSE_CACHE_TIMEOUT', default=600)
+)
+
+PAGINATION_COUNT_CACHE_TIMEOUT = int(
+    os.getenv('PAGINATION_COUNT_CACHE_TIMEOUT', default=60)
+)
+
+RECOMMENDATIONS_NEIGHBOURS = int(
+    os.getenv('RECOMMENDATIONS_NEIGHBOURS', default=20)
+)
+RECOMMENDATIONS_MIN_SUPPORT = int(
+    os.getenv('RECOMMENDATIONS_MIN_SUPPORT', default=1)
+)
+RECOMMENDATIONS_MAX_USER_ITEMS = int(
+    os.getenv('RECOMMENDATIONS_MAX_USER_ITEMS', default=1000)
+)
+RECOMMENDATIONS_SEEDS = int(os.getenv('RECOMMENDATIONS_SEEDS', default=50))
+RECOMMENDATIONS_LIMIT = int(os.getenv('RECOMMENDATIONS_LIMIT', default=100))
+RECOMMENDATIONS_WORKERS = int(
+    os.getenv('RECOMMENDATIONS_WORKERS', default=os.cpu_count() or 1)
+)
+
+FEED_FANOUT_LIMIT = int(os.getenv('FEED_FANOUT_LIMIT', default=1000))
+FEED_TIMELINE_SIZE = int(os.getenv('FEED_TIMELINE_SIZE', default=500))
+FEED_WORKERS = int(os.getenv('FEED_WORKERS', default=1))
+
+CATALOG_BACKGROUND_BUILD = (
+    os.getenv('CATALOG_BACKGROUND_BUILD', default='True') == 'True'
+)
+
+BULK_RECIPES_LIMIT = int(os.getenv('BULK_RECIPES_LIMIT', default=100))
+
+SEARCH_CONFIG = os.getenv('SEARCH_CONFIG', default='russian')
+
 LIMIT_CHAR_254 = 254
 LIMIT_CHAR_150 = 150
 LIMIT_CHAR_200 = 200
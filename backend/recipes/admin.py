@@ -31,7 +31,7 @@ class RecipeAdmin(admin.ModelAdmin):
     list_editable = ('name',)
 
     def count(self, obj):
-        return Favourites.objects.filter(recipe=obj).count()
+        return obj.favourites_count
     count.short_description = 'Количество подписок'
 
     def recipe_ingredients(self, obj):
@@ -0,0 +1,41 @@
+from bisect import bisect_left
+
+from . import reference
+
+
+class IngredientIndex:
+    """
+    Индекс ингредиентов для автодополнения: названия в нижнем
+    регистре, отсортированные для поиска префикса бинарным поиском
+    """
+
+    def __init__(self, rows):
+        rows = sorted(rows, key=lambda row: (row[1].casefold(), row[0]))
+        self.keys = [name.casefold() for _, name, _ in rows]
+        self.rows = rows
+
+    def search(self, prefix, limit):
+        """
+        Ингредиенты, название которых начинается с prefix: сначала
+        точное совпадение, затем более короткие названия
+        """
+        prefix = prefix.casefold()
+        start = bisect_left(self.keys, prefix)
+        end = start
+        while end < len(self.keys) and self.keys[end].startswith(prefix):
+            end += 1
+        found = sorted(
+            range(start, end),
+            key=lambda index: (self.keys[index] != prefix,
+                               len(self.keys[index]), index)
+        )[:limit]
+        return [
+            {'id': pk, 'name': name, 'measurement_unit': measurement_unit}
+            for pk, name, measurement_unit in map(self.rows.__getitem__,
+                                                  found)
+        ]
+
+
+def get_index():
+    """Индекс текущей версии, перестраивается при изменении ингредиентов"""
+    return reference.ingredients().index
@@ -0,0 +1,125 @@
+from collections import defaultdict
+
+from django.utils import timezone
+
+from .counters import change_counter
+from .models import CartSummary, Ingredient, IngredientAmount, ShopList
+
+# Единица измерения: (базовая единица, множитель)
+UNITS = {
+    'кг': ('г', 1000),
+    'л': ('мл', 1000),
+}
+
+
+def normalize(measurement_unit, amount):
+    """Количество в базовой единице измерения"""
+    unit, factor = UNITS.get(measurement_unit, (measurement_unit, 1))
+    return unit, amount * factor
+
+
+def group(rows, sign=1):
+    """
+    Суммы по (название, базовая единица) для строк
+    (название, единица измерения, количество)
+    """
+    totals = defaultdict(int)
+    for name, measurement_unit, amount in rows:
+        unit, amount = normalize(measurement_unit, amount)
+        totals[name, unit] += sign * amount
+    return totals
+
+
+def apply(user_ids, deltas):
+    """
+    Изменяет строки итогов пользователей на deltas: недостающие
+    строки создаются, обнулившиеся удаляются
+    """
+    user_ids = list(user_ids)
+    deltas = {key: delta for key, delta in deltas.items() if delta}
+    if not user_ids or not deltas:
+        return
+    CartSummary.objects.bulk_create(
+        [
+            CartSummary(user_id=user_id, name=name, measurement_unit=unit)
+            for user_id in user_ids
+            for (name, unit), delta in deltas.items() if delta > 0
+        ],
+        ignore_conflicts=True
+    )
+    for (name, unit), delta in deltas.items():
+        change_counter(
+            CartSummary.objects.filter(user_id__in=user_ids, name=name,
+                                       measurement_unit=unit),
+            'amount', delta
+        )
+    # Время изменения итога (ETag и Last-Modified выгрузки) сдвигается
+    # у всех его строк, в том числе при удалении обнулившихся
+    CartSummary.objects.filter(user_id__in=user_ids).update(
+        updated_at=timezone.now()
+    )
+    CartSummary.objects.filter(user_id__in=user_ids, amount=0).delete()
+
+
+def add_recipes(user_id, recipe_ids, sign=1):
+    """
+    Добавляет ингредиенты рецептов в итог пользователя
+    (sign=-1 убирает)
+    """
+    apply([user_id], group(
+        IngredientAmount.objects.filter(
+            recipes_id__in=recipe_ids
+        ).values_list(
+            'ingredient__name', 'ingredient__measurement_unit', 'amount'
+        ),
+        sign
+    ))
+
+
+def change_recipe(recipe_id, changes):
+    """
+    Переносит изменения количества ингредиентов рецепта
+    (id ингредиента, разница) в итоги всех, у кого он в покупках
+    """
+    changes = dict(changes)
+    user_ids = list(ShopList.objects.filter(
+        recipe_id=recipe_id
+    ).values_list('user_id', flat=True))
+    if not changes or not user_ids:
+        return
+    apply(user_ids, group(
+        (name, measurement_unit, changes[pk])
+        for pk, name, measurement_unit in Ingredient.objects.filter(
+            pk__in=changes
+        ).values_list('pk', 'name', 'measurement_unit')
+    ))
+
+
+def rebuild(cart_model, shop_list_model, user_ids=None):
+    """
+    Пересчитывает итоги списков покупок по фактическим данным,
+    для всех пользователей или только для user_ids
+    """
+    carts = shop_list_model.objects.all()
+    summary = cart_model.objects.all()
+    if user_ids is not None:
+        carts = carts.filter(user_id__in=user_ids)
+        summary = summary.filter(user_id__in=user_ids)
+    by_user = defaultdict(list)
+    for user_id, *row in carts.values_list(
+        'user_id', 'recipe__ingredientamount__ingredient__name',
+        'recipe__ingredientamount__ingredient__measurement_unit',
+        'recipe__ingredientamount__amount'
+    ).iterator():
+        if row[-1] is not None:
+            by_user[user_id].append(row)
+    summary.delete()
+    cart_model.objects.bulk_create(
+        (
+            cart_model(user_id=user_id, name=name, measurement_unit=unit,
+                       amount=amount)
+            for user_id, user_rows in by_user.items()
+            for (name, unit), amount in group(user_rows).items()
+        ),
+        batch_size=1000
+    )
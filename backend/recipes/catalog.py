@@ -0,0 +1,152 @@
+import gzip
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from django.conf import settings
+
+from . import reference
+from .tasks import run_task
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+IDENTITY = 'identity'
+
+
+def compress(content, slow=True):
+    """
+    JSON каталога и его сжатые варианты по названиям кодировок.
+    Brotli сжимает лучше gzip, но в разы дольше, поэтому без slow
+    не используется
+    """
+    encodings = {
+        'gzip': gzip.compress(content, compresslevel=9, mtime=0),
+        IDENTITY: content,
+    }
+    if brotli is None or not slow:
+        return encodings
+    # Порядок задаёт предпочтение при выборе кодировки
+    return {'br': brotli.compress(content), **encodings}
+
+
+class Bundle:
+    """
+    Каталог ингредиентов одной версии. Версия — хэш JSON справочника,
+    поэтому у одинаковых данных она одна во всех процессах
+    """
+
+    def __init__(self, snapshot, encodings):
+        self.version = snapshot.etag.strip('"')
+        self.reference_version = snapshot.version
+        self.built = time.monotonic()
+        self.encodings = encodings
+
+    @property
+    def complete(self):
+        return brotli is None or 'br' in self.encodings
+
+
+class BundleCache:
+    """
+    Собранный каталог в памяти процесса. При смене версии
+    справочника ингредиентов новый каталог собирается в фоне,
+    а до готовности отдаётся предыдущий. Первый каталог собирается
+    в запросе только с gzip, brotli добавляется в фоне.
+    Пересборка не инкрементальная: сжатый поток нельзя дополнить
+    изменёнными строками, поэтому каталог сжимается целиком.
+    Запросы она не блокирует, а при той же версии данных сжатые
+    варианты берутся из прежнего каталога
+    """
+
+    def __init__(self):
+        self.bundle = None
+        self.checked = 0
+        self.building = False
+        self.pending = False
+        self.lock = threading.Lock()
+
+    def build(self, slow=True):
+        snapshot = reference.ingredients()
+        bundle = self.bundle
+        if (
+            bundle is not None and bundle.complete
+            and bundle.version == snapshot.etag.strip('"')
+        ):
+            # Данные не изменились: сжатые варианты остаются прежними
+            encodings = bundle.encodings
+        else:
+            encodings = compress(snapshot.content, slow)
+        self.bundle = Bundle(snapshot, encodings)
+
+    def run(self):
+        while True:
+            try:
+                self.build()
+            except Exception:
+                logger.exception('Не удалось собрать каталог ингредиентов')
+            with self.lock:
+                if not self.pending:
+                    self.building = False
+                    return
+                self.pending = False
+
+    def schedule(self):
+        """
+        Пересборка в фоне. Если сборка уже идёт, после неё
+        выполняется ещё одна, чтобы учесть последние изменения
+        """
+        with self.lock:
+            if self.building:
+                self.pending = True
+                return
+            self.building = True
+        if not settings.CATALOG_BACKGROUND_BUILD:
+            self.run()
+            return
+        get_executor().submit(run_task, self.run)
+
+    def is_stale(self, bundle):
+        return (
+            reference.INGREDIENTS.get_version() != bundle.reference_version
+            or time.monotonic() - bundle.built > settings.REFERENCE_CACHE_TTL
+        )
+
+    def get(self):
+        bundle = self.bundle
+        if bundle is None:
+            self.build(slow=False)
+            if not self.bundle.complete:
+                self.schedule()
+            return self.bundle
+        now = time.monotonic()
+        if now - self.checked >= settings.REFERENCE_CHECK_INTERVAL:
+            self.checked = now
+            if self.is_stale(bundle):
+                self.schedule()
+        return bundle
+
+
+@lru_cache(maxsize=None)
+def get_executor():
+    return ThreadPoolExecutor(max_workers=1,
+                              thread_name_prefix='ingredient-catalog')
+
+
+CATALOG = BundleCache()
+
+
+def get_bundle():
+    """Текущий каталог ингредиентов"""
+    return CATALOG.get()
+
+
+def schedule_rebuild():
+    """Пересборка каталога после изменения ингредиентов"""
+    CATALOG.schedule()
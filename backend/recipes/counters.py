@@ -0,0 +1,57 @@
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+
+
+class CountersMixin:
+    """
+    Счётчики из counter_fields меняются только атомарными UPDATE
+    (change_counter, recount): полное сохранение объекта их
+    не перезаписывает значениями, загруженными при чтении
+    """
+
+    counter_fields = ()
+
+    def save(self, *args, **kwargs):
+        if (
+            not self._state.adding
+            and kwargs.get('update_fields') is None
+            and not kwargs.get('force_insert')
+        ):
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.counter_fields
+                and field.attname not in deferred
+            ]
+        super().save(*args, **kwargs)
+
+
+def change_counter(queryset, field, delta):
+    """Атомарно изменяет счётчик на delta, не опуская его ниже нуля"""
+    return queryset.update(**{field: Greatest(F(field) + delta, 0)})
+
+
+def count_subquery(model, field):
+    """Подзапрос количества строк model, ссылающихся на OuterRef('pk')"""
+    return Coalesce(
+        Subquery(
+            model.objects.filter(**{field: OuterRef('pk')})
+            .order_by().values(field)
+            .annotate(count=Count('pk')).values('count')
+        ),
+        Value(0)
+    )
+
+
+def recount(recipe_model, favourites_model, shop_list_model,
+            user_model, subscription_model):
+    """Пересчитывает все счётчики по фактическим данным"""
+    recipe_model.objects.update(
+        favourites_count=count_subquery(favourites_model, 'recipe'),
+        in_cart_count=count_subquery(shop_list_model, 'recipe')
+    )
+    user_model.objects.update(
+        recipes_count=count_subquery(recipe_model, 'author'),
+        subscribers_count=count_subquery(subscription_model, 'author')
+    )
@@ -0,0 +1,239 @@
+import heapq
+import logging
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Q, Window
+from django.db.models.functions import RowNumber
+from user.models import Subscription, User
+
+from .loaders import chunked
+from .models import FeedEntry, Recipe
+from .tasks import run_task
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1000
+
+
+def trim(feed_model, user_ids):
+    """Удаляет записи лент сверх FEED_TIMELINE_SIZE последних"""
+    sql, params = feed_model.objects.filter(user_id__in=user_ids).annotate(
+        feed_rank=Window(
+            RowNumber(),
+            partition_by=F('user_id'),
+            order_by=(F('pub_date').desc(), F('recipe_id').desc())
+        )
+    ).order_by().values('id', 'feed_rank').query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {feed_model._meta.db_table} WHERE id IN '
+            f'(SELECT id FROM ({sql}) ranked WHERE feed_rank > %s)',
+            (*params, settings.FEED_TIMELINE_SIZE)
+        )
+
+
+def add_recipes(feed_model, user_ids, recipes):
+    """Записи (id, автор, дата публикации) в ленты пользователей"""
+    feed_model.objects.bulk_create(
+        (
+            feed_model(user_id=user_id, recipe_id=recipe_id,
+                       author_id=author_id, pub_date=pub_date)
+            for user_id in user_ids
+            for recipe_id, author_id, pub_date in recipes
+        ),
+        batch_size=CHUNK_SIZE,
+        ignore_conflicts=True
+    )
+
+
+def get_large_authors(user_id):
+    """
+    Авторы пользователя, у которых подписчиков больше
+    FEED_FANOUT_LIMIT: их рецепты в ленты не раскладываются
+    и читаются при запросе ленты
+    """
+    return list(
+        Subscription.objects.filter(
+            user_id=user_id,
+            author__subscribers_count__gt=settings.FEED_FANOUT_LIMIT
+        ).values_list('author_id', flat=True)
+    )
+
+
+def fan_out(recipe_id):
+    """Добавляет новый рецепт в ленты подписчиков автора"""
+    recipe = Recipe.objects.filter(pk=recipe_id).values_list(
+        'author_id', 'pub_date', 'author__subscribers_count'
+    ).first()
+    if recipe is None:
+        return
+    author_id, pub_date, subscribers = recipe
+    if subscribers > settings.FEED_FANOUT_LIMIT:
+        return
+    followers = Subscription.objects.filter(
+        author_id=author_id
+    ).values_list('user_id', flat=True)
+    for chunk in chunked(followers.iterator(), CHUNK_SIZE):
+        add_recipes(FeedEntry, chunk, [(recipe_id, author_id, pub_date)])
+        trim(FeedEntry, chunk)
+
+
+def safe_fan_out(recipe_id):
+    try:
+        fan_out(recipe_id)
+    except Exception:
+        logger.exception('Не удалось разослать рецепт %s в ленты', recipe_id)
+
+
+@lru_cache(maxsize=None)
+def get_executor():
+    return ThreadPoolExecutor(
+        max_workers=settings.FEED_WORKERS,
+        thread_name_prefix='recipe-feed'
+    )
+
+
+def schedule(task, *args):
+    """
+    Ставит задачу лент в пул после фиксации транзакции.
+    При FEED_WORKERS = 0 задача выполняется сразу
+    """
+    if not settings.FEED_WORKERS:
+        transaction.on_commit(lambda: task(*args))
+        return
+    transaction.on_commit(
+        lambda: get_executor().submit(run_task, task, *args)
+    )
+
+
+def schedule_fan_out(recipe_id):
+    """Рассылка рецепта по лентам после фиксации транзакции"""
+    schedule(safe_fan_out, recipe_id)
+
+
+def latest_recipes(author_id):
+    """Последние FEED_TIMELINE_SIZE рецептов автора для лент"""
+    return list(
+        Recipe.objects.filter(author_id=author_id)
+        .order_by('-pub_date', '-id')
+        .values_list('id', 'author_id', 'pub_date')
+        [:settings.FEED_TIMELINE_SIZE]
+    )
+
+
+def fan_out_author(author_id):
+    """Последние рецепты автора в лентах всех его подписчиков"""
+    recipes = latest_recipes(author_id)
+    if not recipes:
+        return
+    followers = Subscription.objects.filter(
+        author_id=author_id
+    ).values_list('user_id', flat=True)
+    for chunk in chunked(followers.iterator(), CHUNK_SIZE):
+        add_recipes(FeedEntry, chunk, recipes)
+        trim(FeedEntry, chunk)
+
+
+def safe_fan_out_author(author_id):
+    try:
+        fan_out_author(author_id)
+    except Exception:
+        logger.exception('Не удалось разослать рецепты автора %s в ленты',
+                         author_id)
+
+
+def check_fan_out_limit(author_id):
+    """
+    Вызывается после уменьшения счётчика подписчиков. Автор, у
+    которого осталось ровно FEED_FANOUT_LIMIT подписчиков, перестал
+    быть крупным: его рецепты не читаются при запросе ленты, поэтому
+    раскладываются по лентам подписчиков. Строка автора заблокирована
+    изменением счётчика до конца транзакции, так что порог видит
+    ровно одна отписка
+    """
+    if User.objects.filter(
+        pk=author_id, subscribers_count=settings.FEED_FANOUT_LIMIT
+    ).exists():
+        schedule(safe_fan_out_author, author_id)
+
+
+def subscribe(user_id, author_id):
+    """Последние рецепты нового автора в ленте подписчика"""
+    if User.objects.filter(
+        pk=author_id, subscribers_count__gt=settings.FEED_FANOUT_LIMIT
+    ).exists():
+        return
+    add_recipes(FeedEntry, [user_id], latest_recipes(author_id))
+    trim(FeedEntry, [user_id])
+
+
+def unsubscribe(user_id, author_id):
+    FeedEntry.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+def rebuild(feed_model, subscription_model, recipe_model, user_ids=None):
+    """
+    Заполняет ленты заново по подпискам: для каждого пользователя
+    последние FEED_TIMELINE_SIZE рецептов авторов, на которых
+    распространяется рассылка
+    """
+    entries = feed_model.objects.all()
+    subscriptions = subscription_model.objects.filter(
+        author__subscribers_count__lte=settings.FEED_FANOUT_LIMIT
+    )
+    if user_ids is not None:
+        entries = entries.filter(user_id__in=user_ids)
+        subscriptions = subscriptions.filter(user_id__in=user_ids)
+    entries.delete()
+    authors = defaultdict(list)
+    rows = subscriptions.values_list('user_id', 'author_id')
+    for user_id, author_id in rows.iterator():
+        authors[user_id].append(author_id)
+    for user_id, author_ids in authors.items():
+        add_recipes(feed_model, [user_id], list(
+            recipe_model.objects.filter(author_id__in=author_ids)
+            .order_by('-pub_date', '-id')
+            .values_list('id', 'author_id', 'pub_date')
+            [:settings.FEED_TIMELINE_SIZE]
+        ))
+
+
+def before(queryset, position, id_field):
+    """Строки строго после позиции (дата публикации, id) по убыванию"""
+    if position is None:
+        return queryset
+    pub_date, pk = position
+    return queryset.filter(
+        Q(pub_date__lt=pub_date)
+        | Q(pub_date=pub_date, **{f'{id_field}__lt': pk})
+    )
+
+
+def get_timeline(user_id, position, limit):
+    """
+    Срез ленты пользователя после позиции: пары (дата публикации,
+    id рецепта) из сохранённой ленты, объединённые с рецептами
+    крупных авторов, которые читаются при запросе
+    """
+    rows = list(
+        before(FeedEntry.objects.filter(user_id=user_id), position,
+               'recipe_id')
+        .order_by('-pub_date', '-recipe_id')
+        .values_list('pub_date', 'recipe_id')[:limit]
+    )
+    large_authors = get_large_authors(user_id)
+    if not large_authors:
+        return rows
+    pulled = list(
+        before(Recipe.objects.filter(author_id__in=large_authors),
+               position, 'id')
+        .order_by('-pub_date', '-id')
+        .values_list('pub_date', 'id')[:limit]
+    )
+    # Записи автора, ставшего крупным, могли остаться в ленте
+    merged = dict.fromkeys(heapq.merge(rows, pulled, reverse=True))
+    return list(merged)[:limit]
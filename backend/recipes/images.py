@@ -0,0 +1,131 @@
+import hashlib
+import io
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image, features
+
+from . import versions
+from .models import Recipe
+from .tasks import run_task
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_DIR = 'recipes'
+THUMBNAIL_DIR = 'recipes/thumbnails'
+THUMBNAIL_FORMAT, THUMBNAIL_EXTENSION = (
+    ('WEBP', 'webp') if features.check('webp') else ('JPEG', 'jpg')
+)
+THUMBNAIL_QUALITY = 80
+
+
+def content_name(content):
+    """Имя файла по хэшу содержимого: одинаковые картинки совпадают"""
+    return hashlib.sha256(content).hexdigest()
+
+
+def store_original(image):
+    """
+    Сохраняет загруженную картинку под именем из хэша содержимого.
+    Если такая картинка уже есть, повторно она не записывается.
+    Возвращает имя файла.
+    Вызывается в потоке запроса: ответ ссылается на исходную
+    картинку, пока не готовы миниатюры, поэтому она должна быть
+    записана до ответа. В пул выносится только уменьшение
+    """
+    name = f'{UPLOAD_DIR}/{image.name}'
+    if default_storage.exists(name):
+        return name
+    return default_storage.save(name, image)
+
+
+def thumbnail_name(name, size):
+    stem = os.path.splitext(os.path.basename(name))[0]
+    return f'{THUMBNAIL_DIR}/{stem}_{size}.{THUMBNAIL_EXTENSION}'
+
+
+def thumbnail_urls(image, ready):
+    """
+    Адреса миниатюр картинки рецепта без обращения к хранилищу;
+    пока миниатюры не готовы (ready), вместо них отдаётся
+    исходная картинка
+    """
+    if not image:
+        return {}
+    return {
+        label: (
+            default_storage.url(thumbnail_name(image.name, size)) if ready
+            else image.url
+        )
+        for label, size in settings.RECIPE_THUMBNAIL_SIZES.items()
+    }
+
+
+def make_thumbnails(name):
+    """
+    Уменьшенные копии картинки во всех размерах из настроек.
+    Рецепты с этой картинкой отмечаются готовыми
+    """
+    targets = {}
+    for size in settings.RECIPE_THUMBNAIL_SIZES.values():
+        target = thumbnail_name(name, size)
+        if not default_storage.exists(target):
+            targets[size] = target
+    if targets:
+        save_thumbnails(name, targets)
+    recipes = Recipe.objects.filter(pk__in=list(
+        Recipe.objects.filter(image=name, thumbnails_ready=False)
+        .values_list('pk', flat=True)
+    ))
+    recipes.update(thumbnails_ready=True)
+    # Закэшированные ответы ещё ссылаются на исходную картинку
+    versions.touch(recipes)
+
+
+def save_thumbnails(name, targets):
+    with default_storage.open(name) as file:
+        original = Image.open(file)
+        original.load()
+    if THUMBNAIL_FORMAT == 'JPEG' or original.mode not in ('RGB', 'RGBA'):
+        original = original.convert('RGB')
+    for size, target in targets.items():
+        image = original.copy()
+        image.thumbnail((size, size), Image.LANCZOS)
+        buffer = io.BytesIO()
+        image.save(buffer, THUMBNAIL_FORMAT, quality=THUMBNAIL_QUALITY)
+        default_storage.save(target, ContentFile(buffer.getvalue()))
+
+
+def safe_make_thumbnails(name):
+    try:
+        make_thumbnails(name)
+    except Exception:
+        logger.exception('Не удалось создать миниатюры для %s', name)
+
+
+@lru_cache(maxsize=None)
+def get_executor():
+    return ThreadPoolExecutor(
+        max_workers=settings.IMAGE_WORKERS,
+        thread_name_prefix='recipe-images'
+    )
+
+
+def schedule_thumbnails(name):
+    """
+    Ставит создание миниатюр в пул после фиксации транзакции,
+    в которой сохранён рецепт с картинкой name. При
+    IMAGE_WORKERS = 0 миниатюры создаются сразу
+    """
+    if not settings.IMAGE_WORKERS:
+        transaction.on_commit(lambda: safe_make_thumbnails(name))
+        return
+    transaction.on_commit(
+        lambda: get_executor().submit(run_task, safe_make_thumbnails, name)
+    )
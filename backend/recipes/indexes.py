@@ -0,0 +1,20 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.db.backends.ddl_references import Statement
+
+
+class SearchVectorIndex(GinIndex):
+    """
+    GIN-индекс поискового вектора. Создаётся только в PostgreSQL:
+    в SQLite поиск идёт по таблице FTS5, а пересоздание таблицы
+    при миграциях не должно падать на USING gin
+    """
+
+    def create_sql(self, model, schema_editor, using='', **kwargs):
+        if schema_editor.connection.vendor != 'postgresql':
+            return Statement('')
+        return super().create_sql(model, schema_editor, using, **kwargs)
+
+    def remove_sql(self, model, schema_editor, **kwargs):
+        if schema_editor.connection.vendor != 'postgresql':
+            return Statement('')
+        return super().remove_sql(model, schema_editor, **kwargs)
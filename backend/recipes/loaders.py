@@ -0,0 +1,135 @@
+import csv
+import io
+import json
+import os
+from itertools import islice
+
+from django.db import connection, transaction
+
+READ_BUFFER_SIZE = 64 * 1024
+
+
+def chunked(iterable, size):
+    """Разбивает итератор на списки длиной не более size"""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def read_csv(path, fields):
+    """Построчно читает csv, пропуская пустые строки и заголовок"""
+    with open(path, 'r', encoding='utf-8') as file:
+        for row in csv.reader(file):
+            if not row or tuple(row) == fields:
+                continue
+            yield dict(zip(fields, row))
+
+
+def read_json(path, fields):
+    """Читает массив объектов json по частям, не загружая файл целиком"""
+    decoder = json.JSONDecoder()
+    with open(path, 'r', encoding='utf-8') as file:
+        buffer = file.read(READ_BUFFER_SIZE).lstrip()
+        if not buffer.startswith('['):
+            raise ValueError(f'{path}: ожидается массив объектов')
+        buffer = buffer[1:]
+        while True:
+            buffer = buffer.lstrip().lstrip(',').lstrip()
+            if buffer.startswith(']'):
+                return
+            try:
+                item, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                chunk = file.read(READ_BUFFER_SIZE)
+                if not chunk:
+                    raise
+                buffer += chunk
+                continue
+            buffer = buffer[end:]
+            yield {field: item[field] for field in fields}
+
+
+READERS = {
+    '.csv': read_csv,
+    '.json': read_json,
+}
+
+
+def read_file(path, fields):
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in READERS:
+        raise ValueError(
+            f'{path}: поддерживаются форматы ' + ', '.join(READERS)
+        )
+    return READERS[extension](path, fields)
+
+
+class BulkLoader:
+    """
+    Пакетная идемпотентная загрузка справочника. Дубликаты по
+    уникальному ключу отбрасываются в памяти, уже существующие
+    в базе строки пропускаются при вставке
+    """
+
+    def __init__(self, model, fields, unique_fields, chunk_size=1000,
+                 use_copy=False):
+        self.model = model
+        self.fields = fields
+        self.unique_fields = unique_fields
+        self.chunk_size = chunk_size
+        self.use_copy = use_copy and connection.vendor == 'postgresql'
+
+    def deduplicate(self, rows):
+        seen = set()
+        for row in rows:
+            key = tuple(row[field] for field in self.unique_fields)
+            if key not in seen:
+                seen.add(key)
+                yield row
+
+    def load(self, rows, progress=None):
+        """Загружает строки, возвращает (уникальных строк, добавлено)"""
+        before = self.model.objects.count()
+        unique = 0
+        for chunk in chunked(self.deduplicate(rows), self.chunk_size):
+            with transaction.atomic():
+                if self.use_copy:
+                    self.copy_chunk(chunk)
+                else:
+                    self.model.objects.bulk_create(
+                        (self.model(**row) for row in chunk),
+                        ignore_conflicts=True
+                    )
+            unique += len(chunk)
+            if progress:
+                progress(unique)
+        return unique, self.model.objects.count() - before
+
+    def copy_chunk(self, chunk):
+        table = self.model._meta.db_table
+        columns = ', '.join(
+            connection.ops.quote_name(
+                self.model._meta.get_field(field).column
+            ) for field in self.fields
+        )
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in chunk:
+            writer.writerow([row[field] for field in self.fields])
+        buffer.seek(0)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'CREATE TEMP TABLE IF NOT EXISTS bulk_{table} '
+                f'ON COMMIT DROP AS SELECT {columns} FROM {table} '
+                f'WITH NO DATA'
+            )
+            cursor.cursor.copy_expert(
+                f'COPY bulk_{table} ({columns}) FROM STDIN WITH CSV', buffer
+            )
+            cursor.execute(
+                f'INSERT INTO {table} ({columns}) '
+                f'SELECT {columns} FROM bulk_{table} ON CONFLICT DO NOTHING'
+            )
@@ -1,31 +1,56 @@
-import csv
+import os
+import time
 
+from django.conf import settings
 from django.core.management.base import BaseCommand
+from recipes import reference
+from recipes.loaders import BulkLoader, read_file
 from recipes.models import Ingredient, Tag
 
-PATH_CSV_INGREDIENTS = './data/ingredients.csv'
-PATH_CSV_TAGS = './data/tags.csv'
+PATH_INGREDIENTS = os.path.join(settings.BASE_DIR, 'data', 'ingredients.csv')
+PATH_TAGS = os.path.join(settings.BASE_DIR, 'data', 'tags.csv')
+CHUNK_SIZE = 1000
 
 
 class Command(BaseCommand):
-    help = 'Загрузка csv в ДТ'
+    help = 'Загрузка ингредиентов и тегов из csv или json в БД'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ingredients', default=PATH_INGREDIENTS,
+                            help='Файл ингредиентов (csv или json)')
+        parser.add_argument('--tags', default=PATH_TAGS,
+                            help='Файл тегов (csv или json)')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                            help='Количество строк в одной вставке')
+        parser.add_argument('--copy', action='store_true',
+                            help='Загрузка через COPY (только PostgreSQL)')
 
     def handle(self, *args, **options):
-        with open(PATH_CSV_INGREDIENTS, 'r', encoding='utf-8') as file:
-            reader = csv.reader(file)
-            next(reader)
-            for name, measurement_unit in reader:
-                Ingredient.objects.get_or_create(
-                    name=name,
-                    measurement_unit=measurement_unit
-                )
-        with open(PATH_CSV_TAGS, 'r', encoding='utf-8') as file:
-            reader = csv.reader(file)
-            next(reader)
-            for name, color, slug in reader:
-                Tag.objects.get_or_create(
-                    name=name,
-                    color=color,
-                    slug=slug
-                )
+        self.load(Ingredient, ('name', 'measurement_unit'),
+                  ('name', 'measurement_unit'),
+                  options['ingredients'], options)
+        self.load(Tag, ('name', 'color', 'slug'), ('slug',),
+                  options['tags'], options)
+        # bulk-загрузка не отправляет сигналов, справочники
+        # сбрасываются явно
+        reference.INGREDIENTS.invalidate()
+        reference.TAGS.invalidate()
         self.stdout.write('Данные из списка ингредиентов и тегов загружены')
+
+    def load(self, model, fields, unique_fields, path, options):
+        loader = BulkLoader(model, fields, unique_fields,
+                            chunk_size=options['chunk_size'],
+                            use_copy=options['copy'])
+        start = time.monotonic()
+
+        def progress(count):
+            if options['verbosity'] > 1:
+                self.stdout.write(f'{path}: обработано {count} строк')
+
+        unique, created = loader.load(read_file(path, fields), progress)
+        elapsed = time.monotonic() - start
+        self.stdout.write(
+            f'{model._meta.verbose_name_plural}: {unique} уникальных '
+            f'строк, добавлено {created} за {elapsed:.2f} с '
+            f'({unique / elapsed if elapsed else unique:.0f} строк/с)'
+        )
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+from recipes import recommendations
+
+
+class Command(BaseCommand):
+    help = ('Пересчёт похожих рецептов по совместному добавлению '
+            'в избранное и списки покупок')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true',
+                            help='Пересчитать все рецепты, а не только '
+                                 'затронутые с прошлого запуска')
+        parser.add_argument('--workers', type=int,
+                            help='Количество процессов расчёта')
+
+    def handle(self, *args, **options):
+        start = time.monotonic()
+        count = recommendations.build(options['full'], options['workers'])
+        self.stdout.write(
+            f'Похожие рецепты пересчитаны для {count} рецептов '
+            f'за {time.monotonic() - start:.1f} с'
+        )
@@ -0,0 +1,161 @@
+import io
+import random
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from PIL import Image
+from recipes import feed, images, reference, versions
+from recipes.cart import rebuild
+from recipes.counters import recount
+from recipes.loaders import chunked
+from recipes.models import (CartSummary, Favourites, FeedEntry, Ingredient,
+                            IngredientAmount, Recipe, ShopList, Tag)
+from user.models import Subscription, User
+
+PREFIX = 'bench'
+PASSWORD = 'bench-password'
+CHUNK_SIZE = 1000
+WORDS = (
+    'суп', 'салат', 'пирог', 'каша', 'рагу', 'запеканка', 'омлет',
+    'паста', 'плов', 'котлеты', 'блины', 'борщ', 'соус', 'десерт',
+    'домашний', 'быстрый', 'острый', 'сладкий', 'летний', 'постный',
+)
+
+
+def make_image():
+    """Одна маленькая картинка на все рецепты набора"""
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 48), (200, 120, 40)).save(buffer, 'PNG')
+    content = buffer.getvalue()
+    name = images.store_original(
+        ContentFile(content, name=f'{images.content_name(content)}.png')
+    )
+    images.make_thumbnails(name)
+    return name
+
+
+class Command(BaseCommand):
+    help = ('Генерация синтетического набора данных для бенчмарков: '
+            'пользователи, рецепты, избранное, подписки и покупки')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--recipes', type=int, default=1000)
+        parser.add_argument('--ingredients-per-recipe', type=int, default=8)
+        parser.add_argument('--favourites', type=int, default=20,
+                            help='Рецептов в избранном у пользователя')
+        parser.add_argument('--subscriptions', type=int, default=10,
+                            help='Подписок у пользователя')
+        parser.add_argument('--cart', type=int, default=5,
+                            help='Рецептов в списке покупок у пользователя')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--clear', action='store_true',
+                            help='Удалить ранее созданный набор')
+
+    def handle(self, *args, **options):
+        start = time.monotonic()
+        rng = random.Random(options['seed'])
+        if options['clear']:
+            User.objects.filter(username__startswith=f'{PREFIX}_').delete()
+        if not Ingredient.objects.exists() or not Tag.objects.exists():
+            call_command('add_ingredients', verbosity=0)
+        with transaction.atomic():
+            users = self.create_users(options['users'])
+            recipes = self.create_recipes(rng, users, options)
+            self.create_relations(rng, users, recipes, options)
+        recount(Recipe, Favourites, ShopList, User, Subscription)
+        rebuild(CartSummary, ShopList)
+        feed.rebuild(FeedEntry, Subscription, Recipe, users)
+        call_command('update_search_index', verbosity=0)
+        call_command('build_recommendations', full=True, verbosity=0)
+        reference.TAGS.invalidate()
+        reference.INGREDIENTS.invalidate()
+        versions.bump_feed()
+        self.stdout.write(
+            f'Создано пользователей: {len(users)}, рецептов: {len(recipes)} '
+            f'за {time.monotonic() - start:.1f} с. Пароль: {PASSWORD}'
+        )
+
+    def create_users(self, count):
+        offset = User.objects.filter(username__startswith=f'{PREFIX}_').count()
+        password = make_password(PASSWORD)
+        users = [
+            User(username=f'{PREFIX}_{number}',
+                 email=f'{PREFIX}_{number}@example.com',
+                 first_name='Тест', last_name=str(number),
+                 password=password)
+            for number in range(offset, offset + count)
+        ]
+        for chunk in chunked(users, CHUNK_SIZE):
+            User.objects.bulk_create(chunk)
+        return list(User.objects.filter(
+            username__in=[user.username for user in users]
+        ).values_list('id', flat=True))
+
+    def create_recipes(self, rng, users, options):
+        image = make_image()
+        ingredient_ids = list(Ingredient.objects.values_list('id', flat=True))
+        tag_ids = list(Tag.objects.values_list('id', flat=True))
+        per_recipe = min(options['ingredients_per_recipe'],
+                         len(ingredient_ids))
+        recipe_ids = []
+        for chunk in chunked(range(options['recipes']), CHUNK_SIZE):
+            recipes = Recipe.objects.bulk_create(
+                Recipe(
+                    author_id=rng.choice(users),
+                    name=' '.join(rng.sample(WORDS, 3)).capitalize(),
+                    text=' '.join(rng.choices(WORDS, k=40)),
+                    image=image,
+                    thumbnails_ready=True,
+                    cooking_time=rng.randint(5, 180),
+                )
+                for _ in chunk
+            )
+            if recipes and recipes[0].pk is None:
+                recipes = Recipe.objects.filter(
+                    author_id__in=users
+                ).order_by('-id')[:len(recipes)]
+            IngredientAmount.objects.bulk_create(
+                IngredientAmount(recipes=recipe, ingredient_id=ingredient_id,
+                                 amount=rng.randint(1, 500))
+                for recipe in recipes
+                for ingredient_id in rng.sample(ingredient_ids, per_recipe)
+            )
+            Recipe.tags.through.objects.bulk_create(
+                Recipe.tags.through(recipe_id=recipe.pk, tag_id=tag_id)
+                for recipe in recipes
+                for tag_id in rng.sample(tag_ids,
+                                         rng.randint(1, len(tag_ids)))
+            )
+            recipe_ids.extend(recipe.pk for recipe in recipes)
+        return recipe_ids
+
+    def create_relations(self, rng, users, recipes, options):
+        def sample(population, count):
+            return rng.sample(population, min(count, len(population)))
+
+        for model, option in ((Favourites, 'favourites'),
+                              (ShopList, 'cart')):
+            model.objects.bulk_create(
+                (
+                    model(user_id=user_id, recipe_id=recipe_id)
+                    for user_id in users
+                    for recipe_id in sample(recipes, options[option])
+                ),
+                batch_size=CHUNK_SIZE,
+                ignore_conflicts=True
+            )
+        Subscription.objects.bulk_create(
+            (
+                Subscription(user_id=user_id, author_id=author_id)
+                for user_id in users
+                for author_id in sample(users, options['subscriptions'] + 1)
+                if author_id != user_id
+            ),
+            batch_size=CHUNK_SIZE,
+            ignore_conflicts=True
+        )
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from recipes.images import make_thumbnails
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Создание недостающих миниатюр картинок рецептов'
+
+    def handle(self, *args, **options):
+        names = (
+            Recipe.objects.exclude(image='')
+            .values_list('image', flat=True).distinct()
+        )
+        for name in names.iterator():
+            make_thumbnails(name)
+        self.stdout.write('Миниатюры созданы')
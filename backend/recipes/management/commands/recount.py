@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from recipes import cart, feed
+from recipes.counters import recount
+from recipes.models import CartSummary, Favourites, FeedEntry, Recipe, ShopList
+from user.models import Subscription, User
+
+
+class Command(BaseCommand):
+    help = ('Пересчёт счётчиков избранного, покупок, рецептов и подписчиков, '
+            'итогов списков покупок и лент подписок')
+
+    def handle(self, *args, **options):
+        recount(Recipe, Favourites, ShopList, User, Subscription)
+        cart.rebuild(CartSummary, ShopList)
+        feed.rebuild(FeedEntry, Subscription, Recipe)
+        self.stdout.write(
+            'Счётчики, итоги списков покупок и ленты пересчитаны'
+        )
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from recipes.models import Recipe
+from recipes.search import get_backend, index_recipes
+
+
+class Command(BaseCommand):
+    help = 'Перестроение поискового индекса рецептов'
+
+    def handle(self, *args, **options):
+        if get_backend() is None:
+            self.stdout.write('Для текущей БД нет поискового бэкенда')
+            return
+        index_recipes(Recipe.objects.all())
+        self.stdout.write('Поисковый индекс рецептов перестроен')
@@ -0,0 +1,114 @@
+# Generated by Django 3.2 on 2026-10-18 12:00
+
+import django.contrib.postgres.search
+from django.conf import settings
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+from django.db.models import (Aggregate, F, OuterRef, Subquery, TextField,
+                              Value)
+from django.db.models.functions import Coalesce
+
+import recipes.indexes
+
+FTS_TABLE = 'recipes_recipe_fts'
+FTS_COLUMNS = ('name', 'text', 'ingredients', 'tags')
+WEIGHTS = {'name': 'A', 'tags': 'B', 'ingredients': 'B', 'text': 'C'}
+
+
+class GroupConcat(Aggregate):
+    function = 'GROUP_CONCAT'
+    output_field = TextField()
+
+    def __init__(self, expression, delimiter):
+        super().__init__(expression, Value(delimiter))
+
+
+def get_names(model, recipe_field, name_field, aggregate):
+    return Coalesce(
+        Subquery(
+            model.objects.filter(**{recipe_field: OuterRef('pk')})
+            .order_by().values(recipe_field)
+            .annotate(names=aggregate(name_field, ' ')).values('names')
+        ),
+        Value(''),
+        output_field=TextField()
+    )
+
+
+def get_document(apps, aggregate):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    IngredientAmount = apps.get_model('recipes', 'IngredientAmount')
+    return {
+        'name': F('name'),
+        'text': F('text'),
+        'ingredients': get_names(IngredientAmount, 'recipes',
+                                 'ingredient__name', aggregate),
+        'tags': get_names(Recipe.tags.through, 'recipe', 'tag__name',
+                          aggregate),
+    }
+
+
+def index_postgresql(apps, schema_editor):
+    document = get_document(apps, StringAgg)
+    vector = None
+    for field, weight in WEIGHTS.items():
+        part = SearchVector(document[field], weight=weight,
+                            config=settings.SEARCH_CONFIG)
+        vector = part if vector is None else vector + part
+    apps.get_model('recipes', 'Recipe').objects.update(search_vector=vector)
+
+
+def index_sqlite(apps, schema_editor):
+    schema_editor.execute(
+        f'CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} '
+        f'USING fts5({", ".join(FTS_COLUMNS)}, '
+        "tokenize = 'unicode61 remove_diacritics 2')"
+    )
+    document = get_document(apps, GroupConcat)
+    rows, params = apps.get_model('recipes', 'Recipe').objects.order_by(
+    ).annotate(**{
+        f'document_{column}': document[column] for column in FTS_COLUMNS
+    }).values_list(
+        'pk', *(f'document_{column}' for column in FTS_COLUMNS)
+    ).query.sql_with_params()
+    schema_editor.execute(
+        f'INSERT INTO {FTS_TABLE} (rowid, {", ".join(FTS_COLUMNS)}) {rows}',
+        params
+    )
+
+
+def drop_sqlite(apps, schema_editor):
+    schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+INDEX = {'postgresql': index_postgresql, 'sqlite': index_sqlite}
+DROP = {'sqlite': drop_sqlite}
+
+
+def run_for_vendor(functions):
+    def run(apps, schema_editor):
+        function = functions.get(schema_editor.connection.vendor)
+        if function is not None:
+            function(apps, schema_editor)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0005_ingredient_name_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True, verbose_name='Поисковый вектор'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=recipes.indexes.SearchVectorIndex(fields=['search_vector'], name='recipes_recipe_search_idx'),
+        ),
+        migrations.RunPython(run_for_vendor(INDEX), run_for_vendor(DROP)),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 3.2 on 2026-10-18 12:00
+
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+UNITS = {
+    'кг': ('г', 1000),
+    'л': ('мл', 1000),
+}
+
+
+def rebuild_all(apps, schema_editor):
+    CartSummary = apps.get_model('recipes', 'CartSummary')
+    ShopList = apps.get_model('recipes', 'ShopList')
+    totals = defaultdict(int)
+    for user_id, name, measurement_unit, amount in ShopList.objects.values_list(
+        'user_id', 'recipe__ingredientamount__ingredient__name',
+        'recipe__ingredientamount__ingredient__measurement_unit',
+        'recipe__ingredientamount__amount'
+    ).iterator():
+        if amount is not None:
+            unit, factor = UNITS.get(measurement_unit, (measurement_unit, 1))
+            totals[user_id, name, unit] += amount * factor
+    CartSummary.objects.bulk_create(
+        (
+            CartSummary(user_id=user_id, name=name, measurement_unit=unit,
+                        amount=amount)
+            for (user_id, name, unit), amount in totals.items()
+        ),
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0007_recipe_pub_date_id_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CartSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200, verbose_name='Название')),
+                ('measurement_unit', models.CharField(max_length=200, verbose_name='Единица измерения')),
+                ('amount', models.PositiveIntegerField(default=0, verbose_name='Количество')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cart_summary', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Итог списка покупок',
+                'verbose_name_plural': 'Итоги списков покупок',
+                'ordering': ('name', 'measurement_unit'),
+                'default_related_name': 'cart_summary',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='cartsummary',
+            constraint=models.UniqueConstraint(fields=('user', 'name', 'measurement_unit'), name='unique_cart_summary'),
+        ),
+        migrations.RunPython(rebuild_all, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 3.2 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0009_recipe_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='favourites',
+            index=models.Index(fields=['user', 'recipe'], name='favourites_user_recipe_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='shoplist',
+            index=models.Index(fields=['recipe', 'user'], name='shop_list_recipe_user_idx'),
+        ),
+        # Промежуточная таблица тегов создаётся Django с индексами
+        # (recipe_id, tag_id) и tag_id; для фильтра по тегу нужен
+        # составной (tag_id, recipe_id)
+        migrations.RunSQL(
+            'CREATE INDEX recipe_tags_tag_recipe_idx '
+            'ON recipes_recipe_tags (tag_id, recipe_id)',
+            'DROP INDEX recipe_tags_tag_recipe_idx',
+        ),
+    ]
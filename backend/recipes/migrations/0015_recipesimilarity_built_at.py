@@ -0,0 +1,22 @@
+# Generated by Django 3.2 on 2026-10-18 12:00
+
+import datetime
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0014_cartsummary_updated_at'),
+    ]
+
+    operations = [
+        # Существующие строки считаются рассчитанными давно: первый
+        # запуск после миграции пересчитает все рецепты
+        migrations.AddField(
+            model_name='recipesimilarity',
+            name='built_at',
+            field=models.DateTimeField(db_index=True, default=datetime.datetime(1970, 1, 1, 0, 0), verbose_name='Дата расчёта'),
+            preserve_default=False,
+        ),
+    ]
@@ -1,8 +1,14 @@
 from django.conf import settings
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MinValueValidator
 from django.db import models
+from django.db.models import F, Prefetch, Window
+from django.db.models.functions import RowNumber
 from user.models import User
 
+from .counters import CountersMixin
+from .indexes import SearchVectorIndex
+
 MIN_VALUE_FOR_AMOUNT = 1
 MIN_VALUE_FOR_COOKING_TIME = 1
 
@@ -70,9 +76,52 @@ class Tag(models.Model):
         return f'{self.name}'
 
 
-class Recipe(models.Model):
+class RecipeQuerySet(models.QuerySet):
+    """Построение выборки рецептов для выдачи через API"""
+
+    def with_related(self, author=True, tags=True, ingredients=True):
+        """Загружает автора, теги и ингредиенты фиксированным
+        числом запросов вне зависимости от количества рецептов.
+        Для тегов и ингредиентов берутся только id: остальные поля
+        сериализаторы получают из справочников в памяти.
+        Невыводимые связи можно не загружать"""
+        queryset = self.select_related('author') if author else self
+        prefetches = []
+        if tags:
+            prefetches.append(
+                Prefetch('tags', queryset=Tag.objects.only('id'))
+            )
+        if ingredients:
+            prefetches.append('ingredientamount_set')
+        return queryset.prefetch_related(*prefetches)
+
+    def latest_by_author(self, author_ids, limit=None):
+        """
+        Последние рецепты каждого из авторов одним запросом:
+        не больше limit на автора благодаря ROW_NUMBER() по автору
+        """
+        queryset = self.filter(author_id__in=author_ids).order_by(
+            '-pub_date', '-id'
+        )
+        if limit is None:
+            return queryset
+        sql, params = queryset.annotate(recipe_rank=Window(
+            RowNumber(),
+            partition_by=F('author_id'),
+            order_by=(F('pub_date').desc(), F('id').desc())
+        )).order_by().query.sql_with_params()
+        return self.raw(
+            f'SELECT * FROM ({sql}) ranked WHERE recipe_rank <= %s '
+            f'ORDER BY author_id, recipe_rank',
+            (*params, limit)
+        )
+
+
+class Recipe(CountersMixin, models.Model):
     """Модель рецептов"""
 
+    counter_fields = ('favourites_count', 'in_cart_count')
+
     author = models.ForeignKey(
         User,
         verbose_name='Автор',
@@ -82,6 +131,10 @@ class Recipe(models.Model):
         'Дата публикации',
         auto_now_add=True
     )
+    updated_at = models.DateTimeField(
+        verbose_name='Дата изменения',
+        auto_now=True
+    )
     name = models.CharField(
         verbose_name='Название',
         max_length=settings.LIMIT_CHAR_200,
@@ -96,6 +149,11 @@ class Recipe(models.Model):
         verbose_name='Описание',
         help_text='Описание для блюда'
     )
+    thumbnails_ready = models.BooleanField(
+        verbose_name='Миниатюры готовы',
+        default=False,
+        editable=False
+    )
     ingredients = models.ManyToManyField(
         Ingredient,
         verbose_name='Ингредиенты',
@@ -112,12 +170,39 @@ class Recipe(models.Model):
             MinValueValidator(MIN_VALUE_FOR_COOKING_TIME)
         ]
     )
+    favourites_count = models.PositiveIntegerField(
+        verbose_name='Добавлений в избранное',
+        default=0,
+        editable=False
+    )
+    in_cart_count = models.PositiveIntegerField(
+        verbose_name='Добавлений в список покупок',
+        default=0,
+        editable=False
+    )
+    search_vector = SearchVectorField(
+        verbose_name='Поисковый вектор',
+        null=True,
+        editable=False
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         ordering = ('-pub_date',)
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         default_related_name = 'recipes'
+        indexes = [
+            models.Index(
+                fields=('-pub_date', '-id'),
+                name='recipe_pub_date_id_idx',
+            ),
+            SearchVectorIndex(
+                fields=['search_vector'],
+                name='recipes_recipe_search_idx',
+            ),
+        ]
 
     def __str__(self):
         return f'{self.name[:20]}'
@@ -163,6 +248,10 @@ class AbstractModel(models.Model):
         on_delete=models.CASCADE,
         verbose_name='Список покупок',
     )
+    created = models.DateTimeField(
+        verbose_name='Дата добавления',
+        auto_now_add=True
+    )
 
     class Meta:
         abstract = True,
@@ -184,6 +273,12 @@ class Favourites(AbstractModel):
                 name='unique_favourite',
             )
         ]
+        indexes = [
+            models.Index(
+                fields=('user', 'recipe'),
+                name='favourites_user_recipe_idx',
+            )
+        ]
 
 
 class ShopList(AbstractModel):
@@ -199,3 +294,138 @@ class ShopList(AbstractModel):
                 name='unique_shop_list',
             )
         ]
+        indexes = [
+            models.Index(
+                fields=('recipe', 'user'),
+                name='shop_list_recipe_user_idx',
+            )
+        ]
+
+
+class CartSummary(models.Model):
+    """
+    Итог списка покупок пользователя: количество каждого
+    ингредиента в базовой единице измерения. Поддерживается
+    при изменении списка покупок и ингредиентов рецептов
+    """
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='Пользователь',
+    )
+    name = models.CharField(
+        verbose_name='Название',
+        max_length=settings.LIMIT_CHAR_200
+    )
+    measurement_unit = models.CharField(
+        verbose_name='Единица измерения',
+        max_length=settings.LIMIT_CHAR_200
+    )
+    amount = models.PositiveIntegerField(
+        verbose_name='Количество',
+        default=0
+    )
+    updated_at = models.DateTimeField(
+        verbose_name='Дата изменения',
+        auto_now=True
+    )
+
+    class Meta:
+        verbose_name = 'Итог списка покупок'
+        verbose_name_plural = 'Итоги списков покупок'
+        default_related_name = 'cart_summary'
+        ordering = ('name', 'measurement_unit')
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'name', 'measurement_unit'],
+                name='unique_cart_summary',
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.name} {self.amount} {self.measurement_unit}'
+
+
+class RecipeSimilarity(models.Model):
+    """
+    Ближайший сосед рецепта по совместному добавлению в избранное
+    и списки покупок. Заполняется командой build_recommendations
+    """
+
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='similar',
+        verbose_name='Рецепт',
+    )
+    similar = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Похожий рецепт',
+    )
+    score = models.FloatField(verbose_name='Сходство')
+    built_at = models.DateTimeField(
+        verbose_name='Дата расчёта',
+        db_index=True
+    )
+
+    class Meta:
+        verbose_name = 'Похожий рецепт'
+        verbose_name_plural = 'Похожие рецепты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['recipe', 'similar'],
+                name='unique_recipe_similarity',
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.recipe_id} ~ {self.similar_id} {self.score:.3f}'
+
+
+class FeedEntry(models.Model):
+    """
+    Запись ленты подписок: рецепт автора, на которого подписан
+    пользователь. Ленты заполняются при публикации рецепта
+    """
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed',
+        verbose_name='Подписчик',
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Рецепт',
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор',
+    )
+    pub_date = models.DateTimeField(verbose_name='Дата публикации')
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи лент'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_feed_entry',
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=('user', '-pub_date', '-recipe'),
+                name='feed_entry_timeline_idx',
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.user_id}: {self.recipe_id}'
@@ -0,0 +1,198 @@
+import heapq
+import math
+import multiprocessing
+from array import array
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Max, Sum
+from django.utils import timezone
+
+from .loaders import chunked
+from .models import Favourites, Recipe, RecipeSimilarity, ShopList
+
+CHUNK_SIZE = 1000
+
+# Разреженные векторы рецептов в процессах-обработчиках
+_user_items = {}
+_item_users = {}
+_options = (0, 1)
+
+
+def load_interactions():
+    """
+    Разреженные векторы: рецепты каждого пользователя и
+    пользователи каждого рецепта. Избранное и список покупок
+    объединяются; пользователи, у которых рецептов больше
+    RECOMMENDATIONS_MAX_USER_ITEMS, пропускаются, так как
+    квадратично удорожают расчёт и почти не несут сигнала
+    """
+    items = defaultdict(set)
+    for model in (Favourites, ShopList):
+        rows = model.objects.order_by().values_list('user_id', 'recipe_id')
+        for user_id, recipe_id in rows.iterator(chunk_size=10000):
+            items[user_id].add(recipe_id)
+    user_items = {}
+    item_users = defaultdict(lambda: array('q'))
+    for user_id, recipe_ids in items.items():
+        if len(recipe_ids) > settings.RECOMMENDATIONS_MAX_USER_ITEMS:
+            continue
+        user_items[user_id] = array('q', sorted(recipe_ids))
+        for recipe_id in recipe_ids:
+            item_users[recipe_id].append(user_id)
+    return user_items, dict(item_users)
+
+
+def init_worker(user_items, item_users, options):
+    global _user_items, _item_users, _options
+    _user_items, _item_users, _options = user_items, item_users, options
+
+
+def get_neighbours(recipe_ids):
+    """
+    Ближайшие соседи рецептов по косинусной мере между множествами
+    пользователей: число общих пользователей, делённое на корень
+    из произведения размеров множеств
+    """
+    limit, min_support = _options
+    result = []
+    for recipe_id in recipe_ids:
+        users = _item_users.get(recipe_id, ())
+        counts = defaultdict(int)
+        for user_id in users:
+            for other in _user_items[user_id]:
+                counts[other] += 1
+        counts.pop(recipe_id, None)
+        top = heapq.nlargest(limit, (
+            (count / math.sqrt(len(users) * len(_item_users[other])), -other)
+            for other, count in counts.items()
+            if count >= min_support
+        ))
+        result.append(
+            (recipe_id, [(-other, score) for score, other in top])
+        )
+    return result
+
+
+@contextmanager
+def compute(user_items, item_users, recipe_ids, workers):
+    """
+    Итератор соседей рецептов пачками по CHUNK_SIZE. При нескольких
+    обработчиках пачки считаются в пуле процессов, каждый из
+    которых получает векторы один раз при запуске
+    """
+    options = (settings.RECOMMENDATIONS_NEIGHBOURS,
+               settings.RECOMMENDATIONS_MIN_SUPPORT)
+    chunks = chunked(recipe_ids, CHUNK_SIZE)
+    if workers <= 1 or len(recipe_ids) <= CHUNK_SIZE:
+        init_worker(user_items, item_users, options)
+        yield map(get_neighbours, chunks)
+        return
+    # Пул запускается до транзакции записи: соединения с БД
+    # не должны наследоваться дочерними процессами
+    connections.close_all()
+    with multiprocessing.Pool(workers, initializer=init_worker,
+                              initargs=(user_items, item_users,
+                                        options)) as pool:
+        yield pool.imap_unordered(get_neighbours, chunks)
+
+
+def save(recipe_ids, neighbours, replace_all, built_at):
+    """Замена строк пересчитанных рецептов одной транзакцией"""
+    with transaction.atomic():
+        if replace_all:
+            RecipeSimilarity.objects.all().delete()
+        else:
+            for chunk in chunked(recipe_ids, CHUNK_SIZE):
+                RecipeSimilarity.objects.filter(recipe_id__in=chunk).delete()
+        for chunk in neighbours:
+            RecipeSimilarity.objects.bulk_create(
+                RecipeSimilarity(recipe_id=recipe_id, similar_id=other,
+                                 score=score, built_at=built_at)
+                for recipe_id, similar in chunk
+                for other, score in similar
+            )
+
+
+def get_changed(user_items, item_users, since):
+    """
+    Рецепты, соседи которых могли измениться после since: рецепты,
+    добавленные пользователями, и все рецепты, у которых с ними
+    есть общие пользователи, так как меняется норма их векторов
+    """
+    added = set()
+    for model in (Favourites, ShopList):
+        added.update(
+            model.objects.filter(created__gt=since)
+            .values_list('recipe_id', flat=True).iterator()
+        )
+    changed = set(added)
+    for recipe_id in added:
+        for user_id in item_users.get(recipe_id, ()):
+            changed.update(user_items[user_id])
+    return changed
+
+
+def build(full=False, workers=None):
+    """
+    Пересчёт таблицы похожих рецептов. Без full пересчитываются
+    только рецепты, затронутые добавлениями с последнего расчёта
+    сохранённых строк; удаления из избранного учитываются полным
+    пересчётом.
+    Возвращает количество пересчитанных рецептов
+    """
+    started = timezone.now()
+    since = None if full else RecipeSimilarity.objects.aggregate(
+        built_at=Max('built_at')
+    )['built_at']
+    user_items, item_users = load_interactions()
+    if since is None:
+        recipe_ids = sorted(item_users)
+    else:
+        recipe_ids = sorted(get_changed(user_items, item_users, since))
+    with compute(user_items, item_users, recipe_ids,
+                 workers or settings.RECOMMENDATIONS_WORKERS) as neighbours:
+        save(recipe_ids, neighbours, replace_all=since is None,
+             built_at=started)
+    return len(recipe_ids)
+
+
+def get_seeds(user_id):
+    """Последние рецепты пользователя в избранном и списке покупок"""
+    seeds = set()
+    for model in (Favourites, ShopList):
+        seeds.update(
+            model.objects.filter(user_id=user_id).order_by('-created')
+            .values_list('recipe_id', flat=True)
+            [:settings.RECOMMENDATIONS_SEEDS]
+        )
+    return seeds
+
+
+def recommend(user_id):
+    """
+    Id рекомендованных рецептов по убыванию суммарного сходства
+    с рецептами пользователя: не больше RECOMMENDATIONS_SEEDS * K
+    строк таблицы соседей. Без данных возвращаются популярные
+    рецепты
+    """
+    seeds = get_seeds(user_id)
+    recipe_ids = list(
+        RecipeSimilarity.objects.filter(recipe_id__in=seeds)
+        .exclude(similar_id__in=seeds)
+        .exclude(similar__author_id=user_id)
+        .values('similar_id')
+        .annotate(total=Sum('score'))
+        .order_by('-total', 'similar_id')
+        .values_list('similar_id', flat=True)
+        [:settings.RECOMMENDATIONS_LIMIT]
+    )
+    if recipe_ids:
+        return recipe_ids
+    return list(
+        Recipe.objects.exclude(pk__in=seeds).exclude(author_id=user_id)
+        .order_by('-favourites_count', '-id')
+        .values_list('id', flat=True)[:settings.RECOMMENDATIONS_LIMIT]
+    )
@@ -0,0 +1,126 @@
+import hashlib
+import threading
+import time
+import uuid
+from functools import cached_property
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.renderers import JSONRenderer
+
+from .models import Ingredient, Tag
+
+
+class Snapshot:
+    """
+    Справочник одной версии: строки в виде кортежей, доступ по id
+    и заранее отрендеренный JSON списка с сильным ETag
+    """
+
+    def __init__(self, fields, rows, version):
+        self.fields = fields
+        self.rows = rows
+        self.by_id = {row[0]: row for row in rows}
+        self.lookups = {}
+        self.version = version
+        self.built = time.monotonic()
+        self.content = JSONRenderer().render(
+            [self.as_dict(row) for row in rows]
+        )
+        self.etag = '"{}"'.format(hashlib.sha1(self.content).hexdigest())
+
+    def as_dict(self, row):
+        return dict(zip(self.fields, row))
+
+    def get(self, pk):
+        """Строка справочника в виде словаря или None"""
+        row = self.by_id.get(pk)
+        return row and self.as_dict(row)
+
+    def ids(self, field, values):
+        """id строк, у которых field принимает одно из values"""
+        lookup = self.lookups.get(field)
+        if lookup is None:
+            position = self.fields.index(field)
+            lookup = self.lookups[field] = {
+                row[position]: row[0] for row in self.rows
+            }
+        return [lookup[value] for value in values if value in lookup]
+
+    @cached_property
+    def index(self):
+        """Индекс автодополнения по названиям (для ингредиентов)"""
+        from .autocomplete import IngredientIndex
+        return IngredientIndex(self.rows)
+
+
+class ReferenceCache:
+    """
+    Справочник в памяти процесса. Версия хранится в общем кэше
+    и меняется сигналами при правке данных; она проверяется не чаще
+    раза в REFERENCE_CHECK_INTERVAL секунд, а данные перечитываются
+    при смене версии или не реже раза в REFERENCE_CACHE_TTL секунд
+    """
+
+    def __init__(self, model, fields):
+        self.model = model
+        self.fields = fields
+        self.version_key = f'reference:{model._meta.model_name}:version'
+        self.snapshot = None
+        self.checked = 0
+        self.lock = threading.Lock()
+
+    def get_version(self):
+        version = cache.get(self.version_key)
+        if version is not None:
+            return version
+        cache.add(self.version_key, uuid.uuid4().hex, timeout=None)
+        return cache.get(self.version_key)
+
+    def invalidate(self):
+        """Помечает справочники всех процессов устаревшими"""
+        cache.set(self.version_key, uuid.uuid4().hex, timeout=None)
+        self.checked = 0
+
+    def is_stale(self, version):
+        return (
+            self.snapshot is None
+            or self.snapshot.version != version
+            or time.monotonic() - self.snapshot.built
+            > settings.REFERENCE_CACHE_TTL
+        )
+
+    def get(self):
+        now = time.monotonic()
+        if (
+            self.snapshot is not None
+            and now - self.checked < settings.REFERENCE_CHECK_INTERVAL
+        ):
+            return self.snapshot
+        version = self.get_version()
+        if self.is_stale(version):
+            with self.lock:
+                if self.is_stale(version):
+                    self.snapshot = Snapshot(
+                        self.fields,
+                        list(self.model.objects.order_by('id').values_list(
+                            *self.fields
+                        )),
+                        version
+                    )
+        self.checked = now
+        return self.snapshot
+
+
+TAGS = ReferenceCache(Tag, ('id', 'name', 'color', 'slug'))
+INGREDIENTS = ReferenceCache(Ingredient, ('id', 'name', 'measurement_unit'))
+
+
+def tags():
+    """Текущая версия справочника тегов"""
+    return TAGS.get()
+
+
+def ingredients():
+    """Текущая версия справочника ингредиентов"""
+    return INGREDIENTS.get()
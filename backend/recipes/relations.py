@@ -0,0 +1,148 @@
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.db import connection, transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from . import cart, user_state
+from .counters import change_counter
+from .models import Favourites, Recipe, ShopList
+
+ADDED = 'added'
+REMOVED = 'removed'
+EXISTS = 'exists'
+MISSING = 'missing'
+NOT_FOUND = 'not_found'
+
+# Изменения, накопленные в batched() текущего потока
+_batch = threading.local()
+
+COUNTERS = {
+    Favourites: 'favourites_count',
+    ShopList: 'in_cart_count',
+}
+
+
+def check(model, user_id, recipe_ids):
+    """
+    Одним запросом: для каждого существующего рецепта из recipe_ids
+    признак того, что он уже есть у пользователя в model
+    """
+    recipes = Recipe.objects.only('id').annotate(selected=Exists(
+        model.objects.filter(user_id=user_id, recipe_id=OuterRef('pk'))
+    )).in_bulk(recipe_ids)
+    return {pk: recipe.selected for pk, recipe in recipes.items()}
+
+
+def insert(model, user_id, recipe_ids):
+    """
+    Вставляет строки одним INSERT ... ON CONFLICT DO NOTHING и
+    возвращает id рецептов, строки которых вставил именно этот
+    запрос: строки, успевшие появиться в параллельном запросе,
+    пропускаются (PostgreSQL и SQLite 3.35+)
+    """
+    fields = [model._meta.get_field(name)
+              for name in ('user', 'recipe', 'created')]
+    created = fields[2].get_db_prep_save(timezone.now(), connection)
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'INSERT INTO {} ({}) VALUES {} ON CONFLICT DO NOTHING '
+            'RETURNING {}'.format(
+                quote(model._meta.db_table),
+                ', '.join(quote(field.column) for field in fields),
+                ', '.join(['(%s, %s, %s)'] * len(recipe_ids)),
+                quote(fields[1].column)
+            ),
+            [value for pk in recipe_ids for value in (user_id, pk, created)]
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def after_change(model, user_id, recipe_ids, sign):
+    """
+    Последствия добавления (sign=1) или удаления (sign=-1) строк:
+    счётчики рецептов, состояние пользователя и итог списка покупок
+    """
+    change_counter(Recipe.objects.filter(pk__in=recipe_ids),
+                   COUNTERS[model], sign)
+    user_state.invalidate(user_id)
+    if model is ShopList:
+        cart.add_recipes(user_id, recipe_ids, sign)
+
+
+def changed(model, user_id, recipe_id, sign):
+    """
+    Изменение одной строки из сигнала: применяется сразу или,
+    внутри batched(), откладывается до конца блока
+    """
+    changes = getattr(_batch, 'changes', None)
+    if changes is None:
+        after_change(model, user_id, [recipe_id], sign)
+    else:
+        changes[model, user_id, sign].append(recipe_id)
+
+
+@contextmanager
+def batched():
+    """
+    Сигналы строк избранного и списка покупок внутри блока
+    копятся и применяются одним after_change на модель,
+    пользователя и направление изменения
+    """
+    if getattr(_batch, 'changes', None) is not None:
+        yield
+        return
+    _batch.changes = defaultdict(list)
+    try:
+        yield
+        changes = _batch.changes
+    finally:
+        _batch.changes = None
+    for (model, user_id, sign), recipe_ids in changes.items():
+        after_change(model, user_id, recipe_ids, sign)
+
+
+def add(model, user_id, recipe_ids):
+    """
+    Добавляет рецепты в избранное или список покупок одной вставкой;
+    счётчики меняются только для действительно вставленных строк.
+    Возвращает результат для каждого id: ADDED, EXISTS или NOT_FOUND
+    """
+    selected = check(model, user_id, recipe_ids)
+    results = {
+        pk: NOT_FOUND if pk not in selected
+        else EXISTS if selected[pk] else ADDED
+        for pk in recipe_ids
+    }
+    added = [pk for pk, result in results.items() if result == ADDED]
+    if added:
+        with transaction.atomic():
+            inserted = insert(model, user_id, added)
+            if inserted:
+                after_change(model, user_id, inserted, 1)
+        for pk in set(added) - set(inserted):
+            results[pk] = EXISTS
+    return results
+
+
+def remove(model, user_id, recipe_ids):
+    """
+    Убирает рецепты из избранного или списка покупок одним DELETE,
+    сигналы удаления строк применяются пакетом. Возвращает
+    результат для каждого id: REMOVED, MISSING или NOT_FOUND
+    """
+    selected = check(model, user_id, recipe_ids)
+    results = {
+        pk: NOT_FOUND if pk not in selected
+        else REMOVED if selected[pk] else MISSING
+        for pk in recipe_ids
+    }
+    removed = [pk for pk, result in results.items() if result == REMOVED]
+    if removed:
+        with transaction.atomic(), batched():
+            model.objects.filter(user_id=user_id,
+                                 recipe_id__in=removed).delete()
+    return results
@@ -0,0 +1,211 @@
+import re
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVector)
+from django.db import connection
+from django.db.models import (Aggregate, F, OuterRef, QuerySet, Subquery,
+                              TextField, Value)
+from django.db.models.functions import Coalesce
+
+from .models import IngredientAmount, Recipe
+
+FTS_TABLE = 'recipes_recipe_fts'
+WORD = re.compile(r'\w+')
+
+
+def get_words(terms):
+    """Слова поискового запроса без служебных символов"""
+    return [word for term in terms for word in WORD.findall(term)]
+
+
+class GroupConcat(Aggregate):
+    """Строки группы через разделитель (GROUP_CONCAT в SQLite)"""
+
+    function = 'GROUP_CONCAT'
+    output_field = TextField()
+
+    def __init__(self, expression, delimiter, **extra):
+        super().__init__(expression, Value(delimiter), **extra)
+
+
+def get_names(model, recipe_field, name_field, aggregate):
+    """Названия связанных с рецептом объектов одной строкой"""
+    return Coalesce(
+        Subquery(
+            model.objects.filter(**{recipe_field: OuterRef('pk')})
+            .order_by().values(recipe_field)
+            .annotate(names=aggregate(name_field, ' ')).values('names')
+        ),
+        Value(''),
+        output_field=TextField()
+    )
+
+
+def get_document(aggregate):
+    """
+    Выражения текстовых полей рецепта, по которым выполняется
+    поиск; названия ингредиентов и тегов собираются подзапросами
+    """
+    return {
+        'name': F('name'),
+        'text': F('text'),
+        'ingredients': get_names(IngredientAmount, 'recipes',
+                                 'ingredient__name', aggregate),
+        'tags': get_names(Recipe.tags.through, 'recipe', 'tag__name',
+                          aggregate),
+    }
+
+
+class PostgresSearchBackend:
+    """Поиск по хранимому tsvector с GIN-индексом и ранжированием"""
+
+    weights = {'name': 'A', 'tags': 'B', 'ingredients': 'B', 'text': 'C'}
+
+    def index(self, recipes):
+        """Векторы рецептов из recipes одним UPDATE"""
+        document = get_document(StringAgg)
+        vector = None
+        for field, weight in self.weights.items():
+            part = SearchVector(document[field], weight=weight,
+                                config=settings.SEARCH_CONFIG)
+            vector = part if vector is None else vector + part
+        Recipe.objects.filter(pk__in=recipes).update(search_vector=vector)
+
+    def remove(self, recipe_id):
+        """Вектор удаляется вместе со строкой рецепта"""
+
+    def search(self, queryset, words):
+        query = SearchQuery(
+            ' & '.join(f'{word}:*' for word in words),
+            search_type='raw',
+            config=settings.SEARCH_CONFIG
+        )
+        return queryset.filter(search_vector=query).annotate(
+            search_rank=SearchRank(F('search_vector'), query)
+        ).order_by('-search_rank', '-pub_date')
+
+
+class SqliteSearchBackend:
+    """
+    Поиск по виртуальной таблице FTS5 для SQLite: те же поля
+    и ранжирование bm25
+    """
+
+    columns = ('name', 'text', 'ingredients', 'tags')
+    weights = (10.0, 1.0, 5.0, 5.0)
+
+    def index(self, recipes):
+        """Строки рецептов из recipes заменяются двумя запросами"""
+        recipes = Recipe.objects.filter(pk__in=recipes).order_by()
+        ids, ids_params = recipes.values('pk').query.sql_with_params()
+        rows, rows_params = recipes.annotate(**{
+            f'document_{field}': expression
+            for field, expression in get_document(GroupConcat).items()
+        }).values_list(
+            'pk', *(f'document_{column}' for column in self.columns)
+        ).query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({ids})', ids_params
+            )
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, {", ".join(self.columns)}) '
+                f'{rows}',
+                rows_params
+            )
+
+    def remove(self, recipe_id):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [recipe_id]
+            )
+
+    def search(self, queryset, words):
+        table = connection.ops.quote_name(queryset.model._meta.db_table)
+        # Соединение с таблицей FTS5: количество и страницы считает
+        # сама БД, а bm25 тем меньше, чем релевантнее рецепт
+        return queryset.extra(
+            select={'search_rank': 'bm25({}, {})'.format(
+                FTS_TABLE, ', '.join(map(str, self.weights))
+            )},
+            tables=[FTS_TABLE],
+            where=[f'{FTS_TABLE}.rowid = {table}.id',
+                   f'{FTS_TABLE} MATCH %s'],
+            params=[' '.join(f'"{word}"*' for word in words)]
+        ).order_by('search_rank', '-pub_date')
+
+
+BACKENDS = {
+    'postgresql': PostgresSearchBackend,
+    'sqlite': SqliteSearchBackend,
+}
+
+
+def get_backend():
+    """Поисковый бэкенд текущей БД или None, если он не поддерживается"""
+    backend = BACKENDS.get(connection.vendor)
+    return backend and backend()
+
+
+_pending = threading.local()
+
+
+@contextmanager
+def deferred_indexing():
+    """
+    Откладывает индексацию рецептов до выхода из блока, чтобы
+    рецепт, изменённый несколькими запросами, индексировался один раз
+    """
+    if getattr(_pending, 'ids', None) is not None:
+        yield
+        return
+    _pending.ids = set()
+    try:
+        yield
+        ids = _pending.ids
+    finally:
+        _pending.ids = None
+    index_recipes(ids)
+
+
+def index_recipes(recipes):
+    """
+    Индексирует рецепты: список объектов, id или выборку.
+    Выборка передаётся в БД подзапросом, без загрузки рецептов
+    """
+    backend = get_backend()
+    if backend is None:
+        return
+    if not isinstance(recipes, QuerySet):
+        recipes = [getattr(recipe, 'pk', recipe) for recipe in recipes]
+        if not recipes:
+            return
+    pending = getattr(_pending, 'ids', None)
+    if pending is None:
+        backend.index(recipes)
+    elif isinstance(recipes, QuerySet):
+        pending.update(recipes.values_list('pk', flat=True))
+    else:
+        pending.update(recipes)
+
+
+def remove_recipe(recipe_id):
+    backend = get_backend()
+    if backend is not None:
+        backend.remove(recipe_id)
+
+
+def search(queryset, terms):
+    """
+    Рецепты, подходящие под запрос, в порядке релевантности.
+    Возвращает None, если для текущей БД нет поискового бэкенда
+    """
+    backend = get_backend()
+    words = get_words(terms)
+    if backend is None or not words:
+        return None
+    return backend.search(queryset, words)
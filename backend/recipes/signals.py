@@ -0,0 +1,176 @@
+from django.db import transaction
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete, pre_save)
+from django.dispatch import receiver
+from user.models import User
+
+from . import cart, catalog, feed, reference, relations, search, versions
+from .counters import change_counter
+from .models import (CartSummary, Favourites, Ingredient, IngredientAmount,
+                     Recipe, ShopList, Tag)
+
+
+@receiver(post_save, sender=Favourites)
+@receiver(post_save, sender=ShopList)
+def add_relation(sender, instance, created, **kwargs):
+    if created:
+        relations.changed(sender, instance.user_id, instance.recipe_id, 1)
+
+
+@receiver(post_delete, sender=Favourites)
+@receiver(post_delete, sender=ShopList)
+def remove_relation(sender, instance, **kwargs):
+    relations.changed(sender, instance.user_id, instance.recipe_id, -1)
+
+
+@receiver(post_save, sender=Recipe)
+def increase_recipes_count(sender, instance, created, **kwargs):
+    if created:
+        change_counter(User.objects.filter(pk=instance.author_id),
+                       'recipes_count', 1)
+
+
+@receiver(post_save, sender=Recipe)
+def fan_out_recipe(sender, instance, created, **kwargs):
+    if created:
+        feed.schedule_fan_out(instance.pk)
+
+
+@receiver(post_delete, sender=Recipe)
+def decrease_recipes_count(sender, instance, **kwargs):
+    change_counter(User.objects.filter(pk=instance.author_id),
+                   'recipes_count', -1)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def invalidate_tags(sender, **kwargs):
+    reference.TAGS.invalidate()
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def invalidate_ingredients(sender, **kwargs):
+    reference.INGREDIENTS.invalidate()
+    transaction.on_commit(catalog.schedule_rebuild)
+
+
+@receiver(post_save, sender=Recipe)
+def index_recipe(sender, instance, **kwargs):
+    search.index_recipes([instance])
+
+
+@receiver(post_delete, sender=Recipe)
+def remove_recipe_from_index(sender, instance, **kwargs):
+    search.remove_recipe(instance.pk)
+
+
+@receiver(post_save, sender=IngredientAmount)
+@receiver(post_delete, sender=IngredientAmount)
+def index_ingredient_amount_recipe(sender, instance, **kwargs):
+    search.index_recipes([instance.recipes_id])
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def index_recipe_tags(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        search.index_recipes([instance])
+    elif pk_set:
+        search.index_recipes(pk_set)
+
+
+@receiver(post_save, sender=Tag)
+def index_tag_recipes(sender, instance, created, **kwargs):
+    if not created:
+        search.index_recipes(instance.recipes.all())
+
+
+@receiver(post_save, sender=Ingredient)
+def index_ingredient_recipes(sender, instance, created, **kwargs):
+    if not created:
+        search.index_recipes(Recipe.objects.filter(
+            ingredientamount__ingredient=instance
+        ))
+
+
+@receiver(pre_delete, sender=Recipe)
+def remove_recipe_from_carts(sender, instance, **kwargs):
+    """
+    Рецепт убирается из списков покупок до каскадного удаления,
+    пока его ингредиенты ещё доступны для итогов
+    """
+    ShopList.objects.filter(recipe=instance).delete()
+
+
+@receiver(pre_save, sender=IngredientAmount)
+def remember_ingredient_amount(sender, instance, **kwargs):
+    instance._previous = IngredientAmount.objects.filter(
+        pk=instance.pk
+    ).values_list('ingredient_id', 'amount').first()
+
+
+@receiver(post_save, sender=IngredientAmount)
+def change_cart_summary(sender, instance, **kwargs):
+    changes = {instance.ingredient_id: instance.amount}
+    previous = getattr(instance, '_previous', None)
+    if previous is not None:
+        ingredient_id, amount = previous
+        changes[ingredient_id] = changes.get(ingredient_id, 0) - amount
+    cart.change_recipe(instance.recipes_id, changes.items())
+
+
+@receiver(post_delete, sender=IngredientAmount)
+def remove_ingredient_from_cart_summary(sender, instance, **kwargs):
+    cart.change_recipe(instance.recipes_id,
+                       [(instance.ingredient_id, -instance.amount)])
+
+
+@receiver(post_save, sender=Ingredient)
+def rebuild_ingredient_cart_summary(sender, instance, created, **kwargs):
+    if not created:
+        cart.rebuild(CartSummary, ShopList, ShopList.objects.filter(
+            recipe__ingredientamount__ingredient=instance
+        ).values_list('user_id', flat=True).distinct())
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def forget_recipe_version(sender, instance, **kwargs):
+    versions.forget([instance.pk])
+
+
+@receiver(post_save, sender=IngredientAmount)
+@receiver(post_delete, sender=IngredientAmount)
+def touch_ingredient_amount_recipe(sender, instance, **kwargs):
+    versions.touch(Recipe.objects.filter(pk=instance.recipes_id))
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def touch_recipe_tags(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse and action in ('post_add', 'post_remove', 'post_clear'):
+        versions.touch(Recipe.objects.filter(pk=instance.pk))
+    elif reverse and action in ('post_add', 'post_remove') and pk_set:
+        versions.touch(Recipe.objects.filter(pk__in=pk_set))
+    elif reverse and action == 'pre_clear':
+        versions.touch(instance.recipes.all())
+
+
+@receiver(post_save, sender=Tag)
+def touch_tag_recipes(sender, instance, created, **kwargs):
+    if not created:
+        versions.touch(instance.recipes.all())
+
+
+@receiver(pre_delete, sender=Tag)
+def touch_deleted_tag_recipes(sender, instance, **kwargs):
+    versions.touch(instance.recipes.all())
+
+
+@receiver(post_save, sender=Ingredient)
+def touch_ingredient_recipes(sender, instance, created, **kwargs):
+    if not created:
+        versions.touch(Recipe.objects.filter(
+            ingredientamount__ingredient=instance
+        ))
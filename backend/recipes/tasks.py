@@ -0,0 +1,15 @@
+from django.db import close_old_connections, connections
+
+
+def run_task(task, *args):
+    """
+    Выполняет задачу в фоновом потоке. Соединение потока с БД
+    проверяется перед задачей и закрывается после неё (с пулом
+    возвращается в него): поток не держит соединение между
+    задачами, а оборванное соединение не ломает следующие
+    """
+    close_old_connections()
+    try:
+        return task(*args)
+    finally:
+        connections.close_all()
@@ -0,0 +1,106 @@
+import hashlib
+from array import array
+from bisect import bisect_left
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from user.models import Subscription
+
+from .models import Favourites, ShopList
+
+CACHE_KEY = 'user_state:{}'
+
+
+def contains(ids, value):
+    """Проверка наличия значения в отсортированном массиве"""
+    index = bisect_left(ids, value)
+    return index < len(ids) and ids[index] == value
+
+
+def sorted_ids(queryset, field):
+    return array('q', sorted(queryset.values_list(field, flat=True)))
+
+
+class UserState:
+    """
+    Id рецептов в избранном и списке покупок пользователя и id
+    авторов, на которых он подписан, в виде отсортированных массивов
+    """
+
+    __slots__ = ('favourites', 'shop_list', 'subscriptions')
+
+    def __init__(self, favourites=(), shop_list=(), subscriptions=()):
+        self.favourites = array('q', favourites)
+        self.shop_list = array('q', shop_list)
+        self.subscriptions = array('q', subscriptions)
+
+    def __getstate__(self):
+        return self.favourites, self.shop_list, self.subscriptions
+
+    def __setstate__(self, state):
+        self.favourites, self.shop_list, self.subscriptions = state
+
+    @classmethod
+    def load(cls, user_id):
+        return cls(
+            sorted_ids(Favourites.objects.filter(user_id=user_id), 'recipe'),
+            sorted_ids(ShopList.objects.filter(user_id=user_id), 'recipe'),
+            sorted_ids(Subscription.objects.filter(user_id=user_id),
+                       'author')
+        )
+
+    def digest(self):
+        """Отпечаток состояния для ключей кэша ответов"""
+        arrays = (self.favourites, self.shop_list, self.subscriptions)
+        digest = hashlib.md5(repr(tuple(map(len, arrays))).encode())
+        for ids in arrays:
+            digest.update(ids.tobytes())
+        return digest.hexdigest()
+
+    def is_favorited(self, recipe_id):
+        return contains(self.favourites, recipe_id)
+
+    def is_in_shopping_cart(self, recipe_id):
+        return contains(self.shop_list, recipe_id)
+
+    def is_subscribed(self, author_id):
+        return contains(self.subscriptions, author_id)
+
+
+ANONYMOUS_STATE = UserState()
+
+
+def load(user_id):
+    """
+    Состояние пользователя из общего кэша или из БД. Без общего
+    кэша (SHARED_CACHE) оно каждый раз читается из БД: кэш процесса
+    не узнает об изменениях, сделанных в других процессах
+    """
+    if not settings.SHARED_CACHE:
+        return UserState.load(user_id)
+    key = CACHE_KEY.format(user_id)
+    state = cache.get(key)
+    if state is None:
+        state = UserState.load(user_id)
+        cache.set(key, state, settings.USER_STATE_CACHE_TIMEOUT)
+    return state
+
+
+def get_user_state(request):
+    """Состояние текущего пользователя, загружаемое один раз за запрос"""
+    if request is None or not request.user.is_authenticated:
+        return ANONYMOUS_STATE
+    if getattr(request, '_user_state', None) is None:
+        request._user_state = load(request.user.pk)
+    return request._user_state
+
+
+def invalidate(user_id):
+    """
+    Сбрасывает состояние после фиксации транзакции: сброшенное
+    раньше, его снова закэшировал бы параллельный запрос,
+    ещё не видящий изменений
+    """
+    key = CACHE_KEY.format(user_id)
+    transaction.on_commit(lambda: cache.delete(key))
@@ -0,0 +1,71 @@
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Recipe
+
+FEED_KEY = 'recipes:feed:version'
+RECIPE_KEY = 'recipes:updated:{}'
+
+
+def feed_version():
+    """
+    Время последнего изменения любого рецепта: меняется при правке
+    рецептов, их тегов, ингредиентов и авторов
+    """
+    version = cache.get(FEED_KEY)
+    if version is not None:
+        return version
+    cache.add(FEED_KEY, time.time(), timeout=None)
+    return cache.get(FEED_KEY)
+
+
+def bump_feed():
+    cache.set(FEED_KEY, time.time(), timeout=None)
+
+
+def recipe_version(recipe_id):
+    """
+    Время изменения рецепта (updated_at) или None, если рецепта нет.
+    Значение кэшируется до следующего изменения рецепта
+    """
+    key = RECIPE_KEY.format(recipe_id)
+    version = cache.get(key)
+    if version is not None:
+        return version
+    updated_at = Recipe.objects.filter(pk=recipe_id).values_list(
+        'updated_at', flat=True
+    ).first()
+    if updated_at is None:
+        return None
+    version = updated_at.timestamp()
+    cache.set(key, version, timeout=None)
+    return version
+
+
+def forget(recipe_ids):
+    """
+    Сбрасывает кэшированные версии рецептов и ленты после фиксации
+    транзакции, чтобы параллельный запрос не закэшировал старую версию
+    """
+    keys = [RECIPE_KEY.format(pk) for pk in recipe_ids]
+
+    def run():
+        cache.delete_many(keys)
+        bump_feed()
+
+    transaction.on_commit(run)
+
+
+def touch(recipes):
+    """
+    Отмечает рецепты изменёнными, когда меняются связанные с ними
+    данные, а сама строка рецепта не сохраняется
+    """
+    ids = list(recipes.values_list('pk', flat=True))
+    if not ids:
+        return
+    Recipe.objects.filter(pk__in=ids).update(updated_at=timezone.now())
+    forget(ids)
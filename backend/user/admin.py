@@ -24,11 +24,11 @@ class UserAdmin(admin.ModelAdmin):
     full_name.short_description = 'Полное имя'
 
     def count_sub(self, obj):
-        return obj.author.count()
+        return obj.subscribers_count
     count_sub.short_description = 'Количество подписчиков'
 
     def count_recipe(self, obj):
-        return obj.recipes.count()
+        return obj.recipes_count
     count_recipe.short_description = 'Количество рецептов'
 
 
@@ -1,11 +1,14 @@
 from django.conf import settings
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from recipes.counters import CountersMixin
 
 
-class User(AbstractUser):
+class User(CountersMixin, AbstractUser):
     """Кастомная модель User."""
 
+    counter_fields = ('recipes_count', 'subscribers_count')
+
     username = models.CharField(
         verbose_name='Логин',
         max_length=settings.LIMIT_CHAR_150,
@@ -30,6 +33,16 @@ class User(AbstractUser):
         max_length=settings.LIMIT_CHAR_150,
         blank=True
     )
+    recipes_count = models.PositiveIntegerField(
+        verbose_name='Количество рецептов',
+        default=0,
+        editable=False
+    )
+    subscribers_count = models.PositiveIntegerField(
+        verbose_name='Количество подписчиков',
+        default=0,
+        editable=False
+    )
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username', 'first_name', 'last_name']
 
@@ -0,0 +1,45 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from recipes import feed, user_state, versions
+from recipes.counters import change_counter
+
+from .models import Subscription, User
+
+
+@receiver(post_save, sender=Subscription)
+def increase_subscribers_count(sender, instance, created, **kwargs):
+    if created:
+        change_counter(User.objects.filter(pk=instance.author_id),
+                       'subscribers_count', 1)
+
+
+@receiver(post_delete, sender=Subscription)
+def decrease_subscribers_count(sender, instance, **kwargs):
+    change_counter(User.objects.filter(pk=instance.author_id),
+                   'subscribers_count', -1)
+    feed.check_fan_out_limit(instance.author_id)
+
+
+@receiver(post_save, sender=Subscription)
+@receiver(post_delete, sender=Subscription)
+def invalidate_user_state(sender, instance, **kwargs):
+    user_state.invalidate(instance.user_id)
+
+
+@receiver(post_save, sender=Subscription)
+def add_author_to_feed(sender, instance, created, **kwargs):
+    if created:
+        feed.subscribe(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Subscription)
+def remove_author_from_feed(sender, instance, **kwargs):
+    feed.unsubscribe(instance.user_id, instance.author_id)
+
+
+@receiver(post_save, sender=User)
+def touch_author_recipes(sender, instance, created, update_fields, **kwargs):
+    """Данные автора входят в ответы с его рецептами"""
+    if created or update_fields == frozenset({'last_login'}):
+        return
+    versions.touch(instance.recipes.all())